@@ -1,9 +1,88 @@
 from django.contrib import admin
-from .models import CustomUser, Campaign, Donation, Transaction, Comment
+from .models import (
+    CustomUser, Campaign, Donation, Transaction, Comment, PaymentEvent, BackgroundTask,
+    CampaignStats, CampaignDailyStats, CampaignHourlyStats, UserTransactionStats, IdempotencyKey,
+)
 
 
 admin.site.register(CustomUser)
-admin.site.register(Campaign)
-admin.site.register(Donation)
-admin.site.register(Transaction)
-admin.site.register(Comment)
+
+
+@admin.register(Campaign)
+class CampaignAdmin(admin.ModelAdmin):
+    list_display = ('title', 'creator', 'goal_amount', 'raised_amount', 'created_at')
+    list_select_related = ('creator',)
+    raw_id_fields = ('creator',)
+    search_fields = ('title',)
+
+
+@admin.register(Donation)
+class DonationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'campaign', 'amount', 'created_at')
+    list_select_related = ('user', 'campaign')
+    raw_id_fields = ('user', 'campaign')
+    readonly_fields = ('settled',)
+
+
+@admin.register(Transaction)
+class TransactionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'transaction_type', 'amount', 'status', 'created_at')
+    list_select_related = ('user',)
+    list_filter = ('transaction_type', 'status')
+    raw_id_fields = ('user', 'donation')
+
+
+@admin.register(CampaignStats)
+class CampaignStatsAdmin(admin.ModelAdmin):
+    list_display = ('campaign', 'total_amount', 'donor_count', 'min_amount', 'max_amount')
+    list_select_related = ('campaign',)
+    raw_id_fields = ('campaign',)
+
+
+@admin.register(CampaignDailyStats)
+class CampaignDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('campaign', 'day', 'total_amount', 'donation_count')
+    list_select_related = ('campaign',)
+    raw_id_fields = ('campaign',)
+
+
+@admin.register(CampaignHourlyStats)
+class CampaignHourlyStatsAdmin(admin.ModelAdmin):
+    list_display = ('campaign', 'hour', 'total_amount', 'donation_count')
+    list_select_related = ('campaign',)
+    raw_id_fields = ('campaign',)
+
+
+@admin.register(UserTransactionStats)
+class UserTransactionStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'transaction_type', 'status', 'total_amount', 'count')
+    list_select_related = ('user',)
+    list_filter = ('transaction_type', 'status')
+    raw_id_fields = ('user',)
+
+
+@admin.register(Comment)
+class CommentAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'campaign', 'created_at')
+    list_select_related = ('user', 'campaign')
+    raw_id_fields = ('user', 'campaign')
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ('reference', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status',)
+    search_fields = ('reference',)
+
+
+@admin.register(BackgroundTask)
+class BackgroundTaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'key', 'status', 'attempts', 'run_at')
+    list_filter = ('status', 'name')
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'status_code', 'created_at', 'expires_at')
+    search_fields = ('key',)
+    raw_id_fields = ('user',)
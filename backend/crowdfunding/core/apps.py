@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import authentication  # noqa: F401  Connects the user cache invalidation signals
+        from . import media  # noqa: F401  Connects the thumbnail signals, registers their task
+        from . import leaderboards  # noqa: F401  Connects the leaderboard update signals
+        from . import search  # noqa: F401  Connects the search index signals
+        from . import streams  # noqa: F401  Connects the new-comment stream signal
+        from . import tasks  # noqa: F401  Registers background tasks for workers
@@ -0,0 +1,99 @@
+import json
+import uuid
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from . import idempotency
+from .models import Campaign
+from .payments import REQUIRED_PAYMENT_FIELDS, CircuitOpenError, PayChanguService
+from .throttling import client_ip, rate_limit_wait, throttled_response
+
+
+def authenticate(request):
+    """Runs the configured DRF authenticators (including SessionAuthentication's CSRF check) on a plain Django request."""
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    return Request(request, authenticators=authenticators).user
+
+
+# -------------------------
+# Async payment initiation (serve via crowdfunding.asgi)
+# -------------------------
+@csrf_exempt  # SessionAuthentication enforces CSRF for cookie-authenticated requests
+@require_POST
+async def initiate_payment(request, pk):
+    """
+    Async counterpart of CampaignViewSet.initiate_payment.
+
+    Under ASGI the worker is released while PayChangu responds, so gateway latency
+    no longer ties up a worker per in-flight payment.
+    """
+    try:
+        user = await sync_to_async(authenticate)(request)
+    except APIException as e:
+        return JsonResponse({'detail': str(e.detail)}, status=e.status_code)
+    if not user or not user.is_authenticated:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    if not await Campaign.objects.filter(pk=pk).aexists():
+        return JsonResponse({'detail': 'No Campaign matches the given query.'}, status=404)
+
+    # Same buckets as the sync endpoint
+    wait = await sync_to_async(rate_limit_wait)(
+        'campaign.initiate_payment', {'user': user.pk, 'ip': client_ip(request), 'campaign': pk},
+    )
+    if wait:
+        return throttled_response(wait)
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+
+    # Same key store as the sync endpoint: retries are answered from the first attempt's outcome
+    key = request.headers.get(idempotency.HEADER)
+    if key is not None and idempotency.get_setting('ENABLED', True):
+        error = idempotency.invalid_key_error(key)
+        if error:
+            return JsonResponse({'error': error}, status=400)
+        duplicate = await sync_to_async(idempotency.begin)(
+            user.pk, key, idempotency.fingerprint(request.method, request.path, data),
+        )
+        if duplicate is not None:
+            status_code, body, headers = duplicate
+            return JsonResponse(body, status=status_code, headers=headers, safe=False)
+        try:
+            response = await initiate(pk, user, data)
+        except BaseException:
+            await sync_to_async(idempotency.release)(user.pk, key)
+            raise
+        await sync_to_async(idempotency.finish)(user.pk, key, response.status_code, json.loads(response.content))
+        return response
+    return await initiate(pk, user, data)
+
+
+async def initiate(pk, user, data):
+    """Validates `data` and asks PayChangu for a payment link."""
+    for field in REQUIRED_PAYMENT_FIELDS:
+        if field not in data:
+            return JsonResponse({'error': f'Missing field: {field}'}, status=400)
+
+    try:
+        response = await PayChanguService.ainitiate_payment(
+            amount=data['amount'],
+            currency=data['currency'],
+            phone_number=data['phone_number'],
+            email=data['email'],
+            callback_url=data['callback_url'],
+            tx_ref=uuid.uuid4().hex,
+            meta={'campaign_id': pk, 'user_id': user.pk},
+        )
+    except CircuitOpenError as e:
+        return JsonResponse({'error': str(e)}, status=503, headers={'Retry-After': str(e.retry_after)})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+    return JsonResponse(response, status=200)
@@ -0,0 +1,102 @@
+"""
+JWT authentication that resolves the token's user through a short-TTL cache.
+
+The default simplejwt backend loads the user row on every request. Here the
+validated token's user id is looked up in a per-process LRU (or a shared Redis,
+see settings.USER_CACHE) first; saving or deleting a user drops its entry, so
+password changes and deactivations apply immediately on this worker and within
+the TTL elsewhere when the cache is per-process.
+"""
+import copy
+import threading
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .cache import BACKENDS
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    """Returns the process-wide user cache configured by settings.USER_CACHE."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = {'TTL': 30, 'MAX_ENTRIES': 10_000, 'KEY_PREFIX': 'cf-user', **getattr(settings, 'USER_CACHE', {})}
+                config.pop('ENABLED', None)
+                backend = config.pop('BACKEND', 'locmem')
+                backend_class = BACKENDS.get(backend) or import_string(backend)
+                _cache = backend_class(**{k.lower(): v for k, v in config.items()})
+    return _cache
+
+
+def reset_user_cache():
+    """Drops the configured cache instance (used when settings change, e.g. in tests)."""
+    global _cache
+    _cache = None
+
+
+def user_cache_enabled():
+    return getattr(settings, 'USER_CACHE', {}).get('ENABLED', True)
+
+
+def get_cached_user(user_id):
+    """The user with `USER_ID_FIELD` == user_id, or None. Returns a copy callers may modify."""
+    key = f"user:{user_id}"
+    cache = get_user_cache() if user_cache_enabled() else None
+    user = cache.get(key) if cache else None
+    if user is None:
+        user = get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is None:
+            return None
+        if cache:
+            cache.set(key, user)
+    return copy.copy(user)
+
+
+def invalidate_cached_user(user_id):
+    if user_cache_enabled():
+        get_user_cache().delete(f"user:{user_id}")
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication with `get_user` served from the user cache; same checks as simplejwt."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+# SIGNAL: Drop a user's cache entry on save/delete, and again once the change commits
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_on_change(sender, instance, **kwargs):
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    invalidate_cached_user(user_id)
+    # A request may re-cache the old row before the transaction commits
+    transaction.on_commit(lambda: invalidate_cached_user(user_id))
@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def task(func):
+    """
+    Registers `func` as a background task and adds `func.enqueue(key=None, **kwargs)`.
+
+    Tasks take JSON-serializable keyword arguments and must be idempotent: they can
+    be retried, and enqueues sharing a `key` while one is pending run only once.
+    """
+    name = f"{func.__module__}.{func.__name__}"
+    _registry[name] = func
+    func.task_name = name
+    func.enqueue = lambda key=None, **kwargs: enqueue(name, key=key, **kwargs)
+    return func
+
+
+def get_task(name):
+    return _registry[name]
+
+
+def get_setting(name, default):
+    return getattr(settings, 'BACKGROUND_TASKS', {}).get(name, default)
+
+
+def enqueue(name, key=None, **kwargs):
+    """Schedules a registered task to run after the current transaction commits."""
+    executor = get_executor()
+    transaction.on_commit(lambda: executor.submit(name, key, kwargs))
+
+
+# -------------------------
+# Executors
+# -------------------------
+class ImmediateExecutor:
+    """Runs tasks inline once the transaction commits (tests, single-process setups)."""
+
+    def submit(self, name, key, kwargs):
+        try:
+            get_task(name)(**kwargs)
+        except Exception:
+            logger.exception("Background task %s failed", name)
+
+
+class ThreadExecutor:
+    """
+    Runs tasks on an in-process thread pool, for development.
+
+    Keys coalesce while a task is queued but not yet started, and failures are
+    retried in the same thread with exponential backoff.
+    """
+
+    def __init__(self, max_workers=4):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='background-task')
+        self.queued_keys = set()
+        self.lock = threading.Lock()
+
+    def submit(self, name, key, kwargs):
+        if key is not None:
+            with self.lock:
+                if key in self.queued_keys:
+                    return
+                self.queued_keys.add(key)
+        self.pool.submit(self._run, name, key, kwargs)
+
+    def _run(self, name, key, kwargs):
+        from django.db import close_old_connections
+
+        if key is not None:
+            with self.lock:
+                self.queued_keys.discard(key)
+
+        max_attempts = get_setting('MAX_ATTEMPTS', 5)
+        try:
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    get_task(name)(**kwargs)
+                    return
+                except Exception:
+                    logger.exception("Background task %s failed (attempt %s/%s)", name, attempt, max_attempts)
+                    time.sleep(retry_delay(attempt).total_seconds())
+        finally:
+            close_old_connections()
+
+
+class DatabaseExecutor:
+    """
+    Stores tasks in the BackgroundTask table for `manage.py run_tasks` workers.
+
+    A partial unique index on `key` among pending rows coalesces duplicate enqueues
+    into a single row.
+    """
+
+    def submit(self, name, key, kwargs):
+        BackgroundTask.objects.bulk_create(
+            [BackgroundTask(name=name, key=key, kwargs=kwargs)],
+            ignore_conflicts=key is not None,
+        )
+
+
+EXECUTORS = {
+    'immediate': ImmediateExecutor,
+    'thread': ThreadExecutor,
+    'database': DatabaseExecutor,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Returns the executor configured by BACKGROUND_TASKS['EXECUTOR']."""
+    global _executor
+    name = get_setting('EXECUTOR', 'database')
+    if _executor is None or _executor.name != name:
+        with _executor_lock:
+            if _executor is None or _executor.name != name:
+                executor = EXECUTORS[name]()
+                executor.name = name
+                _executor = executor
+    return _executor
+
+
+def retry_delay(attempt):
+    return timedelta(seconds=min(get_setting('RETRY_BACKOFF', 2) ** attempt, 300))
+
+
+# -------------------------
+# Database worker
+# -------------------------
+def run_pending_tasks(batch_size=100):
+    """
+    Claims and runs up to `batch_size` due tasks; returns how many were claimed.
+
+    Successful tasks are deleted, failed ones are rescheduled with exponential
+    backoff until MAX_ATTEMPTS, then kept with status 'failed'.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # Running tasks whose lease expired belong to a worker that died; claim them again
+        tasks = list(
+            BackgroundTask.objects.select_for_update(skip_locked=True)
+            .filter(status__in=['pending', 'running'], run_at__lte=now)
+            .order_by('run_at', 'id')[:batch_size]
+        )
+        lease = timedelta(seconds=get_setting('LEASE_SECONDS', 300))
+        BackgroundTask.objects.filter(pk__in=[t.pk for t in tasks]).update(status='running', run_at=now + lease)
+
+    for background_task in tasks:
+        try:
+            with transaction.atomic():
+                get_task(background_task.name)(**background_task.kwargs)
+        except Exception as e:
+            logger.exception("Background task %s failed", background_task.name)
+            _reschedule(background_task, e)
+        else:
+            background_task.delete()
+    return len(tasks)
+
+
+def _reschedule(background_task, error):
+    background_task.attempts += 1
+    background_task.last_error = repr(error)
+    if background_task.attempts >= get_setting('MAX_ATTEMPTS', 5):
+        background_task.status = 'failed'
+    else:
+        background_task.status = 'pending'
+        background_task.run_at = timezone.now() + retry_delay(background_task.attempts)
+    try:
+        with transaction.atomic():
+            background_task.save(update_fields=['attempts', 'last_error', 'status', 'run_at'])
+    except IntegrityError:
+        # A newer enqueue with the same key is already pending and will do the work
+        background_task.delete()
@@ -0,0 +1,336 @@
+"""
+API benchmark suite: synthetic data, endpoint scenarios and baseline comparison.
+
+Used by `manage.py benchmark_api` and the tests. Scenarios run either in-process
+through DRF's test client (which also counts queries per request) or over HTTP
+against a running server.
+"""
+import itertools
+import json
+import platform
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .counters import record_donations
+from .models import Campaign, Comment, Donation, Transaction
+from .rollups import apply_transactions
+from .search import get_search_backend
+
+SCALES = {
+    'tiny': {'users': 20, 'campaigns': 10, 'donations': 50, 'transactions': 100, 'comments': 50},
+    'small': {'users': 200, 'campaigns': 500, 'donations': 5_000, 'transactions': 10_000, 'comments': 2_000},
+    'medium': {'users': 2_000, 'campaigns': 5_000, 'donations': 100_000, 'transactions': 200_000, 'comments': 50_000},
+    'large': {'users': 20_000, 'campaigns': 50_000, 'donations': 1_000_000, 'transactions': 2_000_000, 'comments': 500_000},
+}
+
+WORDS = "water school clinic borehole books solar farm seeds bridge roads library nurses beds meals".split()
+
+# Untimed requests sent before each scenario
+WARMUP = 5
+
+# Settings the suite runs under: rate limits and admission control would answer its
+# bursts with 429/503, measuring rejections instead of the endpoints
+UNLIMITED_SETTINGS = {
+    'RATE_LIMITS': {'ENABLED': False},
+    'ADMISSION_CONTROL': {'MAX_CONCURRENT_REQUESTS': 0},
+}
+UNLIMITED_ENV = {'RATE_LIMITS_ENABLED': 'False', 'MAX_CONCURRENT_REQUESTS': '0'}
+
+# Lower is better for everything except throughput
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+class Dataset:
+    """Ids of seeded rows that scenarios pick from."""
+
+    def __init__(self, prefix, user_ids, campaign_ids, donor_ids):
+        self.prefix = prefix
+        self.user_ids = user_ids
+        self.campaign_ids = campaign_ids
+        self.donor_ids = donor_ids  # Users without donations, for donation_create
+        self.rng = random.Random(0)
+        self._free_pairs = itertools.product(donor_ids, campaign_ids)
+        self._lock = threading.Lock()
+
+    @property
+    def actor_id(self):
+        return self.user_ids[0]
+
+    def campaign(self):
+        return self.rng.choice(self.campaign_ids)
+
+    def free_pair(self):
+        """A (user, campaign) pair that hasn't donated yet."""
+        with self._lock:
+            pair = next(self._free_pairs, None)
+        if pair is None:
+            raise RuntimeError("Ran out of donor/campaign pairs for donation_create; seed more donors")
+        return pair
+
+
+def seed(scale, donations_needed=0, seed=0, batch_size=2000):
+    """
+    Creates users, campaigns, settled donations, transactions and comments.
+
+    `scale` is a dict with the keys of SCALES entries; `donations_needed` extra
+    donors-to-be are added for donation_create. Everything is owned by users named
+    `bench-<stamp>-*`, so `cleanup(dataset)` can remove it again.
+    """
+    rng = random.Random(seed)
+    prefix = f"bench-{time.time_ns()}"
+    User = get_user_model()
+    donor_pool = max(-(-donations_needed // max(scale['campaigns'], 1)), 1)
+
+    with transaction.atomic():
+        users = User.objects.bulk_create(
+            [User(username=f"{prefix}-{i}") for i in range(scale['users'] + donor_pool)], batch_size=batch_size
+        )
+        users, donors = users[:scale['users']], users[scale['users']:]
+        campaigns = Campaign.objects.bulk_create(
+            [
+                Campaign(
+                    title=' '.join(rng.choices(WORDS, k=3)).title(),
+                    description=' '.join(rng.choices(WORDS, k=30)),
+                    goal_amount=rng.randint(100, 100_000),
+                    creator=rng.choice(users),
+                )
+                for _ in range(scale['campaigns'])
+            ],
+            batch_size=batch_size,
+        )
+        get_search_backend().index(campaigns)
+
+        # Distinct (user, campaign) pairs, as each user donates once per campaign
+        pairs = itertools.islice(itertools.product(users, campaigns), scale['donations'])
+        for chunk in _chunks(pairs, batch_size):
+            record_donations(
+                [Donation(user=user, campaign=campaign, amount=rng.randint(1, 500)) for user, campaign in chunk],
+                batch_size=batch_size,
+            )
+
+        extra = max(scale['transactions'] - scale['donations'], 0)
+        for start in range(0, extra, batch_size):
+            apply_transactions(Transaction.objects.bulk_create([
+                Transaction(
+                    user=rng.choice(users), amount=rng.randint(1, 500),
+                    transaction_type=rng.choice(['donation', 'withdrawal']),
+                    status=rng.choice(['pending', 'completed', 'failed']),
+                )
+                for _ in range(min(batch_size, extra - start))
+            ]))
+
+        for start in range(0, scale['comments'], batch_size):
+            Comment.objects.bulk_create([
+                Comment(user=rng.choice(users), campaign=rng.choice(campaigns), text=' '.join(rng.choices(WORDS, k=12)))
+                for _ in range(min(batch_size, scale['comments'] - start))
+            ])
+
+    return Dataset(prefix, [u.pk for u in users], [c.pk for c in campaigns], [u.pk for u in donors])
+
+
+def cleanup(dataset):
+    """Deletes everything created by `seed`; cascades from the seeded users."""
+    get_user_model().objects.filter(username__startswith=f"{dataset.prefix}-").delete()
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+# -------------------------
+# Scenarios
+# -------------------------
+def _donation_payload(data):
+    user_id, campaign_id = data.free_pair()
+    return {'user': user_id, 'campaign': campaign_id, 'amount': '5.00'}, user_id
+
+
+SCENARIOS = {
+    # name: (method, path(data), payload(data) -> (body, acting user id) or None)
+    'campaign_list': ('GET', lambda data: '/api/v1/campaigns/', None),
+    'campaign_detail': ('GET', lambda data: f'/api/v1/campaigns/{data.campaign()}/', None),
+    'campaign_search': ('GET', lambda data: f'/api/v1/campaigns/search/?q={data.rng.choice(WORDS)[:4]}', None),
+    'donation_list': ('GET', lambda data: '/api/v1/donations/', None),
+    'donation_create': ('POST', lambda data: '/api/v1/donations/', _donation_payload),
+    'donation_summary': ('GET', lambda data: f'/api/v1/donations/summary/{data.campaign()}/', None),
+    'transaction_list': ('GET', lambda data: '/api/v1/transactions/', None),
+    'transaction_summary': ('GET', lambda data: '/api/v1/transactions/summary/', None),
+    'comment_list': ('GET', lambda data: f'/api/v1/comments/?campaign_id={data.campaign()}', None),
+}
+
+
+class InProcessDriver:
+    """Calls the API through DRF's test client in this process; counts queries."""
+    counts_queries = True
+
+    def __init__(self, data):
+        from rest_framework.test import APIClient
+
+        self.data = data
+        self.local = threading.local()
+        self.client_class = APIClient
+
+    def _client(self, user_id):
+        clients = self.local.__dict__.setdefault('clients', {})
+        if user_id not in clients:
+            client = self.client_class()
+            client.force_authenticate(get_user_model().objects.get(pk=user_id))
+            clients[user_id] = client
+        return clients[user_id]
+
+    def request(self, method, path, body, user_id):
+        client = self._client(user_id)
+        with CaptureQueriesContext(connections['default']) as queries:
+            if method == 'GET':
+                response = client.get(path)
+            else:
+                response = client.post(path, body, format='json')
+        return response.status_code, len(queries)
+
+    def close(self):
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+
+class HttpDriver:
+    """Calls a running server over HTTP with JWT auth; one connection pool per thread."""
+    counts_queries = False
+
+    def __init__(self, data, base_url):
+        import httpx
+
+        self.data = data
+        self.base_url = base_url.rstrip('/')
+        self.httpx = httpx
+        self.local = threading.local()
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+    def _token(self, user_id):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        with self.lock:
+            if user_id not in self.tokens:
+                self.tokens[user_id] = str(AccessToken.for_user(get_user_model().objects.get(pk=user_id)))
+            return self.tokens[user_id]
+
+    def request(self, method, path, body, user_id):
+        if not hasattr(self.local, 'client'):
+            self.local.client = self.httpx.Client(base_url=self.base_url, timeout=30)
+        response = self.local.client.request(
+            method, path, json=body, headers={'Authorization': f"Bearer {self._token(user_id)}"},
+        )
+        return response.status_code, None
+
+    def close(self):
+        if hasattr(self.local, 'client'):
+            self.local.client.close()
+
+
+def run_scenario(driver, name, requests=100, concurrency=1, warmup=WARMUP):
+    """Sends `requests` requests from `concurrency` threads and returns the metrics dict."""
+    method, path, payload = SCENARIOS[name]
+    data = driver.data
+
+    def call(_):
+        body, user_id = payload(data) if payload else (None, data.actor_id)
+        started = time.perf_counter()
+        status, queries = driver.request(method, path(data), body, user_id)
+        return time.perf_counter() - started, status, queries
+
+    for i in range(warmup):
+        call(i)
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        results = [call(i) for i in range(requests)]
+    else:
+        def worker(count):
+            try:
+                return [call(i) for i in range(count)]
+            finally:
+                driver.close()
+
+        shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = [result for batch in pool.map(worker, shares) for result in batch]
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency, _, _ in results)
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    queries = [q for _, _, q in results if q is not None]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, status, _ in results if status >= 400),
+        'throughput': round(len(results) / elapsed, 1),
+        'p50_ms': round(percentiles[49], 2),
+        'p95_ms': round(percentiles[94], 2),
+        'p99_ms': round(percentiles[98], 2),
+        'queries': max(queries) if queries else None,
+    }
+
+
+def run_suite(driver, scenarios=None, requests=100, concurrency=1):
+    """Runs the named scenarios (default: all) and returns a report dict."""
+    results = {}
+    for name in scenarios or SCENARIOS:
+        results[name] = run_scenario(driver, name, requests=requests, concurrency=concurrency)
+    return {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'driver': type(driver).__name__,
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'requests': requests,
+            'concurrency': concurrency,
+        },
+        'scenarios': results,
+    }
+
+
+# -------------------------
+# Baselines
+# -------------------------
+def compare(baseline, report, threshold=0.2, min_delta_ms=1.0):
+    """
+    Lists regressions of `report` against `baseline`.
+
+    Latency percentiles regress when they grow by more than `threshold` (a
+    fraction) and at least `min_delta_ms`; throughput when it drops by more than
+    `threshold`. Query counts are deterministic, so any increase is a regression,
+    as are new errors.
+    """
+    regressions = []
+    for name, current in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        for metric in LATENCY_METRICS:
+            if current[metric] > before[metric] * (1 + threshold) and current[metric] - before[metric] >= min_delta_ms:
+                regressions.append(f"{name}: {metric} {before[metric]} -> {current[metric]}")
+        if current['throughput'] < before['throughput'] * (1 - threshold):
+            regressions.append(f"{name}: throughput {before['throughput']} -> {current['throughput']}")
+        if None not in (current['queries'], before['queries']) and current['queries'] > before['queries']:
+            regressions.append(f"{name}: queries {before['queries']} -> {current['queries']}")
+        if current['errors'] > before['errors']:
+            regressions.append(f"{name}: errors {before['errors']} -> {current['errors']}")
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
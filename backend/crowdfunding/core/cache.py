@@ -0,0 +1,211 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.response import Response
+
+
+class LocMemResponseCache:
+    """
+    In-process LRU cache with a per-entry TTL.
+
+    Invalidation is per namespace: bumping a namespace's generation makes every
+    key built under the old generation unreachable, and those entries age out
+    through LRU eviction or TTL instead of being scanned and deleted. Generations
+    live in this process only, so writes made elsewhere (another worker, `run_tasks`)
+    reach it through the conditional GET validators in the key, or not until TTL.
+    """
+
+    def __init__(self, ttl=60, max_entries=1024, **kwargs):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def generation(self, namespace):
+        return self._generations.get(namespace, 0)
+
+    def invalidate(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._generations.clear()
+
+    def stats(self):
+        return {
+            'backend': 'locmem',
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._data),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+        }
+
+
+class RedisResponseCache:
+    """Shared cache for multi-worker deployments; works with any Redis-protocol server."""
+
+    def __init__(self, location='redis://localhost:6379/0', ttl=60, key_prefix='cf', **kwargs):
+        import redis  # Optional dependency, only needed when this backend is configured
+
+        self.client = redis.Redis.from_url(location)
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, namespace):
+        return int(self.client.get(f"{self.key_prefix}:gen:{namespace}") or 0)
+
+    def invalidate(self, namespace):
+        self.client.incr(f"{self.key_prefix}:gen:{namespace}")
+
+    def get(self, key):
+        raw = self.client.get(f"{self.key_prefix}:{key}")
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(raw)
+
+    def set(self, key, value):
+        self.client.set(f"{self.key_prefix}:{key}", pickle.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(f"{self.key_prefix}:{key}")
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.key_prefix}:*"):
+            self.client.delete(key)
+
+    def stats(self):
+        return {'backend': 'redis', 'hits': self.hits, 'misses': self.misses, 'ttl': self.ttl}
+
+
+BACKENDS = {
+    'locmem': LocMemResponseCache,
+    'redis': RedisResponseCache,
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Returns the process-wide response cache configured by settings.RESPONSE_CACHE."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = dict(getattr(settings, 'RESPONSE_CACHE', {}))
+                backend = config.pop('BACKEND', 'locmem')
+                backend_class = BACKENDS.get(backend) or import_string(backend)
+                _cache = backend_class(**{k.lower(): v for k, v in config.items()})
+    return _cache
+
+
+def reset_response_cache():
+    """Drops the configured cache instance (used when settings change, e.g. in tests)."""
+    global _cache
+    _cache = None
+
+
+def invalidate_namespace(namespace):
+    if getattr(settings, 'RESPONSE_CACHE', {}).get('ENABLED', True):
+        get_response_cache().invalidate(namespace)
+
+
+def comment_feed_namespace(campaign_id):
+    """Namespace of one campaign's cached comment feed, dropped whenever one of its comments changes."""
+    return f"comments:{campaign_id}"
+
+
+def make_cache_key(namespace, generation, request):
+    """
+    Key on the path plus sorted query params, so `?page=2&q=x` and `?q=x&page=2` share an entry.
+
+    A conditional GET validator computed for the request is part of the key too: the
+    database moves the key along even when a generation bump from another process
+    never reached this one.
+    """
+    params = sorted(request.query_params.lists())
+    source = getattr(request, 'validator_source', None)
+    digest = hashlib.sha1(f"{request.path}?{params}|{source}".encode()).hexdigest()
+    return f"{namespace}:{generation}:{digest}"
+
+
+def cache_response(namespace, shared=False):
+    """
+    Caches successful anonymous GET responses of a viewset handler.
+
+    The serialized `response.data` is stored, so a hit skips both the database and
+    the serializer. Apply it under `@action` (or to list/retrieve overrides) so
+    authentication and permission checks still run before the cache is consulted.
+
+    Entries are keyed on the URL alone, so authenticated requests bypass the cache
+    unless `shared` says the response is the same whoever asks.
+
+    `namespace` may also be a callable `(view, request, **kwargs)` returning the
+    namespace of this request, or None to leave the request uncached.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, request, *args, **kwargs):
+            if not getattr(settings, 'RESPONSE_CACHE', {}).get('ENABLED', True) or request.method != 'GET':
+                return func(self, request, *args, **kwargs)
+            if request.user.is_authenticated and not shared:
+                return func(self, request, *args, **kwargs)
+            request_namespace = namespace(self, request, **kwargs) if callable(namespace) else namespace
+            if request_namespace is None:
+                return func(self, request, *args, **kwargs)
+
+            cache = get_response_cache()
+            key = make_cache_key(request_namespace, cache.generation(request_namespace), request)
+            cached = cache.get(key)
+            if cached is not None:
+                status_code, data = cached
+                return Response(data, status=status_code, headers={'X-Cache': 'HIT'})
+
+            response = func(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, (response.status_code, response.data))
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,150 @@
+"""
+Conditional GET for read endpoints: ETag/Last-Modified validators and Cache-Control.
+
+A validator is a cheap query (a campaign's version column, or COUNT/MAX(updated_at)
+over the campaign list) that runs before the handler. When the client's
+If-None-Match or If-Modified-Since still matches, the view answers 304 without
+running the serializer, the response cache or the rest of its queries.
+"""
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from .models import Campaign, Comment
+
+
+def get_setting(name, default):
+    return getattr(settings, 'CONDITIONAL_GET', {}).get(name, default)
+
+
+def make_etag(request, source):
+    """Weak ETag over the validator, path, query params and response format."""
+    params = sorted(request.query_params.lists())
+    raw = f"{request.path}?{params}|{request.accepted_renderer.format}|{source}"
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()}"'
+
+
+def add_validators(request, response, etag, last_modified, private):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    if private or request.accepted_renderer.format == 'api':  # The browsable API shows the user
+        patch_cache_control(response, private=True, max_age=get_setting('MAX_AGE', 0))
+    else:
+        patch_cache_control(
+            response, public=True, max_age=get_setting('MAX_AGE', 0),
+            s_maxage=get_setting('SHARED_MAX_AGE', 0),
+            stale_while_revalidate=get_setting('STALE_WHILE_REVALIDATE', 0),
+        )
+    patch_vary_headers(response, ['Accept', 'Authorization'] if private else ['Accept'])
+
+
+def conditional(validator, private=False):
+    """
+    Adds validators to a viewset handler's GET responses and answers 304 when they
+    still match. `validator(view, request, **kwargs)` returns `(source, last_modified)`;
+    `source` is any string that changes whenever the response would, or None to
+    skip (e.g. for a missing object). `last_modified` may be None.
+
+    Apply it under `@action` (or to list/retrieve overrides) so authentication and
+    permission checks run first; `private` responses are for the requesting user only.
+    Stack it above `@cache_response`, which keys its entries on the validator so a
+    cached body never goes out under a newer ETag.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, request, *args, **kwargs):
+            if not get_setting('ENABLED', True) or request.method not in ('GET', 'HEAD'):
+                return func(self, request, *args, **kwargs)
+
+            source, last_modified = validator(self, request, **kwargs)
+            if source is None:
+                return func(self, request, *args, **kwargs)
+            request.validator_source = source  # Part of the response-cache key
+            etag = make_etag(request, source)
+            not_modified = get_conditional_response(
+                request._request, etag=etag,
+                last_modified=int(last_modified.timestamp()) if last_modified else None,
+            )
+            response = not_modified or func(self, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                add_validators(request, response, etag, last_modified, private)
+            return response
+        return wrapper
+    return decorator
+
+
+# -------------------------
+# Validators
+# -------------------------
+def _version(campaign_id):
+    try:
+        return Campaign.objects.filter(pk=campaign_id).values_list('version', 'updated_at').first()
+    except (TypeError, ValueError):
+        return None  # Not a valid id, the handler answers 404
+
+
+def _thread_version(comment_id):
+    try:
+        return Comment.objects.filter(pk=comment_id).values_list('campaign__version', 'campaign__updated_at').first()
+    except (TypeError, ValueError):
+        return None
+
+
+def _version_source(row):
+    if row is None:
+        return None, None
+    version, updated_at = row
+    return f"{version}.{updated_at.isoformat()}", updated_at
+
+
+def campaign_validator(view, request, pk=None, **kwargs):
+    return _version_source(_version(pk))
+
+
+def campaign_list_validator(view, request, **kwargs):
+    row = Campaign.objects.aggregate(count=Count('id'), changed=Max('updated_at'))
+    changed = row['changed']
+    return f"{row['count']}.{changed.isoformat() if changed else ''}", changed
+
+
+def comment_validator(view, request, pk=None, **kwargs):
+    try:
+        updated_at = Comment.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    except (TypeError, ValueError):
+        updated_at = None
+    return (updated_at.isoformat(), updated_at) if updated_at else (None, None)
+
+
+def comment_feed_validator(view, request, **kwargs):
+    """
+    A campaign's feed follows the campaign version, which every comment change bumps.
+    The unfiltered feed has no cheap validator and is served without one.
+    """
+    campaign_id = request.query_params.get('campaign_id')
+    if campaign_id:
+        return campaign_validator(view, request, pk=campaign_id)
+    parent_id = request.query_params.get('parent')
+    if parent_id:
+        return _version_source(_thread_version(parent_id))
+    return None, None
+
+
+def comment_thread_validator(view, request, pk=None, **kwargs):
+    """A thread follows the version of the comment's campaign, like the feed."""
+    return _version_source(_thread_version(pk))
+
+
+def donation_summary_validator(view, request, campaign_id=None, **kwargs):
+    # The daily window moves at midnight without a write, so no Last-Modified
+    source, _ = campaign_validator(view, request, pk=campaign_id)
+    return (f"{source}.{timezone.localdate()}" if source else None), None
+
+
+def timeseries_validator(view, request, pk=None, **kwargs):
+    # Default ranges end at the current hour/day, which moves without a write
+    source, _ = campaign_validator(view, request, pk=pk)
+    return (f"{source}.{timezone.now():%Y-%m-%dT%H}" if source else None), None
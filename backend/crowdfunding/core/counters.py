@@ -0,0 +1,192 @@
+import random
+from collections import defaultdict
+from decimal import Decimal
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from . import leaderboards
+from .cache import invalidate_namespace
+from .models import Campaign, CampaignCounterShard, Donation, Transaction
+from .rollups import apply_donations, apply_transactions
+from .streams import publish_progress
+
+
+def get_shard_count():
+    """Number of counter shards per campaign (1 disables sharding)."""
+    return max(int(getattr(settings, 'CAMPAIGN_COUNTER_SHARDS', 1)), 1)
+
+
+def touch_campaigns(campaign_ids):
+    """
+    Bumps `version` and `updated_at` of campaigns whose visible data changed
+    without a save() (totals, rollups, comments), so conditional GETs see the change.
+    """
+    campaign_ids = list(campaign_ids)
+    if campaign_ids:
+        Campaign.objects.filter(pk__in=campaign_ids).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+def increment_raised_amount(campaign_id, amount):
+    """
+    Atomically add `amount` to a campaign's raised total.
+
+    With a single shard this is one `UPDATE ... SET raised_amount = raised_amount + x`
+    on the campaign row, which also bumps its version. With N shards the increment
+    lands on a random shard row so concurrent donations to the same campaign don't
+    queue on one row lock; the campaign row, and so its version, is left alone
+    (apply_raised_deltas touches it once per batch).
+    """
+    shards = get_shard_count()
+    if shards <= 1:
+        Campaign.objects.filter(pk=campaign_id).update(
+            raised_amount=F('raised_amount') + amount, version=F('version') + 1, updated_at=timezone.now(),
+        )
+        return
+
+    shard = random.randrange(shards)
+    updated = CampaignCounterShard.objects.filter(campaign_id=campaign_id, shard=shard).update(
+        amount=F('amount') + amount
+    )
+    if updated:
+        return
+
+    try:
+        with transaction.atomic():
+            CampaignCounterShard.objects.create(campaign_id=campaign_id, shard=shard, amount=amount)
+    except IntegrityError:
+        # Another writer created the shard first, fall back to incrementing it.
+        CampaignCounterShard.objects.filter(campaign_id=campaign_id, shard=shard).update(
+            amount=F('amount') + amount
+        )
+
+
+def apply_raised_deltas(deltas):
+    """
+    Apply a {campaign_id: amount} mapping, one increment per campaign. With shards
+    the campaigns' versions are bumped here, in one UPDATE for the whole batch.
+    """
+    changed = [campaign_id for campaign_id, amount in deltas.items() if amount]
+    for campaign_id in changed:
+        increment_raised_amount(campaign_id, deltas[campaign_id])
+    if get_shard_count() > 1:
+        touch_campaigns(changed)
+
+
+def record_donations(donations, references=None, batch_size=1000):
+    """
+    Bulk counterpart of creating donations one by one.
+
+    Inserts the donations already settled and settles them in the same
+    transaction (see `settle_donations`). `references` optionally gives each
+    donation's provider reference for its transaction. A `created_at` set on a
+    donation (e.g. an imported one) is kept. Must run inside a transaction.
+    """
+    dates = [donation.created_at for donation in donations]
+    for donation in donations:
+        donation.settled = True
+    donations = Donation.objects.bulk_create(donations, batch_size=batch_size)
+
+    # auto_now_add overwrote created_at on insert; restore the dates we were given
+    dated = []
+    for donation, created_at in zip(donations, dates):
+        if created_at is not None:
+            donation.created_at = created_at
+            dated.append(donation)
+    Donation.objects.bulk_update(dated, ['created_at'], batch_size=batch_size)
+
+    settle_donations(donations, references, batch_size=batch_size)
+    return donations
+
+
+def settle_donations(donations, references=None, batch_size=1000):
+    """
+    Writes the completed Transaction rows for `donations` with `bulk_create` and
+    applies one raised_amount increment per campaign, however many donations there
+    are, then adds both to the rollup tables. Callers are responsible for flagging
+    the donations as settled.
+    """
+    references = references or [None] * len(donations)
+    transactions = Transaction.objects.bulk_create(
+        [
+            Transaction(
+                user_id=donation.user_id,
+                donation=donation,
+                amount=donation.amount,
+                transaction_type="donation",
+                status="completed",
+                reference=reference,
+            )
+            for donation, reference in zip(donations, references)
+        ],
+        batch_size=batch_size,
+    )
+
+    deltas = defaultdict(Decimal)
+    for donation in donations:
+        deltas[donation.campaign_id] += Decimal(donation.amount)
+    apply_raised_deltas(deltas)
+    apply_donations(donations)
+    apply_transactions(transactions)
+
+    transaction.on_commit(lambda: invalidate_namespace('campaigns'))
+    publish_progress(deltas)
+    leaderboards.record_donations(donations)
+
+
+def fold_shards(campaign_ids=None):
+    """Move accumulated shard amounts into Campaign.raised_amount and clear the shards."""
+    shards = CampaignCounterShard.objects.all()
+    if campaign_ids is not None:
+        shards = shards.filter(campaign_id__in=campaign_ids)
+
+    with transaction.atomic():
+        # Lock the shard rows first; FOR UPDATE can't be combined with GROUP BY.
+        list(shards.select_for_update().values_list('pk', flat=True))
+        totals = shards.values('campaign_id').annotate(total=Sum('amount'))
+        for row in totals:
+            Campaign.objects.filter(pk=row['campaign_id']).update(
+                raised_amount=F('raised_amount') + row['total']
+            )
+        shards.delete()
+
+
+def reconcile_raised_amounts(campaign_ids=None, batch_size=500):
+    """
+    Rebuild Campaign.raised_amount from the Donation table.
+
+    Totals are computed with a single grouped aggregate and written back with
+    `bulk_update`, so reconciling every campaign costs a handful of queries rather
+    than one aggregate per campaign. Returns the number of campaigns whose stored
+    total was corrected.
+    """
+    campaigns = Campaign.objects.all()
+    shards = CampaignCounterShard.objects.all()
+    donations = Donation.objects.filter(settled=True)  # Unsettled ones are added by their pending task
+    if campaign_ids is not None:
+        campaigns = campaigns.filter(pk__in=campaign_ids)
+        shards = shards.filter(campaign_id__in=campaign_ids)
+        donations = donations.filter(campaign_id__in=campaign_ids)
+
+    with transaction.atomic():
+        # Lock counters before reading donations so in-flight increments wait for us.
+        campaigns = list(campaigns.select_for_update().only('id', 'raised_amount'))
+        list(shards.select_for_update().values_list('pk', flat=True))
+
+        totals = dict(donations.values_list('campaign_id').annotate(total=Sum('amount')))
+        shard_totals = dict(shards.values_list('campaign_id').annotate(total=Sum('amount')))
+
+        changed = []
+        for campaign in campaigns:
+            expected = totals.get(campaign.id) or Decimal('0.00')
+            if campaign.raised_amount != expected or campaign.id in shard_totals:
+                campaign.raised_amount = expected
+                changed.append(campaign)
+
+        Campaign.objects.bulk_update(changed, ['raised_amount'], batch_size=batch_size)
+        shards.delete()
+        touch_campaigns([campaign.id for campaign in changed])
+        publish_progress([campaign.id for campaign in changed])
+        leaderboards.record_campaign_change([campaign.id for campaign in changed])
+
+    return len(changed)
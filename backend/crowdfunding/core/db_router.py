@@ -0,0 +1,142 @@
+"""
+Read-replica routing.
+
+Viewsets opt actions into replica reads with `ReplicaReadMixin.replica_actions`;
+every other query goes to the primary. A user who has just written is pinned to
+the primary for REPLICA_STICKY_SECONDS so they read their own writes despite
+replication lag, and a replica that fails its connection check is skipped for
+REPLICA_RETRY_SECONDS.
+"""
+import contextvars
+import random
+import threading
+import time
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.module_loading import import_string
+from .cache import BACKENDS
+
+_request = contextvars.ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """Per-request routing flags, set by ReplicaReadMixin."""
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+# -------------------------
+# Health checks
+# -------------------------
+_down_until = {}
+
+
+def replica_available(alias):
+    """Connects if needed; a failing replica is skipped for REPLICA_RETRY_SECONDS."""
+    if _down_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        _down_until[alias] = time.monotonic() + get_setting('REPLICA_RETRY_SECONDS', 30)
+        return False
+    return True
+
+
+# -------------------------
+# Read-your-writes stickiness
+# -------------------------
+_sticky_cache = None
+_sticky_lock = threading.Lock()
+
+
+def get_sticky_cache():
+    """Users who wrote recently; per-process by default, set REPLICA_STICKY_CACHE to share it."""
+    global _sticky_cache
+    if _sticky_cache is None:
+        with _sticky_lock:
+            if _sticky_cache is None:
+                config = {
+                    'TTL': get_setting('REPLICA_STICKY_SECONDS', 5), 'KEY_PREFIX': 'cf-sticky',
+                    **get_setting('REPLICA_STICKY_CACHE', {}),
+                }
+                backend = config.pop('BACKEND', 'locmem')
+                backend_class = BACKENDS.get(backend) or import_string(backend)
+                _sticky_cache = backend_class(**{k.lower(): v for k, v in config.items()})
+    return _sticky_cache
+
+
+def reset_sticky_cache():
+    global _sticky_cache
+    _sticky_cache = None
+
+
+def mark_recent_write(user_id):
+    get_sticky_cache().set(f"wrote:{user_id}", True)
+
+
+def wrote_recently(user_id):
+    return get_sticky_cache().get(f"wrote:{user_id}") is not None
+
+
+# -------------------------
+# Router and viewset mixin
+# -------------------------
+class ReplicaRouter:
+    """Sends reads of replica-enabled requests to a healthy replica, everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        state = _request.get()
+        if state is None or not state.use_replica or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS  # Reads inside a transaction must see its writes
+        available = [alias for alias in replica_aliases() if replica_available(alias)]
+        return random.choice(available) if available else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Replicas hold the same data as the primary
+
+
+class ReplicaReadMixin:
+    """
+    Routes the reads of `replica_actions` to replicas, unless the user wrote in
+    the last REPLICA_STICKY_SECONDS. Any write during a request starts that window.
+    """
+    replica_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)  # Authenticates on the primary
+        user_id = request.user.pk if request.user.is_authenticated else None
+        use_replica = (
+            self.action in self.replica_actions
+            and bool(replica_aliases())
+            and not (user_id and wrote_recently(user_id))
+        )
+        self._routing_token = _request.set(RoutingState(use_replica))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_routing_token', None)
+        if token is not None:
+            state = _request.get()
+            _request.reset(token)
+            self._routing_token = None
+            if state.wrote and request.user.is_authenticated:
+                mark_recent_write(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
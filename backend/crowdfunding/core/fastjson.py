@@ -0,0 +1,49 @@
+"""
+orjson-backed renderer and parser for DRF (enabled by FAST_JSON, see settings).
+
+orjson encodes dicts, lists, strings, numbers, datetimes and UUIDs in C; anything
+else (Decimal, lazy translations, querysets...) goes through DRF's own
+JSONEncoder, so the output matches DRF's JSONRenderer.
+"""
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_fallback = JSONEncoder()
+
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    return _fallback.default(obj)
+
+
+def dumps(data, indent=False):
+    return orjson.dumps(data, default=_default, option=OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None  # JSON is always UTF-8
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        indent = bool(renderer_context.get('indent'))
+        if accepted_media_type:
+            indent = indent or 'indent' in accepted_media_type  # e.g. "application/json; indent=4"
+        return dumps(data, indent=indent)
+
+
+class ORJSONParser(BaseParser):
+    media_type = 'application/json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,153 @@
+"""
+Idempotency keys for money-moving POSTs.
+
+A client that sends an `Idempotency-Key` header may retry the request safely: the
+first request claims the key (an in-flight IdempotencyKey row) and records its
+response when done. A retry with the same key is then answered from that row in
+one indexed lookup (user, key), without running the serializer, signals or the
+payment gateway again, and marked `Idempotent-Replayed: true`. A retry arriving
+while the original is still running gets 409 with Retry-After; the same key sent
+with a different body gets 422.
+
+Server errors (5xx) and exceptions release the key so the client can retry. Keys
+expire after IDEMPOTENCY['TTL_SECONDS']; expired rows are swept now and then as
+new keys are claimed, and an in-flight claim older than IN_FLIGHT_SECONDS (its
+worker died) may be taken over.
+"""
+import hashlib
+import json
+import random
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def get_setting(name, default):
+    return getattr(settings, 'IDEMPOTENCY', {}).get(name, default)
+
+
+def fingerprint(method, path, data):
+    """SHA-256 over the request's method, path and parsed body."""
+    if hasattr(data, 'lists'):
+        data = sorted(data.lists())  # QueryDict from form posts
+    raw = json.dumps([method, path, data], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def invalid_key_error(key):
+    """An error message for a malformed header value, or None."""
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters."
+    return None
+
+
+# -------------------------
+# Key store
+# -------------------------
+def _lookup(user_id, key, now):
+    return (
+        IdempotencyKey.objects.filter(user_id=user_id, key=key, expires_at__gt=now)
+        .values_list('fingerprint', 'status_code', 'response', 'created_at')
+        .first()
+    )
+
+
+def _claim(user_id, key, request_fingerprint, now):
+    """Records `key` as in flight; False if another live request holds it."""
+    expires_at = now + timedelta(seconds=get_setting('TTL_SECONDS', 86400))
+    if random.random() < get_setting('PURGE_PROBABILITY', 0.01):
+        IdempotencyKey.objects.filter(expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                user_id=user_id, key=key, fingerprint=request_fingerprint, created_at=now, expires_at=expires_at,
+            )
+        return True
+    except IntegrityError:
+        # Take the key over if it expired or its request was abandoned mid-flight
+        stale = now - timedelta(seconds=get_setting('IN_FLIGHT_SECONDS', 60))
+        return bool(
+            IdempotencyKey.objects.filter(user_id=user_id, key=key)
+            .filter(Q(expires_at__lte=now) | Q(status_code__isnull=True, created_at__lt=stale))
+            .update(fingerprint=request_fingerprint, status_code=None, response=None,
+                    created_at=now, expires_at=expires_at)
+        )
+
+
+def begin(user_id, key, request_fingerprint):
+    """
+    Claims `key` for a new request and returns None, or returns the
+    (status, data, headers) a duplicate request must be answered with.
+    """
+    now = timezone.now()
+    record = _lookup(user_id, key, now)
+    stale = now - timedelta(seconds=get_setting('IN_FLIGHT_SECONDS', 60))
+    if record is None or (record[1] is None and record[3] < stale):
+        if _claim(user_id, key, request_fingerprint, now):
+            return None
+        record = _lookup(user_id, key, now)
+        if record is None:  # Released meanwhile; let the client try again
+            record = (request_fingerprint, None, None, now)
+
+    stored_fingerprint, status_code, response, _ = record
+    if stored_fingerprint != request_fingerprint:
+        return 422, {'error': f'This {HEADER} was already used with a different request.'}, {}
+    if status_code is None:
+        return 409, {'error': f'A request with this {HEADER} is still in progress.'}, {'Retry-After': '1'}
+    return status_code, response, {'Idempotent-Replayed': 'true'}
+
+
+def finish(user_id, key, status_code, data):
+    """Stores the response of a claimed key, or releases the key after a server error."""
+    if status_code >= 500:
+        release(user_id, key)
+        return
+    IdempotencyKey.objects.filter(user_id=user_id, key=key).update(status_code=status_code, response=data)
+
+
+def release(user_id, key):
+    IdempotencyKey.objects.filter(user_id=user_id, key=key, status_code__isnull=True).delete()
+
+
+# -------------------------
+# Decorator
+# -------------------------
+def idempotent(func):
+    """
+    Makes a viewset POST handler answer retries carrying the same Idempotency-Key
+    from the stored outcome of the first request. Requests without the header are
+    handled as usual.
+
+    Apply it under `@action` (or to a create override) so authentication,
+    permission checks and rate limits run first.
+    """
+    @wraps(func)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None or not get_setting('ENABLED', True) or not request.user.is_authenticated:
+            return func(self, request, *args, **kwargs)
+        error = invalid_key_error(key)
+        if error:
+            return Response({'error': error}, status=400)
+
+        user_id = request.user.pk
+        duplicate = begin(user_id, key, fingerprint(request.method, request.path, request.data))
+        if duplicate is not None:
+            status_code, data, headers = duplicate
+            return Response(data, status=status_code, headers=headers)
+        try:
+            response = func(self, request, *args, **kwargs)
+        except BaseException:
+            release(user_id, key)
+            raise
+        finish(user_id, key, response.status_code, response.data)
+        return response
+    return wrapper
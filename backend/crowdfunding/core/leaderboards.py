@@ -0,0 +1,383 @@
+"""
+Campaign leaderboards kept in sorted sets, updated by the donation write path.
+
+Boards (highest score first):
+  most-funded      campaign -> total raised
+  closest-to-goal  campaign -> raised / goal, while under the goal
+  trending         campaign -> donations decayed by half every TRENDING_HALF_LIFE_HOURS
+  donors:<id>      user -> amount given to campaign <id>
+
+Trending uses forward decay: a donation made at t adds amount * 2^((t - epoch) / half-life),
+so existing scores never need rewriting and comparing them ranks campaigns by their
+decayed donation velocity at any moment. Reads are top-K slices: O(K) in process,
+O(log N + K) on Redis.
+
+With the 'locmem' store each process keeps its own boards and misses donations settled
+by other processes (e.g. `run_tasks`), so boards are rebuilt from the database every
+REBUILD_SECONDS. The 'redis' store shares one set of boards between all processes.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from .models import Campaign, Donation
+
+logger = logging.getLogger(__name__)
+
+MOST_FUNDED = 'most-funded'
+CLOSEST_TO_GOAL = 'closest-to-goal'
+TRENDING = 'trending'
+
+# Donations older than this many half-lives weigh under 1/256 and are left out of rebuilds
+TRENDING_WINDOW_HALF_LIVES = 8
+
+# Rebuild (and move the trending epoch) well before 2^x overflows a float
+MAX_EPOCH_HALF_LIVES = 512
+
+
+def get_setting(name, default):
+    return getattr(settings, 'LEADERBOARDS', {}).get(name, default)
+
+
+def donors_board(campaign_id):
+    return f"donors:{campaign_id}"
+
+
+# -------------------------
+# Sorted set stores
+# -------------------------
+class SortedSet:
+    """Members ordered by score; updates are a bisect plus a list insert, top-K is a slice."""
+
+    def __init__(self, scores=None):
+        self.scores = dict(scores or {})
+        self.order = sorted((-score, member) for member, score in self.scores.items())
+
+    def set(self, member, score):
+        old = self.scores.get(member)
+        if old is not None:
+            del self.order[bisect_left(self.order, (-old, member))]
+        self.scores[member] = score
+        insort(self.order, (-score, member))
+
+    def incr(self, member, amount):
+        self.set(member, self.scores.get(member, 0.0) + amount)
+
+    def remove(self, member):
+        old = self.scores.pop(member, None)
+        if old is not None:
+            del self.order[bisect_left(self.order, (-old, member))]
+
+    def top(self, k):
+        return [(member, -score) for score, member in self.order[:k]]
+
+
+class LocMemSortedSets:
+    """Per-process sorted sets."""
+
+    def __init__(self, **kwargs):
+        self.sets = defaultdict(SortedSet)
+        self.meta = {}
+        self.lock = threading.Lock()
+
+    def incr(self, key, member, amount):
+        with self.lock:
+            self.sets[key].incr(member, amount)
+
+    def set(self, key, member, score):
+        with self.lock:
+            self.sets[key].set(member, score)
+
+    def remove(self, key, member):
+        with self.lock:
+            if key in self.sets:
+                self.sets[key].remove(member)
+
+    def top(self, key, k):
+        with self.lock:
+            return self.sets[key].top(k) if key in self.sets else []
+
+    def replace(self, key, scores):
+        board = SortedSet(scores)  # Built outside the lock
+        with self.lock:
+            self.sets[key] = board
+
+    def delete(self, key):
+        with self.lock:
+            self.sets.pop(key, None)
+
+    def get_meta(self, name):
+        return self.meta.get(name)
+
+    def set_meta(self, name, value):
+        self.meta[name] = value
+
+
+class RedisSortedSets:
+    """Sorted sets shared by every process; works with any Redis-protocol server."""
+
+    def __init__(self, location='redis://localhost:6379/0', key_prefix='cf-board', **kwargs):
+        import redis  # Optional dependency, only needed when this backend is configured
+
+        self.client = redis.Redis.from_url(location)
+        self.key_prefix = key_prefix
+
+    def _key(self, key):
+        return f"{self.key_prefix}:{key}"
+
+    def incr(self, key, member, amount):
+        self.client.zincrby(self._key(key), amount, member)
+
+    def set(self, key, member, score):
+        self.client.zadd(self._key(key), {member: score})
+
+    def remove(self, key, member):
+        self.client.zrem(self._key(key), member)
+
+    def top(self, key, k):
+        return [(int(member), score) for member, score in self.client.zrevrange(self._key(key), 0, k - 1, withscores=True)]
+
+    def replace(self, key, scores):
+        with self.client.pipeline() as pipe:  # MULTI/EXEC: readers see the old or the new board
+            pipe.delete(self._key(key))
+            if scores:
+                pipe.zadd(self._key(key), scores)
+            pipe.execute()
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def get_meta(self, name):
+        value = self.client.get(self._key(f"meta:{name}"))
+        return float(value) if value is not None else None
+
+    def set_meta(self, name, value):
+        self.client.set(self._key(f"meta:{name}"), value)
+
+
+BACKENDS = {
+    'locmem': LocMemSortedSets,
+    'redis': RedisSortedSets,
+}
+
+_store = None
+_store_lock = threading.Lock()
+_rebuild_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the process-wide sorted set store configured by settings.LEADERBOARDS."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = get_setting('BACKEND', 'locmem')
+                backend_class = BACKENDS.get(backend) or import_string(backend)
+                _store = backend_class(
+                    location=get_setting('LOCATION', 'redis://localhost:6379/0'),
+                    key_prefix=get_setting('KEY_PREFIX', 'cf-board'),
+                )
+    return _store
+
+
+def reset_store():
+    """Drops the configured store (used when settings change, e.g. in tests)."""
+    global _store
+    _store = None
+
+
+def leaderboards_enabled():
+    return get_setting('ENABLED', True)
+
+
+# -------------------------
+# Scores
+# -------------------------
+def half_life_seconds():
+    return get_setting('TRENDING_HALF_LIFE_HOURS', 24) * 3600
+
+
+def decayed(amount, timestamp, epoch):
+    """Forward-decayed weight of `amount` given at `timestamp` (seconds)."""
+    return float(amount) * 2 ** ((timestamp - epoch) / half_life_seconds())
+
+
+def campaign_scores(total, goal):
+    """(most-funded, closest-to-goal) scores; None leaves the campaign off that board."""
+    funded = float(total) if total > 0 else None
+    progress = float(total / goal) if total > 0 and goal > 0 and total < goal else None
+    return funded, progress
+
+
+def _set_or_remove(store, key, member, score):
+    if score is None:
+        store.remove(key, member)
+    else:
+        store.set(key, member, score)
+
+
+def refresh_campaigns(campaign_ids):
+    """Re-reads the totals and goals of `campaign_ids` into the most-funded and closest-to-goal boards."""
+    store = get_store()
+    rows = Campaign.objects.with_raised_totals().filter(pk__in=campaign_ids).values_list(
+        'pk', 'raised_amount', 'shard_total', 'goal_amount',
+    )
+    found = set()
+    for pk, raised, shard_total, goal in rows:
+        found.add(pk)
+        funded, progress = campaign_scores(raised + shard_total, goal)
+        _set_or_remove(store, MOST_FUNDED, pk, funded)
+        _set_or_remove(store, CLOSEST_TO_GOAL, pk, progress)
+    for pk in set(campaign_ids) - found:
+        remove_campaign(pk)
+
+
+def remove_campaign(campaign_id):
+    store = get_store()
+    for key in (MOST_FUNDED, CLOSEST_TO_GOAL, TRENDING):
+        store.remove(key, campaign_id)
+    store.delete(donors_board(campaign_id))
+
+
+# -------------------------
+# Write path
+# -------------------------
+def _apply_donations(rows):
+    try:
+        store = get_store()
+        epoch = store.get_meta('epoch')
+        for campaign_id, user_id, amount, created_at in rows:
+            if epoch is not None:  # Otherwise trending is built from the database on first read
+                store.incr(TRENDING, campaign_id, decayed(amount, created_at.timestamp(), epoch))
+            store.incr(donors_board(campaign_id), user_id, float(amount))
+        refresh_campaigns({campaign_id for campaign_id, _, _, _ in rows})
+    except Exception:
+        # The donations have committed; the next rebuild corrects the boards
+        logger.exception("Could not update leaderboards")
+
+
+def record_donations(donations):
+    """Adds settled `donations` to the boards once the current transaction commits."""
+    if not leaderboards_enabled() or not donations:
+        return
+    rows = [(d.campaign_id, d.user_id, d.amount, d.created_at) for d in donations]
+    transaction.on_commit(lambda: _apply_donations(rows))
+
+
+def record_campaign_change(campaign_ids):
+    """Re-scores campaigns whose totals changed outside `record_donations` (e.g. reconciliation)."""
+    campaign_ids = list(campaign_ids)
+    if leaderboards_enabled() and campaign_ids:
+        transaction.on_commit(lambda: refresh_campaigns(campaign_ids))
+
+
+# SIGNAL: A new goal moves a campaign on closest-to-goal; deleted campaigns leave every board
+@receiver(post_save, sender=Campaign)
+def rescore_campaign(sender, instance, created, **kwargs):
+    if not created:
+        record_campaign_change([instance.pk])
+
+
+@receiver(post_delete, sender=Campaign)
+def remove_deleted_campaign(sender, instance, **kwargs):
+    if leaderboards_enabled():
+        transaction.on_commit(lambda: remove_campaign(instance.pk))
+
+
+# SIGNAL: An edited or deleted donation changes its donor's total and the campaign's board
+@receiver(post_save, sender=Donation)
+@receiver(post_delete, sender=Donation)
+def rescore_donation(sender, instance, created=False, **kwargs):
+    if instance.settled and not created and leaderboards_enabled():
+        def update():
+            get_store().delete(donors_board(instance.campaign_id))  # Rebuilt on next read
+            get_store().set_meta(f"built:{donors_board(instance.campaign_id)}", 0)
+            refresh_campaigns([instance.campaign_id])
+        transaction.on_commit(update)
+
+
+# -------------------------
+# Rebuilds
+# -------------------------
+def rebuild(store=None):
+    """Rebuilds the campaign boards from the database and moves the trending epoch to now."""
+    store = store or get_store()
+    now = time.time()
+    funded, progress = {}, {}
+    rows = Campaign.objects.with_raised_totals().values_list('pk', 'raised_amount', 'shard_total', 'goal_amount')
+    for pk, raised, shard_total, goal in rows.iterator(chunk_size=2000):
+        funded_score, progress_score = campaign_scores(raised + shard_total, goal)
+        if funded_score is not None:
+            funded[pk] = funded_score
+        if progress_score is not None:
+            progress[pk] = progress_score
+
+    trending = defaultdict(float)
+    since = datetime.fromtimestamp(now - TRENDING_WINDOW_HALF_LIVES * half_life_seconds(), tz=dt_timezone.utc)
+    donations = Donation.objects.filter(settled=True, created_at__gte=since)
+    for campaign_id, amount, created_at in donations.values_list('campaign_id', 'amount', 'created_at').iterator(chunk_size=2000):
+        trending[campaign_id] += decayed(amount, created_at.timestamp(), now)
+
+    store.replace(MOST_FUNDED, funded)
+    store.replace(CLOSEST_TO_GOAL, progress)
+    store.replace(TRENDING, trending)
+    store.set_meta('epoch', now)
+    store.set_meta('built_at', now)
+
+
+def rebuild_donors(campaign_id, store=None):
+    store = store or get_store()
+    totals = (
+        Donation.objects.filter(campaign_id=campaign_id, settled=True)
+        .values_list('user_id').annotate(total=Sum('amount')).order_by()
+    )
+    store.replace(donors_board(campaign_id), {user_id: float(total) for user_id, total in totals})
+    store.set_meta(f"built:{donors_board(campaign_id)}", time.time())
+
+
+def _stale(built_at, now):
+    max_age = get_setting('REBUILD_SECONDS', 300)
+    return not built_at or (max_age and now - built_at > max_age)
+
+
+def _ensure_built(meta_name, build):
+    store = get_store()
+    now = time.time()
+    built_at = store.get_meta(meta_name)
+    epoch = store.get_meta('epoch') if meta_name == 'built_at' else None
+    too_old = epoch is not None and now - epoch > MAX_EPOCH_HALF_LIVES * half_life_seconds()
+    if not _stale(built_at, now) and not too_old:
+        return store
+    with _rebuild_lock:
+        if store.get_meta(meta_name) == built_at:  # Not rebuilt by another thread meanwhile
+            build(store=store)
+    return store
+
+
+# -------------------------
+# Reads
+# -------------------------
+def top(board, k):
+    """The top `k` (campaign id, score) pairs of MOST_FUNDED, CLOSEST_TO_GOAL or TRENDING."""
+    store = _ensure_built('built_at', rebuild)
+    ranked = store.top(board, k)
+    if board == TRENDING:
+        # Scores are relative to the epoch; express them as decayed amounts as of now
+        scale = 2 ** ((store.get_meta('epoch') - time.time()) / half_life_seconds())
+        ranked = [(member, score * scale) for member, score in ranked]
+    return ranked
+
+
+def top_donors(campaign_id, k):
+    """The top `k` (user id, total donated) pairs of a campaign."""
+    board = donors_board(campaign_id)
+    store = _ensure_built(f"built:{board}", lambda store: rebuild_donors(campaign_id, store=store))
+    return store.top(board, k)
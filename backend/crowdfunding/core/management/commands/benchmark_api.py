@@ -0,0 +1,111 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from core import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic data, benchmark the API in-process or over HTTP and compare against a JSON baseline. "
+        "Seeded rows are deleted afterwards unless --keep-data is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=benchmarks.SCALES, default='small')
+        for name in benchmarks.SCALES['small']:
+            parser.add_argument(f'--{name}', type=int, help=f"Override the number of seeded {name}.")
+        parser.add_argument('--scenarios', nargs='+', choices=benchmarks.SCENARIOS, help="Default: all.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=1, help="Client threads.")
+        parser.add_argument(
+            '--url', help="Benchmark a running server at this base URL instead of in-process "
+                          "(start it with RATE_LIMITS_ENABLED=False and MAX_CONCURRENT_REQUESTS=0).",
+        )
+        parser.add_argument('--serve', action='store_true', help="Start `runserver` on a free port and benchmark it over HTTP.")
+        parser.add_argument('--baseline', help="Compare with this JSON baseline and fail on regressions.")
+        parser.add_argument('--save-baseline', help="Write the report as a JSON baseline to this path.")
+        parser.add_argument('--threshold', type=float, default=0.2, help="Allowed relative slowdown (default 0.2 = 20%%).")
+        parser.add_argument('--keep-data', action='store_true')
+
+    def handle(self, *args, **options):
+        scale = {
+            name: options[name] if options[name] is not None else default
+            for name, default in benchmarks.SCALES[options['scale']].items()
+        }
+        self.stdout.write(f"Seeding {', '.join(f'{count} {name}' for name, count in scale.items())}...")
+        started = time.perf_counter()
+        data = benchmarks.seed(scale, donations_needed=options['requests'] + benchmarks.WARMUP)
+        self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+        server = None
+        try:
+            if options['serve']:
+                server, url = self._start_server()
+            else:
+                url = options['url']
+            driver = benchmarks.HttpDriver(data, url) if url else benchmarks.InProcessDriver(data)
+            # The in-process test client sends Host: testserver
+            allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+            with override_settings(ALLOWED_HOSTS=allowed_hosts, **benchmarks.UNLIMITED_SETTINGS):
+                report = benchmarks.run_suite(
+                    driver, options['scenarios'], requests=options['requests'], concurrency=options['concurrency'],
+                )
+            driver.close()
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+            if not options['keep_data']:
+                benchmarks.cleanup(data)
+
+        report['meta']['scale'] = scale
+        self._print(report)
+
+        if options['save_baseline']:
+            benchmarks.save_baseline(report, options['save_baseline'])
+            self.stdout.write(f"Baseline written to {options['save_baseline']}")
+
+        if options['baseline']:
+            baseline = benchmarks.load_baseline(options['baseline'])
+            for key in ('driver', 'database', 'concurrency', 'scale'):
+                if baseline['meta'].get(key) != report['meta'][key]:
+                    self.stderr.write(self.style.WARNING(
+                        f"Baseline {key} {baseline['meta'].get(key)!r} differs from this run's {report['meta'][key]!r}."
+                    ))
+            regressions = benchmarks.compare(baseline, report, options['threshold'])
+            if regressions:
+                raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def _print(self, report):
+        self.stdout.write(
+            f"{'scenario':<20} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}"
+        )
+        for name, m in report['scenarios'].items():
+            queries = '-' if m['queries'] is None else m['queries']
+            self.stdout.write(
+                f"{name:<20} {m['throughput']:>8} {m['p50_ms']:>8} {m['p95_ms']:>8} {m['p99_ms']:>8} {queries:>8} {m['errors']:>7}"
+            )
+
+    def _start_server(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        server = subprocess.Popen(
+            [sys.executable, sys.argv[0], 'runserver', f'127.0.0.1:{port}', '--noreload', '--nothreading'],
+            env={**os.environ, **benchmarks.UNLIMITED_ENV, 'ALLOWED_HOSTS': '127.0.0.1'}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+                return server, f'http://127.0.0.1:{port}'
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError("runserver did not start within 30s")
@@ -0,0 +1,79 @@
+import itertools
+import random
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from core.models import Campaign
+from core.search import BACKENDS, tokenize
+
+SYLLABLES = "ba be bi bo bu ka ke ki ko ku la le li lo lu ma me mi mo mu na ne ni no nu ta te ti to tu wa zi".split()
+
+
+class Command(BaseCommand):
+    help = "Compare campaign search latency across index backends at several table sizes (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--backends', nargs='+', default=None, help="Defaults to the native index, python and icontains.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Zipf-distributed vocabulary so term frequencies look like real prose
+        self.vocabulary = sorted({''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(30_000)})
+        rng.shuffle(self.vocabulary)
+        self.cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(self.vocabulary) + 1)))
+        native = {'sqlite': 'sqlite_fts', 'postgresql': 'postgres'}.get(connection.vendor)
+        names = options['backends'] or [name for name in (native, 'python', 'icontains') if name]
+        queries = [self._query(rng) for _ in range(options['queries'])]
+
+        self.stdout.write(f"{'rows':>10} {'backend':>12} {'mean ms':>10} {'p95 ms':>10}")
+        with transaction.atomic():
+            creator = get_user_model().objects.create(username=f"bench-{time.time_ns()}")
+            seeded = 0
+            for size in sorted(options['sizes']):
+                self._seed(creator, size - seeded, rng)
+                seeded = size
+                for name in names:
+                    backend = BACKENDS[name]()
+                    backend.rebuild()
+                    timings = self._run(backend, queries)
+                    self.stdout.write(
+                        f"{size:>10} {name:>12} {statistics.fmean(timings):>10.2f} "
+                        f"{statistics.quantiles(timings, n=20)[-1]:>10.2f}"
+                    )
+            transaction.set_rollback(True)
+
+    def _query(self, rng):
+        # Mid-frequency words, the last one truncated like a typeahead prefix
+        words = rng.sample(self.vocabulary[50:5000], rng.choice([1, 2]))
+        words[-1] = words[-1][:max(len(words[-1]) - 1, 3)]
+        return ' '.join(words)
+
+    def _words(self, rng, k):
+        return ' '.join(rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=k))
+
+    def _seed(self, creator, count, rng, batch_size=5000):
+        for start in range(0, count, batch_size):
+            Campaign.objects.bulk_create([
+                Campaign(
+                    title=self._words(rng, 4),
+                    description=self._words(rng, 60),
+                    goal_amount=1000,
+                    creator=creator,
+                )
+                for _ in range(min(batch_size, count - start))
+            ])
+
+    def _run(self, backend, queries):
+        timings = []
+        for query in queries:
+            terms = tokenize(query)
+            started = time.perf_counter()
+            backend.count(terms)
+            backend.search(terms, limit=10)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
@@ -0,0 +1,84 @@
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from core.fastjson import ORJSONRenderer
+from core.models import Campaign, CustomUser, Transaction
+from core.serializers import CampaignListSerializer, TransactionListSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Time serializing and rendering one page of campaigns and transactions, comparing DRF's "
+        "per-field serializers and JSONRenderer with the compiled list path and orjson. No database access."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000, help="Rows per page.")
+        parser.add_argument('--repeat', type=int, default=30)
+
+    def handle(self, *args, **options):
+        pages = {
+            'campaigns': (CampaignListSerializer, self._campaigns(options['items'])),
+            'transactions': (TransactionListSerializer, self._transactions(options['items'])),
+        }
+        renderers = {'json': JSONRenderer(), 'orjson': ORJSONRenderer()}
+
+        self.stdout.write(f"{'page':<13} {'serializer':<10} {'renderer':<8} {'serialize ms':>13} {'render ms':>10} {'total ms':>9}")
+        for page, (serializer_class, rows) in pages.items():
+            baseline = None
+            for path in ('drf', 'compiled'):
+                for renderer_name, renderer in renderers.items():
+                    serialize, render, body = self._time(serializer_class, path, renderer, rows, options['repeat'])
+                    if baseline is None:
+                        baseline, expected = serialize + render, body
+                    elif body != expected:
+                        self.stderr.write(f"{page}: {path}/{renderer_name} output differs from drf/json")
+                    self.stdout.write(
+                        f"{page:<13} {path:<10} {renderer_name:<8} {serialize:>13.2f} {render:>10.2f} "
+                        f"{serialize + render:>9.2f}  ({baseline / (serialize + render):.1f}x)"
+                    )
+
+    def _time(self, serializer_class, path, renderer, rows, repeat):
+        serialize_times, render_times = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            if path == 'drf':
+                data = serializers.ListSerializer(rows, child=serializer_class()).data
+            else:
+                data = serializer_class(rows, many=True).data
+            rendered = time.perf_counter()
+            body = renderer.render(data)
+            finished = time.perf_counter()
+            serialize_times.append((rendered - started) * 1000)
+            render_times.append((finished - rendered) * 1000)
+        return statistics.median(serialize_times), statistics.median(render_times), body
+
+    def _campaigns(self, count):
+        now = timezone.now()
+        creator = CustomUser(pk=1, username='bench-creator')
+        campaigns = []
+        for i in range(count):
+            campaign = Campaign(
+                pk=i + 1, title=f"Borehole for village {i}", goal_amount=Decimal('25000.00'),
+                raised_amount=Decimal(i * 7 % 25000) + Decimal('0.50'), created_at=now - timedelta(minutes=i),
+                creator=creator,
+            )
+            campaign.shard_total = Decimal('0.00')
+            campaigns.append(campaign)
+        return campaigns
+
+    def _transactions(self, count):
+        now = timezone.now()
+        return [
+            Transaction(
+                pk=i + 1, user_id=1, donation_id=i + 1 if i % 2 else None, amount=Decimal(i % 500) + Decimal('0.25'),
+                transaction_type='donation' if i % 3 else 'withdrawal', status='completed',
+                created_at=now - timedelta(seconds=i * 37),
+            )
+            for i in range(count)
+        ]
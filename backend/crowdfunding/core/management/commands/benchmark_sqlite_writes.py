@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+CONFIGS = {
+    'default': {'SQLITE_TUNING': 'False', 'DATABASE_WRITE_QUEUE': 'False'},
+    'tuned': {'SQLITE_TUNING': 'True', 'DATABASE_WRITE_QUEUE': 'False'},
+    'tuned+queue': {'SQLITE_TUNING': 'True', 'DATABASE_WRITE_QUEUE': 'True'},
+}
+
+# Each worker thread donates as its own block of users (one donation per user and campaign)
+MAX_WORKERS = 64
+USERS_PER_WORKER = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent donations/sec through POST /api/v1/donations/ on a scratch SQLite file, "
+        "with and without the SQLite tuning mode and write queue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', nargs='+', type=int, default=[1, 4, 16])
+        parser.add_argument('--threads-per-process', type=int, default=4, help="Like gunicorn gthread workers.")
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--campaigns', type=int, default=4, help="Few campaigns, so writers contend.")
+        parser.add_argument('--configs', nargs='+', choices=CONFIGS, default=list(CONFIGS))
+        # Internal: the role a subprocess plays
+        parser.add_argument('--stage', choices=['seed', 'run'], help=argparse.SUPPRESS)
+        parser.add_argument('--first-user', type=int, default=0, help=argparse.SUPPRESS)
+        parser.add_argument('--threads', type=int, default=1, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['stage'] == 'seed':
+            return self._seed(options)
+        if options['stage'] == 'run':
+            return self._run(options)
+        if max(options['workers']) > MAX_WORKERS:
+            raise CommandError(f"At most {MAX_WORKERS} workers")
+
+        workdir = tempfile.mkdtemp(prefix='sqlite-bench-')
+        try:
+            template = os.path.join(workdir, 'template.sqlite3')
+            self._manage(template, {}, 'migrate', '-v0')
+            self._manage(template, {}, 'benchmark_sqlite_writes', '--stage', 'seed', '--campaigns', str(options['campaigns']))
+
+            self.stdout.write(f"{'config':<12} {'workers':>7} {'processes':>9} {'donations/s':>12} {'errors':>7}")
+            for config in options['configs']:
+                for workers in options['workers']:
+                    database = os.path.join(workdir, f'{config}-{workers}.sqlite3')
+                    shutil.copy(template, database)
+                    rate, errors, processes = self._measure(database, CONFIGS[config], workers, options)
+                    self.stdout.write(f"{config:<12} {workers:>7} {processes:>9} {rate:>12.0f} {errors:>7}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _manage(self, database, env, *args, **popen):
+        environment = {**os.environ, 'DATABASE_NAME': database, **env}
+        environment.pop('DATABASE_URL', None)
+        environment.pop('DATABASE_REPLICA_URLS', None)
+        command = [sys.executable, sys.argv[0], *args]
+        if popen:
+            return subprocess.Popen(command, env=environment, **popen)
+        subprocess.run(command, env=environment, check=True)
+
+    def _measure(self, database, env, workers, options):
+        per_process = min(options['threads_per_process'], workers)
+        processes = -(-workers // per_process)
+        children = [
+            self._manage(
+                database, env, 'benchmark_sqlite_writes', '--stage', 'run',
+                '--threads', str(min(per_process, workers - i * per_process)),
+                '--first-user', str(i * per_process), '--seconds', str(options['seconds']),
+                stdout=subprocess.PIPE,
+            )
+            for i in range(processes)
+        ]
+        results = []
+        for child in children:
+            output, _ = child.communicate()
+            if child.returncode:
+                raise CommandError(f"Benchmark worker failed with exit code {child.returncode}")
+            results.append(json.loads(output.decode().strip().splitlines()[-1]))
+        created = sum(r['created'] for r in results)
+        return created / options['seconds'], sum(r['errors'] for r in results), processes
+
+    def _seed(self, options):
+        from django.contrib.auth import get_user_model
+        from core.models import Campaign
+
+        User = get_user_model()
+        owner = User.objects.create(username='bench-owner')
+        Campaign.objects.bulk_create([
+            Campaign(title=f'Bench {i}', description='', goal_amount=10 ** 6, creator=owner)
+            for i in range(options['campaigns'])
+        ])
+        User.objects.bulk_create(
+            [User(username=f'bench-{i}') for i in range(MAX_WORKERS * USERS_PER_WORKER)], batch_size=5000,
+        )
+
+    def _run(self, options):
+        from django.test.utils import override_settings
+        from rest_framework.test import APIClient
+        from django.contrib.auth import get_user_model
+        from core.models import Campaign
+
+        User = get_user_model()
+        campaigns = list(Campaign.objects.values_list('pk', flat=True))
+        first_pk = User.objects.get(username='bench-0').pk
+        counts = {'created': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['seconds']
+        start = threading.Barrier(options['threads'])
+
+        def worker(index):
+            from django.db import connection
+
+            client = APIClient()
+            client.raise_request_exception = False
+            created = errors = 0
+            user_pk = first_pk + (options['first_user'] + index) * USERS_PER_WORKER
+            start.wait()
+            while time.monotonic() < deadline:
+                user = User(pk=user_pk)
+                client.force_authenticate(user)
+                for campaign in campaigns:
+                    response = client.post(
+                        '/api/v1/donations/', {'user': user_pk, 'campaign': campaign, 'amount': '5.00'}, format='json',
+                    )
+                    if response.status_code == 201:
+                        created += 1
+                    else:
+                        errors += 1
+                user_pk += 1
+            connection.close()
+            with lock:
+                counts['created'] += created
+                counts['errors'] += errors
+
+        with override_settings(ALLOWED_HOSTS=['testserver'], RESPONSE_CACHE={'ENABLED': False}):
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(json.dumps(counts))
@@ -0,0 +1,73 @@
+import math
+import time
+import tracemalloc
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import Campaign, Transaction
+from core.transfer import EXPORTERS, import_donations
+
+
+class Command(BaseCommand):
+    help = "Measure streaming export memory and chunked import throughput (all data is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--export-rows', type=int, default=1_000_000)
+        parser.add_argument('--import-rows', type=int, default=100_000)
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stamp = time.time_ns()
+            side = math.isqrt(max(options['import_rows'] - 1, 0)) + 1
+            users = get_user_model().objects.bulk_create(
+                [get_user_model()(username=f"bench-{stamp}-{i}") for i in range(side)]
+            )
+            campaigns = Campaign.objects.bulk_create(
+                [Campaign(title=f"Bench {i}", description='', goal_amount=1000, creator=users[0]) for i in range(side)]
+            )
+
+            self._seed_transactions(users[0], options['export_rows'])
+            for fmt in ('csv', 'ndjson'):
+                self._benchmark_export(fmt, Transaction.objects.filter(user=users[0]))
+
+            self._benchmark_import(users, campaigns, options['import_rows'], options['chunk_size'])
+            transaction.set_rollback(True)
+
+    def _seed_transactions(self, user, count, batch_size=10_000):
+        started = time.perf_counter()
+        for start in range(0, count, batch_size):
+            Transaction.objects.bulk_create(
+                [Transaction(user=user, amount=5, status='completed') for _ in range(min(batch_size, count - start))]
+            )
+        self.stdout.write(f"seeded {count} transactions in {time.perf_counter() - started:.1f}s")
+
+    def _benchmark_export(self, fmt, queryset):
+        tracemalloc.start()
+        started = time.perf_counter()
+        rows = size = 0
+        for chunk in EXPORTERS[fmt](queryset):
+            rows += 1
+            size += len(chunk)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f"export {fmt:>6}: {rows} lines, {size / 2 ** 20:.0f} MiB in {elapsed:.1f}s "
+            f"({rows / elapsed:,.0f} rows/s, traced), peak Python memory {peak / 2 ** 20:.1f} MiB"
+        )
+
+    def _benchmark_import(self, users, campaigns, count, chunk_size):
+        def lines():
+            yield "user,campaign,amount\n"
+            for i in range(count):
+                user, campaign = users[i // len(campaigns)], campaigns[i % len(campaigns)]
+                yield f"{user.pk},{campaign.pk},{(i % 50) + 1}.00\n"
+
+        started = time.perf_counter()
+        report = import_donations(lines(), 'csv', chunk_size=chunk_size)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"import   csv: {report.imported} rows ({report.failed} failed) in {elapsed:.1f}s, "
+            f"{report.imported / elapsed:,.0f} rows/s"
+        )
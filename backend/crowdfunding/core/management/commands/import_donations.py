@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.transfer import import_donations, text_lines
+
+
+class Command(BaseCommand):
+    help = "Import donations (e.g. offline pledges) from a CSV or NDJSON file in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default=None, help="Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if fmt not in ('csv', 'ndjson'):
+            raise CommandError("Cannot infer the format, pass --format csv|ndjson.")
+
+        with open(options['path'], 'rb') as stream:
+            report = import_donations(text_lines(stream), fmt, chunk_size=options['chunk_size'])
+
+        for error in report.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report.imported}, skipped {report.skipped} already imported, {report.failed} failed."
+        ))
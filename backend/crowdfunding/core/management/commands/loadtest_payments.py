@@ -0,0 +1,78 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from core.payments import CircuitBreaker, PayChanguClient
+from core.paychangu_stub import StubPayChanguServer
+
+PAYMENT = {
+    'amount': 100, 'currency': 'MWK', 'phone_number': '0999000000',
+    'email': 'donor@example.com', 'callback_url': 'http://localhost/callback',
+}
+
+
+class Command(BaseCommand):
+    help = "Compare blocking (WSGI-style) and async (ASGI-style) payment initiation against a slow stub gateway."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.25, help="Simulated gateway latency in seconds.")
+        parser.add_argument('--workers', type=int, default=8, help="Sync worker threads (like WSGI workers).")
+        parser.add_argument('--concurrency', type=int, default=20, help="In-flight requests on the single async worker.")
+
+    def handle(self, *args, **options):
+        with StubPayChanguServer(latency=options['latency']) as stub:
+            self._report('sync', options['workers'], *self._run_sync(stub.url, options))
+            self._report('async', 1, *self._run_async(stub.url, options))
+
+    def _client(self, url, max_concurrency):
+        return PayChanguClient(
+            base_url=url, secret_key='loadtest', max_connections=max_concurrency,
+            max_concurrency=max_concurrency, max_retries=0, breaker=CircuitBreaker(failure_threshold=10 ** 9),
+        )
+
+    def _run_sync(self, url, options):
+        client = self._client(url, options['workers'])
+        latencies, errors = [], []
+
+        def call(_):
+            started = time.perf_counter()
+            if 'error' in client.initiate_payment(**PAYMENT):
+                errors.append(1)
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            list(pool.map(call, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+        client.close()
+        # Every sync worker is blocked for the whole gateway round trip
+        return elapsed, latencies, len(errors), sum(latencies)
+
+    def _run_async(self, url, options):
+        client = self._client(url, options['concurrency'])
+        latencies, errors = [], []
+
+        async def call():
+            started = time.perf_counter()
+            if 'error' in await client.ainitiate_payment(**PAYMENT):
+                errors.append(1)
+            latencies.append(time.perf_counter() - started)
+
+        async def main():
+            await asyncio.gather(*(call() for _ in range(options['requests'])))
+
+        started = time.perf_counter()
+        busy_started = time.process_time()
+        asyncio.run(main())
+        # The async worker is only busy while it runs Python code, not while it awaits the gateway
+        return time.perf_counter() - started, latencies, len(errors), time.process_time() - busy_started
+
+    def _report(self, mode, workers, elapsed, latencies, errors, busy):
+        latencies.sort()
+        self.stdout.write(
+            f"{mode:>5}: workers={workers} requests={len(latencies)} errors={errors} throughput={len(latencies) / elapsed:.1f}/s "
+            f"p50={statistics.median(latencies) * 1000:.0f}ms p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f}ms "
+            f"worker utilization={busy / (elapsed * workers):.0%} (blocked or busy)"
+        )
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from core.webhooks import process_payment_events
+
+
+class Command(BaseCommand):
+    help = "Settle queued PayChangu webhook events in batches (runs until stopped unless --once)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_payment_events(batch_size=options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} payment event(s).")
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
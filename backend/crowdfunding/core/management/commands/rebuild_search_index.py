@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from core.search import BACKENDS, get_search_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the campaign search index from the campaign table, e.g. after bulk writes that skip "
+        "the save signals. The python backend lives in each process and rebuilds itself on start."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=sorted(BACKENDS), help="Defaults to CAMPAIGN_SEARCH_BACKEND.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(options['backend'])
+        backend.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the {type(backend).__name__} search index."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from core.cache import invalidate_namespace
+from core.rollups import rebuild_campaign_stats, rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the campaign donation and user transaction rollup tables from source rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--campaign', type=int, action='append', dest='campaign_ids', help="Limit to this campaign (repeatable).")
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help="Limit to this user (repeatable).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        campaign_ids, user_ids = options['campaign_ids'], options['user_ids']
+        scoped = campaign_ids is not None or user_ids is not None
+
+        if campaign_ids is not None or not scoped:
+            campaigns = rebuild_campaign_stats(campaign_ids, batch_size=options['batch_size'])
+            invalidate_namespace('campaigns')
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt donation stats for {campaigns} campaign(s)."))
+        if user_ids is not None or not scoped:
+            rows = rebuild_user_stats(user_ids, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} user transaction stats row(s)."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from core.cache import invalidate_namespace
+from core.counters import fold_shards, reconcile_raised_amounts
+
+
+class Command(BaseCommand):
+    help = "Rebuild Campaign.raised_amount from Donation rows (or just fold counter shards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_ids', nargs='*', type=int, help="Limit to these campaigns (default: all).")
+        parser.add_argument('--fold-only', action='store_true', help="Fold counter shards without re-aggregating donations.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        campaign_ids = options['campaign_ids'] or None
+
+        if options['fold_only']:
+            fold_shards(campaign_ids)
+            invalidate_namespace('campaigns')
+            self.stdout.write(self.style.SUCCESS("Folded counter shards into campaign totals."))
+            return
+
+        changed = reconcile_raised_amounts(campaign_ids, batch_size=options['batch_size'])
+        invalidate_namespace('campaigns')
+        self.stdout.write(self.style.SUCCESS(f"Reconciled totals, {changed} campaign(s) corrected."))
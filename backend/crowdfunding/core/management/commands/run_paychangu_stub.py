@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from core.paychangu_stub import StubPayChanguServer
+
+
+class Command(BaseCommand):
+    help = "Run a local stub of the PayChangu API (point PAYCHANGU_BASE_URL at it)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.0, help="Seconds to wait before each response.")
+        parser.add_argument('--failure-rate', type=float, default=0.0, help="Fraction of requests answered with --failure-status.")
+        parser.add_argument('--failure-status', type=int, default=503)
+
+    def handle(self, *args, **options):
+        server = StubPayChanguServer(
+            port=options['port'],
+            latency=options['latency'],
+            failure_rate=options['failure_rate'],
+            failure_status=options['failure_status'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Stub PayChangu listening on {server.url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
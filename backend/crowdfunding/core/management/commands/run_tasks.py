@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from core.background import run_pending_tasks
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks (runs until stopped unless --once)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=0.5, help="Seconds to sleep when no task is due.")
+        parser.add_argument('--once', action='store_true', help="Run the due tasks once and exit.")
+
+    def handle(self, *args, **options):
+        while True:
+            claimed = run_pending_tasks(batch_size=options['batch_size'])
+            if options['once'] and claimed < options['batch_size']:
+                break
+            if not claimed:
+                time.sleep(options['interval'])
@@ -0,0 +1,128 @@
+"""
+Thumbnails for profile pictures and campaign cover images.
+
+Once a row with a new image is saved, a background task renders the sizes listed
+in MEDIA_PIPELINE['THUMBNAILS'] for that field in a process pool (decoding and
+resampling are CPU bound and would hold the GIL in a thread) and records the
+stored names in the row's `<field>_thumbnails` column. List serializers read that
+column, so they send thumbnail URLs without touching storage; an image without
+thumbnails yet simply has none listed.
+
+Thumbnail names derive from the original's content hash and the size, so the same
+picture is rendered once however many rows use it.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .background import task
+from .cache import invalidate_namespace
+from .images import render_thumbnails
+from .storage import get_image_storage, get_setting
+
+# Image fields run through the pipeline, with the column holding their thumbnails
+IMAGE_FIELDS = {
+    'core.CustomUser': ('profile_picture',),
+    'core.Campaign': ('cover_image',),
+}
+
+
+def thumbnail_sizes(field_name):
+    return get_setting('THUMBNAILS', {}).get(field_name, {})
+
+
+def thumbnail_name(source_name, size):
+    """Stored name of `source_name`'s thumbnail at `size` (width, height)."""
+    directory, filename = os.path.split(source_name)
+    digest = os.path.splitext(filename)[0]
+    extension = 'webp' if get_setting('THUMBNAIL_FORMAT', 'WEBP') == 'WEBP' else 'jpg'
+    return os.path.join(directory, 'thumbs', f"{digest}-{size[0]}x{size[1]}.{extension}")
+
+
+def expected_thumbnails(field_name, source_name):
+    return {label: thumbnail_name(source_name, size) for label, size in thumbnail_sizes(field_name).items()}
+
+
+def thumbnail_urls(thumbnails):
+    """{label: URL} for a `<field>_thumbnails` value."""
+    storage = get_image_storage()
+    return {label: storage.url(name) for label, name in thumbnails.items()}
+
+
+# -------------------------
+# Rendering
+# -------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The process-wide thumbnail pool, or None to render inline (THUMBNAIL_PROCESSES = 0)."""
+    global _pool
+    processes = get_setting('THUMBNAIL_PROCESSES', 2)
+    if _pool is None and processes:
+        with _pool_lock:
+            if _pool is None:
+                # Spawned workers only import core.images: no inherited locks, sockets or connections
+                _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def make_thumbnails(field_name, source_name):
+    """Renders and stores the missing thumbnails of `source_name`; returns {label: stored name}."""
+    backend = get_image_storage().backend
+    expected = expected_thumbnails(field_name, source_name)
+    sizes = {label: size for label, size in thumbnail_sizes(field_name).items() if not backend.exists(expected[label])}
+    if sizes:
+        try:
+            source = backend.path(source_name)  # Workers read local files themselves
+        except NotImplementedError:
+            with backend.open(source_name) as f:
+                source = f.read()
+        args = (source, sizes, get_setting('THUMBNAIL_FORMAT', 'WEBP'), get_setting('THUMBNAIL_QUALITY', 80))
+        pool = get_pool()
+        rendered = pool.submit(render_thumbnails, *args).result() if pool else render_thumbnails(*args)
+        for label, data in rendered.items():
+            backend.save(expected[label], ContentFile(data))
+    return expected
+
+
+@task
+def generate_thumbnails(model, pk, field):
+    """Renders the thumbnails of one row's image and records them unless the image changed meanwhile."""
+    model_class = apps.get_model(model)
+    source_name = model_class.objects.filter(pk=pk).values_list(field, flat=True).first()
+    if not source_name:
+        return
+    updates = {f"{field}_thumbnails": make_thumbnails(field, source_name)}
+    if any(f.name == 'updated_at' for f in model_class._meta.concrete_fields):
+        updates['updated_at'] = timezone.now()  # Changes the conditional GET validators
+    model_class.objects.filter(pk=pk, **{field: source_name}).update(**updates)
+    invalidate_namespace('campaigns')
+
+
+# SIGNAL: Forget thumbnails of a replaced image before saving, render the new ones after
+@receiver(pre_save, sender='core.CustomUser')
+@receiver(pre_save, sender='core.Campaign')
+def drop_stale_thumbnails(sender, instance, **kwargs):
+    for field in IMAGE_FIELDS.get(sender._meta.label, ()):
+        image = getattr(instance, field)
+        if getattr(instance, f"{field}_thumbnails") and (
+                not image or getattr(instance, f"{field}_thumbnails") != expected_thumbnails(field, image.name)):
+            setattr(instance, f"{field}_thumbnails", {})
+
+
+@receiver(post_save, sender='core.CustomUser')
+@receiver(post_save, sender='core.Campaign')
+def enqueue_thumbnails(sender, instance, **kwargs):
+    for field in IMAGE_FIELDS.get(sender._meta.label, ()):
+        if getattr(instance, field) and not getattr(instance, f"{field}_thumbnails"):
+            generate_thumbnails.enqueue(
+                key=f"thumbnails:{sender._meta.label}:{instance.pk}:{field}",
+                model=sender._meta.label, pk=instance.pk, field=field,
+            )
@@ -0,0 +1,318 @@
+"""
+In-process request metrics exposed in Prometheus text format.
+
+Each thread records into its own buffer, so the request path takes no locks;
+`/metrics` merges the buffers when scraped. With several worker processes, set
+METRICS['MULTIPROCESS_DIR'] and each worker periodically flushes a snapshot there
+for the scraped worker to merge.
+"""
+import contextvars
+import heapq
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from .cache import get_response_cache
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('core.metrics.slow')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SLOW_LOG_STATEMENTS = 5
+
+# name: (type, help, buckets)
+METRICS = {
+    'http_requests_total': ('counter', "Requests by view, method and status code.", None),
+    'http_request_duration_seconds': ('histogram', "Request latency by view.", DURATION_BUCKETS),
+    'http_request_db_queries': ('histogram', "Database queries per request by view.", COUNT_BUCKETS),
+    'http_request_span_duration_seconds': (
+        'histogram', "Time per request spent in the database, serializers and payment gateway calls.", DURATION_BUCKETS,
+    ),
+    'http_response_cache_total': ('counter', "Response cache lookups by view and result.", None),
+    'http_requests_rejected_total': (
+        'counter', "Requests rejected by rate limits (by scope and limit) or admission control.", None,
+    ),
+}
+
+
+def get_setting(name, default):
+    return getattr(settings, 'METRICS', {}).get(name, default)
+
+
+# -------------------------
+# Per-thread buffers
+# -------------------------
+class Buffer:
+    """Counters and histograms written by one thread."""
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        self.counters[name, labels] += value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [[0] * len(METRICS[name][2]), 0.0, 0]
+        for i, bound in enumerate(METRICS[name][2]):
+            if value <= bound:
+                histogram[0][i] += 1
+                break
+        histogram[1] += value
+        histogram[2] += 1
+
+
+_local = threading.local()
+_buffers = []
+_buffers_lock = threading.Lock()
+
+
+def _buffer():
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None:
+        buffer = _local.buffer = Buffer()
+        with _buffers_lock:  # Once per thread
+            _buffers.append(buffer)
+    return buffer
+
+
+def snapshot():
+    """Merges every thread's buffer into {'counters': [...], 'histograms': [...]}."""
+    counters = defaultdict(float)
+    histograms = {}
+    with _buffers_lock:
+        buffers = list(_buffers)
+    for buffer in buffers:
+        for key, value in list(buffer.counters.items()):
+            counters[key] += value
+        for key, (buckets, total, count) in list(buffer.histograms.items()):
+            _merge_histogram(histograms, key, buckets, total, count)
+    return {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(labels), *value] for (name, labels), value in histograms.items()],
+    }
+
+
+def _merge_histogram(histograms, key, buckets, total, count):
+    merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+    merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+    merged[1] += total
+    merged[2] += count
+
+
+def reset_metrics():
+    """Clears recorded metrics (tests)."""
+    with _buffers_lock:
+        _buffers.clear()
+    _local.__dict__.clear()
+
+
+# -------------------------
+# Multi-process flushing
+# -------------------------
+_last_flush = 0.0
+
+
+def maybe_flush():
+    """Writes this worker's snapshot to MULTIPROCESS_DIR at most every FLUSH_INTERVAL seconds."""
+    global _last_flush
+    directory = get_setting('MULTIPROCESS_DIR', None)
+    now = time.monotonic()
+    if not directory or now - _last_flush < get_setting('FLUSH_INTERVAL', 10):
+        return
+    _last_flush = now
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    try:
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(snapshot(), f)
+        os.replace(f"{path}.tmp", path)
+    except OSError:
+        logger.exception("Could not flush metrics to %s", directory)
+
+
+def collect():
+    """This worker's live metrics plus the last snapshots flushed by other workers."""
+    counters = defaultdict(float)
+    histograms = {}
+    snapshots = [snapshot()]
+    directory = get_setting('MULTIPROCESS_DIR', None)
+    if directory and os.path.isdir(directory):
+        own = f"{os.getpid()}.json"
+        for filename in os.listdir(directory):
+            if filename.endswith('.json') and filename != own:
+                try:
+                    with open(os.path.join(directory, filename)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+    for data in snapshots:
+        for name, labels, value in data['counters']:
+            counters[name, tuple(map(tuple, labels))] += value
+        for name, labels, buckets, total, count in data['histograms']:
+            _merge_histogram(histograms, (name, tuple(map(tuple, labels))), buckets, total, count)
+    return counters, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render():
+    """Prometheus text exposition (format 0.0.4)."""
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, help_text, bounds) in METRICS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+            continue
+        for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket in zip(bounds, buckets):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+    stats = get_response_cache().stats()
+    for key in ('hits', 'misses', 'evictions'):
+        if key in stats:
+            lines += [f"# TYPE response_cache_{key}_total counter", f"response_cache_{key}_total {stats[key]}"]
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Serves `render()`. When METRICS['TOKEN'] is set scrapers must send it as a
+    bearer token, otherwise only INTERNAL_IPS may scrape.
+    """
+    token = get_setting('TOKEN', None)
+    if token:
+        allowed = request.headers.get('Authorization') == f"Bearer {token}"
+    else:
+        allowed = request.META.get('REMOTE_ADDR') in getattr(settings, 'INTERNAL_IPS', [])
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# -------------------------
+# Request instrumentation
+# -------------------------
+_request = contextvars.ContextVar('metrics_request', default=None)
+
+
+class RequestStats:
+    """What the current request spent its time on."""
+
+    def __init__(self, keep_sql):
+        self.spans = defaultdict(float)
+        self.active = set()
+        self.queries = 0
+        self.keep_sql = keep_sql
+        self.statements = []
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.spans['db'] += elapsed
+            if self.keep_sql:  # Only the slowest few
+                push = heapq.heappush if len(self.statements) < SLOW_LOG_STATEMENTS else heapq.heappushpop
+                push(self.statements, (elapsed, sql))
+
+
+def count(name, labels, value=1):
+    """Increments counter `name` (declared in METRICS) from outside the middleware."""
+    if get_setting('ENABLED', True):
+        _buffer().inc(name, labels, value)
+
+
+@contextmanager
+def timed(span):
+    """Adds the time spent in the block to `span` of the current request (no-op outside one)."""
+    stats = _request.get()
+    if stats is None or span in stats.active:  # Nested calls count once
+        yield
+        return
+    stats.active.add(span)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.spans[span] += time.perf_counter() - started
+        stats.active.discard(span)
+
+
+class MetricsMiddleware:
+    """
+    Records latency, status, database queries and time, serializer and payment
+    gateway time and response cache results per view, and logs a sample of slow
+    requests with their slowest SQL statements.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not get_setting('ENABLED', True):
+            return self.get_response(request)
+
+        slow_ms = get_setting('SLOW_REQUEST_MS', 500)
+        sampled = slow_ms is not None and random.random() < get_setting('SLOW_REQUEST_SAMPLE_RATE', 1.0)
+        stats = RequestStats(keep_sql=sampled)
+        token = _request.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats.db_wrapper))
+                response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else '<unmatched>'
+        buffer = _buffer()
+        buffer.inc('http_requests_total', (('view', view), ('method', request.method), ('status', str(response.status_code))))
+        buffer.observe('http_request_duration_seconds', (('view', view), ('method', request.method)), elapsed)
+        buffer.observe('http_request_db_queries', (('view', view),), stats.queries)
+        for span, seconds in stats.spans.items():
+            buffer.observe('http_request_span_duration_seconds', (('view', view), ('span', span)), seconds)
+        if response.has_header('X-Cache'):
+            buffer.inc('http_response_cache_total', (('view', view), ('result', response['X-Cache'].lower())))
+
+        if sampled and elapsed * 1000 >= slow_ms:
+            slowest = sorted(stats.statements, reverse=True)
+            slow_logger.warning(
+                "Slow request %s %s (%s) took %.0fms: %s queries in %.0fms\n%s",
+                request.method, request.path, view, elapsed * 1000, stats.queries, stats.spans['db'] * 1000,
+                '\n'.join(f"  {seconds * 1000:.1f}ms {sql}" for seconds, sql in slowest),
+            )
+
+        maybe_flush()
+        return response
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_alter_campaign_creator_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='core.campaign')),
+            ],
+            options={
+                'unique_together': {('campaign', 'shard')},
+            },
+        ),
+    ]
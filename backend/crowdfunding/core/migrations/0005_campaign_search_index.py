@@ -0,0 +1,46 @@
+from django.db import OperationalError, migrations, transaction
+
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                schema_editor.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS core_campaign_fts "
+                    "USING fts5(title, description, tokenize='unicode61 remove_diacritics 2')"
+                )
+        except OperationalError:
+            return  # SQLite built without FTS5; search falls back to icontains (see core.search)
+        schema_editor.execute(
+            "INSERT INTO core_campaign_fts(rowid, title, description) "
+            "SELECT id, title, description FROM core_campaign"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS core_campaign_search_gin ON core_campaign USING GIN (({POSTGRES_VECTOR}))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS core_campaign_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS core_campaign_search_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_campaigncountershard'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
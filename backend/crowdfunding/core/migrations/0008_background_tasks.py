@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_payment_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackgroundTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('key', models.CharField(blank=True, max_length=200, null=True)),
+                ('kwargs', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        # Existing donations are already counted and have their transactions
+        migrations.AddField(
+            model_name='donation',
+            name='settled',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name='donation',
+            name='settled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='donation',
+            index=models.Index(condition=models.Q(('settled', False)), fields=['campaign'], name='donation_unsettled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='backgroundtask',
+            index=models.Index(fields=['status', 'run_at'], name='backgroundtask_due_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='backgroundtask',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('key',), name='backgroundtask_pending_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+
+
+def build_rollups(apps, schema_editor):
+    """Backfills the rollups from existing rows (same as `manage.py rebuild_stats`)."""
+    Donation = apps.get_model('core', 'Donation')
+    Transaction = apps.get_model('core', 'Transaction')
+    CampaignStats = apps.get_model('core', 'CampaignStats')
+    CampaignDailyStats = apps.get_model('core', 'CampaignDailyStats')
+    UserTransactionStats = apps.get_model('core', 'UserTransactionStats')
+
+    donations = Donation.objects.filter(settled=True)
+    CampaignStats.objects.bulk_create(
+        [
+            CampaignStats(
+                campaign_id=row['campaign_id'], total_amount=row['total'], donor_count=row['donors'],
+                min_amount=row['low'], max_amount=row['high'],
+            )
+            for row in donations.values('campaign_id').annotate(
+                total=Sum('amount'), donors=Count('id'), low=Min('amount'), high=Max('amount'),
+            ).order_by()
+        ],
+        batch_size=1000,
+    )
+    CampaignDailyStats.objects.bulk_create(
+        [
+            CampaignDailyStats(
+                campaign_id=row['campaign_id'], day=row['day'], total_amount=row['total'], donation_count=row['count'],
+            )
+            for row in donations.annotate(day=TruncDate('created_at')).values('campaign_id', 'day').annotate(
+                total=Sum('amount'), count=Count('id'),
+            ).order_by()
+        ],
+        batch_size=1000,
+    )
+    UserTransactionStats.objects.bulk_create(
+        [
+            UserTransactionStats(
+                user_id=row['user_id'], transaction_type=row['transaction_type'], status=row['status'],
+                total_amount=row['total'], count=row['count'],
+            )
+            for row in Transaction.objects.values('user_id', 'transaction_type', 'status').annotate(
+                total=Sum('amount'), count=Count('id'),
+            ).order_by()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_background_tasks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignStats',
+            fields=[
+                ('campaign', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='core.campaign')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('donor_count', models.PositiveIntegerField(default=0)),
+                ('min_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CampaignDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('donation_count', models.PositiveIntegerField(default=0)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='core.campaign')),
+            ],
+            options={
+                'unique_together': {('campaign', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='UserTransactionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(choices=[('donation', 'Donation'), ('withdrawal', 'Withdrawal')], max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed')], max_length=20)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transaction_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'transaction_type', 'status')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
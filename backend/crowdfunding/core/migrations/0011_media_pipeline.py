@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:35
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_conditional_get_validators'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='cover_image',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.get_image_storage, upload_to='campaign_covers/', validators=[core.storage.validate_image_size]),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='cover_image_thumbnails',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='profile_picture_thumbnails',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.get_image_storage, upload_to='profile_pics/', validators=[core.storage.validate_image_size]),
+        ),
+    ]
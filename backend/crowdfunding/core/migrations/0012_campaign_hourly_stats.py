@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:37
+
+import django.db.models.deletion
+from datetime import timezone
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+
+
+def build_hourly_rollups(apps, schema_editor):
+    """Backfills the hourly rollups from settled donations (same as `manage.py rebuild_stats`)."""
+    Donation = apps.get_model('core', 'Donation')
+    CampaignHourlyStats = apps.get_model('core', 'CampaignHourlyStats')
+
+    buckets = Donation.objects.filter(settled=True).annotate(hour=TruncHour('created_at', tzinfo=timezone.utc))
+    CampaignHourlyStats.objects.bulk_create(
+        [
+            CampaignHourlyStats(
+                campaign_id=row['campaign_id'], hour=row['hour'], total_amount=row['total'], donation_count=row['count'],
+            )
+            for row in buckets.values('campaign_id', 'hour').annotate(total=Sum('amount'), count=Count('id')).order_by()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_media_pipeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignHourlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('donation_count', models.PositiveIntegerField(default=0)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_stats', to='core.campaign')),
+            ],
+            options={
+                'unique_together': {('campaign', 'hour')},
+            },
+        ),
+        migrations.RunPython(build_hourly_rollups, migrations.RunPython.noop),
+    ]
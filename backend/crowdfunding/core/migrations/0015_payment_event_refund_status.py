@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_threaded_comments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentevent',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('settled', 'Settled'), ('ignored', 'Ignored'), ('failed', 'Failed'), ('refund', 'Needs refund')], default='pending', max_length=20),
+        ),
+    ]
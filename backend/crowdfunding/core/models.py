@@ -1,17 +1,46 @@
+from decimal import Decimal
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from .cache import comment_feed_namespace, invalidate_namespace
+from .storage import get_image_storage, validate_image_size
 
 # Custom User Model
 class CustomUser(AbstractUser):
-    profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    profile_picture = models.ImageField(
+        upload_to='profile_pics/', storage=get_image_storage, validators=[validate_image_size], blank=True, null=True,
+    )
+    profile_picture_thumbnails = models.JSONField(default=dict, blank=True, editable=False)  # See core/media.py
 
     def __str__(self):
         return self.username
 
 
+class CampaignQuerySet(models.QuerySet):
+    def with_raised_totals(self):
+        """Annotates `shard_total` so `total_raised` can be read without extra queries."""
+        if getattr(settings, 'CAMPAIGN_COUNTER_SHARDS', 1) <= 1:
+            return self.annotate(shard_total=models.Value(Decimal('0.00'), output_field=models.DecimalField()))
+        shard_sum = (
+            CampaignCounterShard.objects.filter(campaign=models.OuterRef('pk'))
+            .values('campaign')
+            .annotate(total=models.Sum('amount'))
+            .values('total')
+        )
+        return self.annotate(
+            shard_total=Coalesce(
+                models.Subquery(shard_sum),
+                models.Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+
+
 # Campaign Model
 class Campaign(models.Model):
     title = models.CharField(max_length=255)
@@ -19,27 +48,64 @@ class Campaign(models.Model):
     goal_amount = models.DecimalField(max_digits=10, decimal_places=2)
     raised_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     creator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="campaigns")
+    cover_image = models.ImageField(
+        upload_to='campaign_covers/', storage=get_image_storage, validators=[validate_image_size], blank=True, null=True,
+    )
+    cover_image_thumbnails = models.JSONField(default=dict, blank=True, editable=False)  # See core/media.py
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=0, editable=False)  # Bumped by donations and comments, see counters.touch_campaigns
+    comment_count = models.PositiveIntegerField(default=0, editable=False)  # Maintained by the comment signals below
+
+    objects = CampaignQuerySet.as_manager()
+
+    @property
+    def total_raised(self):
+        """Raised amount including increments still sitting in counter shards."""
+        shard_total = getattr(self, 'shard_total', None)
+        if shard_total is None:
+            shard_total = self.counter_shards.aggregate(models.Sum('amount'))['amount__sum'] or 0
+        return self.raised_amount + shard_total
 
     def update_raised_amount(self):
         """Recalculate and update the total amount raised."""
-        total_donations = self.donations.aggregate(models.Sum('amount'))['amount__sum'] or 0.00
-        self.raised_amount = total_donations
-        self.save()
+        from .counters import reconcile_raised_amounts
+
+        reconcile_raised_amounts(campaign_ids=[self.pk])
+        self.refresh_from_db(fields=['raised_amount'])
 
     def __str__(self):
         return self.title
 
 
+# Counter shard for Campaign.raised_amount
+class CampaignCounterShard(models.Model):
+    """One of N rows per campaign that absorb concurrent raised_amount increments."""
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name="counter_shards")
+    shard = models.PositiveSmallIntegerField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('campaign', 'shard')
+
+    def __str__(self):
+        return f"{self.campaign_id}#{self.shard}: {self.amount}"
+
+
 # Donation Model
 class Donation(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="donations")
     campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name="donations")
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    settled = models.BooleanField(default=False)  # Counted in raised_amount and has its Transaction
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('user', 'campaign')  # Ensure each user can donate only once per campaign
+        indexes = [
+            models.Index(fields=['campaign', 'created_at', 'id'], name='donation_campaign_created_idx'),
+            models.Index(fields=['campaign'], condition=models.Q(settled=False), name='donation_unsettled_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} donated {self.amount} to {self.campaign.title}"
@@ -62,35 +128,272 @@ class Transaction(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     transaction_type = models.CharField(max_length=50, choices=TRANSACTION_TYPES, default="donation")
     status = models.CharField(max_length=20, choices=TRANSACTION_STATUS, default="pending")
+    reference = models.CharField(max_length=100, unique=True, null=True, blank=True)  # Payment provider reference (tx_ref)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at', 'id'], name='transaction_user_created_idx')]
+
     def __str__(self):
         return f"{self.user.username} - {self.transaction_type} of {self.amount} - {self.status}"
 
 
+# Campaign Stats Model (rollup of settled donations, maintained by core/rollups.py)
+class CampaignStats(models.Model):
+    campaign = models.OneToOneField(Campaign, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    donor_count = models.PositiveIntegerField(default=0)  # One donation per user and campaign
+    min_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    @property
+    def average_amount(self):
+        if not self.donor_count:
+            return None
+        return (Decimal(self.total_amount) / self.donor_count).quantize(Decimal('0.01'))
+
+    def __str__(self):
+        return f"{self.campaign_id}: {self.total_amount} from {self.donor_count} donors"
+
+
+# Campaign Daily Stats Model (per-day donation buckets)
+class CampaignDailyStats(models.Model):
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name="daily_stats")
+    day = models.DateField()
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    donation_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('campaign', 'day')
+
+    def __str__(self):
+        return f"{self.campaign_id} on {self.day}: {self.total_amount}"
+
+
+# Campaign Hourly Stats Model (per-hour donation buckets, hours in UTC)
+class CampaignHourlyStats(models.Model):
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name="hourly_stats")
+    hour = models.DateTimeField()
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    donation_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('campaign', 'hour')
+
+    def __str__(self):
+        return f"{self.campaign_id} at {self.hour:%Y-%m-%d %H}:00: {self.total_amount}"
+
+
+# User Transaction Stats Model (lifetime totals per transaction type and status)
+class UserTransactionStats(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="transaction_stats")
+    transaction_type = models.CharField(max_length=50, choices=Transaction.TRANSACTION_TYPES)
+    status = models.CharField(max_length=20, choices=Transaction.TRANSACTION_STATUS)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'transaction_type', 'status')
+
+    def __str__(self):
+        return f"{self.user_id} {self.transaction_type}/{self.status}: {self.total_amount}"
+
+
 # Comment Model
+COMMENT_PATH_STEP = 11  # One zero-padded id and a '/' per level of Comment.path
+COMMENT_MAX_DEPTH = 20  # Replies nest at most this deep, so paths fit 255 characters
+
+
 class Comment(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="comments")
     campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name="comments")
+    parent = models.ForeignKey(
+        'self', on_delete=models.CASCADE, related_name="replies", null=True, blank=True, db_index=False,
+    )
+    # Materialized path: the ids of the thread's root down to this comment ('0000000007/0000000042/'),
+    # so a whole subtree is one range scan on comment_path_idx, in thread order
+    path = models.CharField(max_length=255, editable=False, default='')
+    reply_count = models.PositiveIntegerField(default=0, editable=False)  # Direct replies
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['campaign', 'created_at', 'id'], name='comment_campaign_created_idx'),
+            models.Index(
+                fields=['campaign', 'created_at', 'id'], condition=models.Q(parent__isnull=True),
+                name='comment_campaign_roots_idx',
+            ),
+            models.Index(fields=['parent', 'created_at', 'id'], name='comment_parent_created_idx'),
+            models.Index(fields=['path'], name='comment_path_idx'),
+        ]
+
+    @property
+    def depth(self):
+        """0 for a top-level comment, 1 for a reply to it, and so on."""
+        return max(len(self.path) // COMMENT_PATH_STEP - 1, 0)
+
+    def subtree_range(self):
+        """(lowest, highest) path of this comment's subtree, itself included; the upper bound is exclusive."""
+        return self.path, self.path[:-1] + '0'  # Paths continue with digits, which sort after '/'
 
     def __str__(self):
         return f"{self.user.username} commented on {self.campaign.title}"
 
 
-# SIGNAL: Update Campaign Raised Amount & Create Transaction when Donation is made
+# Payment Event Model (durable queue of provider webhooks)
+class PaymentEvent(models.Model):
+    EVENT_STATUS = [
+        ("pending", "Pending"),
+        ("settled", "Settled"),
+        ("ignored", "Ignored"),
+        ("failed", "Failed"),
+        ("refund", "Needs refund"),  # Paid, but could not be credited as a donation
+    ]
+
+    reference = models.CharField(max_length=100, unique=True)  # Provider reference, deduplicates redeliveries
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=EVENT_STATUS, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'], name='paymentevent_status_idx')]
+
+    def __str__(self):
+        return f"{self.reference} - {self.status}"
+
+
+# Background Task Model (queue for deferred side effects, see core/background.py)
+class BackgroundTask(models.Model):
+    TASK_STATUS = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("failed", "Failed"),
+    ]
+
+    name = models.CharField(max_length=200)
+    key = models.CharField(max_length=200, null=True, blank=True)  # Coalesces pending tasks doing the same work
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=TASK_STATUS, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    run_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'], name='backgroundtask_due_idx')]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'], condition=models.Q(status='pending'), name='backgroundtask_pending_key_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+# Idempotency Key Model (outcome of a POST sent with an Idempotency-Key header, see core/idempotency.py)
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # SHA-256 of the method, path and body
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # Null while the request is in flight
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code or 'in flight'})"
+
+
+# SIGNAL: Defer the campaign total & Transaction for a new Donation to a background task
 @receiver(post_save, sender=Donation)
 def update_campaign_on_donation(sender, instance, created, **kwargs):
+    if created and not instance.settled:
+        from .tasks import settle_campaign_donations
+
+        # Coalesced per campaign: a burst of donations settles in one task run
+        settle_campaign_donations.enqueue(key=f"settle-campaign:{instance.campaign_id}", campaign_id=instance.campaign_id)
+
+
+# SIGNAL: Drop cached campaign responses once a campaign or donation change commits
+@receiver(post_save, sender=Campaign)
+@receiver(post_delete, sender=Campaign)
+@receiver(post_save, sender=Donation)
+@receiver(post_delete, sender=Donation)
+def invalidate_campaign_cache(sender, **kwargs):
+    transaction.on_commit(lambda: invalidate_namespace('campaigns'))
+
+
+# SIGNAL: Keep donation and transaction rollups in step with single-row writes
+@receiver(post_save, sender=Transaction)
+def update_stats_on_transaction(sender, instance, created, **kwargs):
+    from . import rollups, tasks
+
     if created:
-        # Update campaign raised amount
-        instance.campaign.update_raised_amount()
-
-        # Create a new transaction for this donation
-        Transaction.objects.create(
-            user=instance.user,
-            donation=instance,
-            amount=instance.amount,
-            transaction_type="donation",
-            status="completed"
+        rollups.apply_transactions([instance])
+    else:
+        # The row may have moved between type/status buckets; recount this user
+        tasks.refresh_user_stats.enqueue(key=f"user-stats:{instance.user_id}", user_id=instance.user_id)
+
+
+@receiver(post_delete, sender=Transaction)
+def update_stats_on_transaction_delete(sender, instance, **kwargs):
+    from .tasks import refresh_user_stats
+
+    refresh_user_stats.enqueue(key=f"user-stats:{instance.user_id}", user_id=instance.user_id)
+
+
+@receiver(post_save, sender=Donation)
+@receiver(post_delete, sender=Donation)
+def update_stats_on_donation_change(sender, instance, created=False, **kwargs):
+    # New donations are added when they settle; edits and deletes can't be undone
+    # incrementally (min/max), so the campaign is recounted.
+    if instance.settled and not created:
+        from .tasks import refresh_campaign_stats
+
+        refresh_campaign_stats.enqueue(key=f"campaign-stats:{instance.campaign_id}", campaign_id=instance.campaign_id)
+
+
+# SIGNAL: Place new comments in their thread and keep comment counts and the cached feed in step
+@receiver(post_save, sender=Comment)
+def update_thread_on_comment(sender, instance, created, **kwargs):
+    from .counters import touch_campaigns
+
+    if created:
+        instance.path = f"{instance.parent.path if instance.parent_id else ''}{instance.pk:010d}/"
+        Comment.objects.filter(pk=instance.pk).update(path=instance.path)
+        if instance.parent_id:
+            Comment.objects.filter(pk=instance.parent_id).update(reply_count=models.F('reply_count') + 1)
+        Campaign.objects.filter(pk=instance.campaign_id).update(
+            comment_count=models.F('comment_count') + 1, version=models.F('version') + 1, updated_at=timezone.now(),
         )
+    else:
+        # A comment change is a change of its campaign's feed (conditional GET validators)
+        touch_campaigns([instance.campaign_id])
+    invalidate_comment_feed(instance.campaign_id)
+
+
+@receiver(post_delete, sender=Comment)
+def update_thread_on_comment_delete(sender, instance, **kwargs):
+    # Replies of a deleted comment cascade and come through here one by one
+    if instance.parent_id:
+        Comment.objects.filter(pk=instance.parent_id).update(reply_count=Greatest(models.F('reply_count') - 1, 0))
+    Campaign.objects.filter(pk=instance.campaign_id).update(
+        comment_count=Greatest(models.F('comment_count') - 1, 0), version=models.F('version') + 1, updated_at=timezone.now(),
+    )
+    invalidate_comment_feed(instance.campaign_id)
+
+
+def invalidate_comment_feed(campaign_id):
+    def invalidate():
+        invalidate_namespace(comment_feed_namespace(campaign_id))
+        invalidate_namespace('campaigns')  # comment_count is part of campaign responses
+    transaction.on_commit(invalidate)
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import random
+import threading
+import uuid
+
+
+class StubPayChanguServer:
+    """
+    Local stand-in for the PayChangu API with tunable latency and failures.
+
+    A minimal keep-alive HTTP/1.1 server on asyncio, so thousands of slow in-flight
+    requests cost no threads. `serve_forever()` blocks; as a context manager it
+    serves from a background thread:
+
+        with StubPayChanguServer(latency=0.2) as stub:
+            client = PayChanguClient(base_url=stub.url, secret_key='test')
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0, failure_status=503):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.fail_next = 0
+        self.requests = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length') or 0))
+
+                status_code, payload = await self._respond(method, path, body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status_code} {'OK' if status_code == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, method, path, body):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+
+        if self.fail_next > 0 or random.random() < self.failure_rate:
+            self.fail_next = max(self.fail_next - 1, 0)
+            return self.failure_status, {'status': 'error', 'message': 'Gateway unavailable'}
+        if method != 'POST' or path != '/v1/payments':
+            return 404, {'status': 'error', 'message': 'Not found'}
+
+        payment = json.loads(body or b'{}')
+        return 200, {
+            'status': 'success',
+            'data': {'tx_ref': uuid.uuid4().hex, 'amount': payment.get('amount'), 'currency': payment.get('currency')},
+        }
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    def shutdown(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self._thread.join(timeout=5)
@@ -1,39 +1,296 @@
-import requests
+import asyncio
 import logging
+import random
+import threading
+import time
+import httpx
 from django.conf import settings
+from .metrics import timed
 
 logger = logging.getLogger(__name__)
 
+REQUIRED_PAYMENT_FIELDS = ['amount', 'currency', 'phone_number', 'email', 'callback_url']
+
+# Responses worth retrying: the gateway did not process the request
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+# Errors raised before the request reached the gateway, so a retry can't double-charge
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the gateway while the circuit breaker is open."""
+
+    def __init__(self, retry_after):
+        super().__init__("Payment service is temporarily unavailable.")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `failure_threshold` consecutive gateway failures.
+
+    After `reset_timeout` seconds one trial request is let through (half-open); its
+    outcome closes the circuit again or re-opens it for another timeout.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        """Raises CircuitOpenError while open; returns True when this call is the half-open trial."""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return False
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            retry_after = max(self.reset_timeout - (time.monotonic() - self.opened_at), 1)
+            raise CircuitOpenError(retry_after=int(retry_after))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+async def _close_on_shutdown(client):
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+class PayChanguClient:
+    """
+    Pooled PayChangu client usable from sync (WSGI) and async (ASGI) code.
+
+    Connections are kept alive between calls, every call has connect/read timeouts,
+    concurrency is capped by a semaphore, transient failures are retried with
+    exponential backoff and full jitter, and a circuit breaker short-circuits calls
+    while the gateway is failing.
+    """
+
+    def __init__(self, base_url, secret_key, timeout=10.0, connect_timeout=3.0, max_connections=20,
+                 max_concurrency=20, max_retries=2, backoff_base=0.2, backoff_max=2.0, breaker=None):
+        self.base_url = base_url or ''
+        self.secret_key = secret_key
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        self._sync_client = None
+        self._sync_semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._async_state = None  # (loop, client, semaphore, lifetime); httpx async clients are bound to a loop
+        self._lock = threading.Lock()
+
+    @property
+    def headers(self):
+        return {
+            "Authorization": f"Bearer {self.secret_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _get_sync_client(self):
+        if self._sync_client is None:
+            with self._lock:
+                if self._sync_client is None:
+                    self._sync_client = httpx.Client(
+                        base_url=self.base_url, timeout=self.timeout, limits=self.limits, headers=self.headers
+                    )
+        return self._sync_client
+
+    async def _get_async_state(self):
+        loop = asyncio.get_running_loop()
+        state = self._async_state
+        if state is None or state[0] is not loop:
+            if state is not None and state[0].is_running():
+                # The old loop still runs in another thread: close its client there
+                asyncio.run_coroutine_threadsafe(state[3].aclose(), state[0])  # Its finally closes the client
+            client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=self.timeout, limits=self.limits, headers=self.headers
+            )
+            # Loops finalize their async generators when they shut down (asyncio.run,
+            # async_to_sync), which closes the client with its loop
+            lifetime = _close_on_shutdown(client)
+            await lifetime.__anext__()
+            state = self._async_state = (loop, client, asyncio.Semaphore(self.max_concurrency), lifetime)
+        return state
+
+    def _handle_response(self, response):
+        if response.status_code == 200:
+            self.breaker.record_success()
+            return response.json()
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()  # The gateway is healthy, the request was rejected
+        logger.error(f"PayChangu API error: {response.status_code} - {response.text}")
+        return {"error": f"Payment initiation failed with status code {response.status_code}"}
+
+    def _handle_error(self, error):
+        self.breaker.record_failure()
+        logger.error(f"Error making request to PayChangu API: {error}")
+        return {"error": "Error connecting to the payment service. Please try again later."}
+
+    def post(self, path, payload):
+        """POST `payload` to the gateway, retrying transient failures."""
+        with timed('payment'):
+            return self._post(path, payload)
+
+    async def apost(self, path, payload):
+        """Async variant of `post`; waits on the gateway without holding a worker thread."""
+        with timed('payment'):
+            return await self._apost(path, payload)
+
+    def _post(self, path, payload):
+        trial = self.breaker.before_call()
+        try:
+            client = self._get_sync_client()
+            with self._sync_semaphore:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        response = client.post(path, json=payload)
+                    except RETRYABLE_ERRORS as e:
+                        if attempt == self.max_retries:
+                            return self._handle_error(e)
+                    except httpx.HTTPError as e:
+                        return self._handle_error(e)
+                    else:
+                        if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                            return self._handle_response(response)
+                    time.sleep(self._backoff(attempt))
+        except BaseException:
+            if trial:
+                self.breaker.record_failure()  # An unfinished trial re-opens the circuit instead of wedging it
+            raise
+
+    async def _apost(self, path, payload):
+        trial = self.breaker.before_call()
+        try:
+            _, client, semaphore, _ = await self._get_async_state()
+            async with semaphore:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        response = await client.post(path, json=payload)
+                    except RETRYABLE_ERRORS as e:
+                        if attempt == self.max_retries:
+                            return self._handle_error(e)
+                    except httpx.HTTPError as e:
+                        return self._handle_error(e)
+                    else:
+                        if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                            return self._handle_response(response)
+                    await asyncio.sleep(self._backoff(attempt))
+        except BaseException:  # Includes CancelledError when an ASGI client disconnects
+            if trial:
+                self.breaker.record_failure()
+            raise
+
+    def initiate_payment(self, **payment):
+        return self.post("/v1/payments", payment)
+
+    async def ainitiate_payment(self, **payment):
+        return await self.apost("/v1/payments", payment)
+
+    def close(self):
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_paychangu_client():
+    """Returns the process-wide PayChangu client configured from the PAYCHANGU_* settings."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PayChanguClient(
+                    base_url=settings.PAYCHANGU_BASE_URL,
+                    secret_key=settings.PAYCHANGU_SECRET_KEY,
+                    timeout=settings.PAYCHANGU_TIMEOUT,
+                    connect_timeout=settings.PAYCHANGU_CONNECT_TIMEOUT,
+                    max_connections=settings.PAYCHANGU_MAX_CONNECTIONS,
+                    max_concurrency=settings.PAYCHANGU_MAX_CONCURRENCY,
+                    max_retries=settings.PAYCHANGU_MAX_RETRIES,
+                    breaker=CircuitBreaker(
+                        failure_threshold=settings.PAYCHANGU_CIRCUIT_FAILURE_THRESHOLD,
+                        reset_timeout=settings.PAYCHANGU_CIRCUIT_RESET_TIMEOUT,
+                    ),
+                )
+    return _client
+
+
+def reset_paychangu_client():
+    """Drops the configured client (used when settings change, e.g. in tests)."""
+    global _client
+    if _client is not None:
+        _client.close()
+    _client = None
+
+
 class PayChanguService:
     """Handles interactions with PayChangu API."""
 
     @staticmethod
-    def initiate_payment(amount, currency, phone_number, email, callback_url):
-        """Initiate a mobile money payment using Mpamba or Airtel Money."""
-        url = f"{settings.PAYCHANGU_BASE_URL}/v1/payments"
-        payload = {
+    def build_payment(amount, currency, phone_number, email, callback_url, tx_ref=None, meta=None):
+        """Payment payload; `tx_ref` and `meta` come back in the webhook so it can be settled."""
+        payment = {
             "amount": amount,
             "currency": currency,
             "phone_number": phone_number,
             "email": email,
-            "callback_url": callback_url
-        }
-        headers = {
-            "Authorization": f"Bearer {settings.PAYCHANGU_SECRET_KEY}",
-            "Content-Type": "application/json"
+            "callback_url": callback_url,
         }
+        if tx_ref:
+            payment["tx_ref"] = tx_ref
+        if meta:
+            payment["meta"] = meta
+        return payment
 
-        try:
-            response = requests.post(url, json=payload, headers=headers)
-
-            # Check if the response was successful
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.error(f"PayChangu API error: {response.status_code} - {response.text}")
-                return {"error": f"Payment initiation failed with status code {response.status_code}"}
-
-        except requests.exceptions.RequestException as e:
-            # Catch any HTTP request errors
-            logger.error(f"Error making request to PayChangu API: {str(e)}")
-            return {"error": "Error connecting to the payment service. Please try again later."}
+    @staticmethod
+    def initiate_payment(amount, currency, phone_number, email, callback_url, tx_ref=None, meta=None):
+        """Initiate a mobile money payment using Mpamba or Airtel Money."""
+        return get_paychangu_client().initiate_payment(**PayChanguService.build_payment(
+            amount, currency, phone_number, email, callback_url, tx_ref=tx_ref, meta=meta
+        ))
+
+    @staticmethod
+    async def ainitiate_payment(amount, currency, phone_number, email, callback_url, tx_ref=None, meta=None):
+        """Async variant of `initiate_payment` for ASGI views."""
+        return await get_paychangu_client().ainitiate_payment(**PayChanguService.build_payment(
+            amount, currency, phone_number, email, callback_url, tx_ref=tx_ref, meta=meta
+        ))
@@ -0,0 +1,220 @@
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least, TruncDate, TruncHour
+from django.utils import timezone
+from .models import CampaignDailyStats, CampaignHourlyStats, CampaignStats, Donation, Transaction, UserTransactionStats
+
+# Backends that understand INSERT ... ON CONFLICT (...) DO UPDATE
+UPSERT_VENDORS = ('sqlite', 'postgresql')
+
+
+def upsert_increments(model, key_fields, rows, add_fields=(), min_fields=(), max_fields=(), batch_size=100):
+    """
+    Adds `rows` into the rollup table of `model`, one statement per batch.
+
+    Each row is a dict with `key_fields` (a unique constraint of the model) and the
+    delta columns: `add_fields` are summed into the stored row, `min_fields` and
+    `max_fields` only move outwards. Keys must be unique within `rows`.
+    """
+    if not rows:
+        return
+    if connection.vendor not in UPSERT_VENDORS:
+        return _upsert_increments_orm(model, key_fields, rows, add_fields, min_fields, max_fields)
+
+    meta = model._meta
+    quote = connection.ops.quote_name
+    table = quote(meta.db_table)
+    fields = [meta.get_field(name) for name in (*key_fields, *add_fields, *min_fields, *max_fields)]
+    columns = {field.name: quote(field.column) for field in fields}
+
+    assignments = [f"{columns[name]} = {table}.{columns[name]} + EXCLUDED.{columns[name]}" for name in add_fields]
+    for names, op in ((min_fields, '<'), (max_fields, '>')):
+        for name in names:
+            column = columns[name]
+            assignments.append(
+                f"{column} = CASE WHEN {table}.{column} IS NULL OR EXCLUDED.{column} {op} {table}.{column} "
+                f"THEN EXCLUDED.{column} ELSE {table}.{column} END"
+            )
+
+    placeholder = f"({', '.join(['%s'] * len(fields))})"
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = [field.get_db_prep_save(row[field.name], connection) for row in batch for field in fields]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns.values())}) "
+                f"VALUES {', '.join([placeholder] * len(batch))} "
+                f"ON CONFLICT ({', '.join(columns[name] for name in key_fields)}) "
+                f"DO UPDATE SET {', '.join(assignments)}",
+                params,
+            )
+
+
+def _upsert_increments_orm(model, key_fields, rows, add_fields, min_fields, max_fields):
+    """Row-at-a-time fallback: UPDATE with F() expressions, INSERT when the row is missing."""
+    for row in rows:
+        lookup = {name: row[name] for name in key_fields}
+        changes = {name: F(name) + row[name] for name in add_fields}
+        changes.update({name: Least(Coalesce(F(name), Value(row[name])), Value(row[name])) for name in min_fields})
+        changes.update({name: Greatest(Coalesce(F(name), Value(row[name])), Value(row[name])) for name in max_fields})
+        if model.objects.filter(**lookup).update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(**row)
+        except IntegrityError:
+            # Another writer created the row first, add to it instead.
+            model.objects.filter(**lookup).update(**changes)
+
+
+def apply_donations(donations):
+    """Adds newly settled donations to the campaign and daily rollups."""
+    campaigns = {}
+    days = defaultdict(lambda: [Decimal('0.00'), 0])
+    hours = defaultdict(lambda: [Decimal('0.00'), 0])
+    for donation in donations:
+        amount = Decimal(donation.amount)
+        row = campaigns.setdefault(donation.campaign_id, {
+            'campaign': donation.campaign_id, 'total_amount': Decimal('0.00'), 'donor_count': 0,
+            'min_amount': amount, 'max_amount': amount,
+        })
+        row['total_amount'] += amount
+        row['donor_count'] += 1
+        row['min_amount'] = min(row['min_amount'], amount)
+        row['max_amount'] = max(row['max_amount'], amount)
+
+        bucket = days[donation.campaign_id, timezone.localdate(donation.created_at)]
+        bucket[0] += amount
+        bucket[1] += 1
+        hour = donation.created_at.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+        bucket = hours[donation.campaign_id, hour]
+        bucket[0] += amount
+        bucket[1] += 1
+
+    upsert_increments(
+        CampaignStats, ['campaign'], list(campaigns.values()),
+        add_fields=['total_amount', 'donor_count'], min_fields=['min_amount'], max_fields=['max_amount'],
+    )
+    upsert_increments(
+        CampaignDailyStats, ['campaign', 'day'],
+        [
+            {'campaign': campaign_id, 'day': day, 'total_amount': total, 'donation_count': count}
+            for (campaign_id, day), (total, count) in days.items()
+        ],
+        add_fields=['total_amount', 'donation_count'],
+    )
+    upsert_increments(
+        CampaignHourlyStats, ['campaign', 'hour'],
+        [
+            {'campaign': campaign_id, 'hour': hour, 'total_amount': total, 'donation_count': count}
+            for (campaign_id, hour), (total, count) in hours.items()
+        ],
+        add_fields=['total_amount', 'donation_count'],
+    )
+
+
+def apply_transactions(transactions):
+    """Adds new transactions to their users' per type/status totals."""
+    buckets = defaultdict(lambda: [Decimal('0.00'), 0])
+    for tx in transactions:
+        bucket = buckets[tx.user_id, tx.transaction_type, tx.status]
+        bucket[0] += Decimal(tx.amount)
+        bucket[1] += 1
+
+    upsert_increments(
+        UserTransactionStats, ['user', 'transaction_type', 'status'],
+        [
+            {'user': user_id, 'transaction_type': tx_type, 'status': tx_status, 'total_amount': total, 'count': count}
+            for (user_id, tx_type, tx_status), (total, count) in buckets.items()
+        ],
+        add_fields=['total_amount', 'count'],
+    )
+
+
+def rebuild_campaign_stats(campaign_ids=None, batch_size=1000):
+    """
+    Recomputes campaign, daily and hourly rollups from settled donations with
+    grouped aggregates. Returns the number of campaigns that have donations.
+    """
+    donations = Donation.objects.filter(settled=True)
+    stats = CampaignStats.objects.all()
+    daily = CampaignDailyStats.objects.all()
+    hourly = CampaignHourlyStats.objects.all()
+    if campaign_ids is not None:
+        donations = donations.filter(campaign_id__in=campaign_ids)
+        stats = stats.filter(campaign_id__in=campaign_ids)
+        daily = daily.filter(campaign_id__in=campaign_ids)
+        hourly = hourly.filter(campaign_id__in=campaign_ids)
+
+    with transaction.atomic():
+        stats.delete()
+        daily.delete()
+        hourly.delete()
+        totals = donations.values('campaign_id').annotate(
+            total=Sum('amount'), donors=Count('id'), low=Min('amount'), high=Max('amount'),
+        ).order_by()
+        rows = CampaignStats.objects.bulk_create(
+            [
+                CampaignStats(
+                    campaign_id=row['campaign_id'], total_amount=row['total'], donor_count=row['donors'],
+                    min_amount=row['low'], max_amount=row['high'],
+                )
+                for row in totals
+            ],
+            batch_size=batch_size,
+        )
+        buckets = donations.annotate(day=TruncDate('created_at')).values('campaign_id', 'day').annotate(
+            total=Sum('amount'), count=Count('id'),
+        ).order_by()
+        CampaignDailyStats.objects.bulk_create(
+            [
+                CampaignDailyStats(
+                    campaign_id=row['campaign_id'], day=row['day'], total_amount=row['total'], donation_count=row['count'],
+                )
+                for row in buckets
+            ],
+            batch_size=batch_size,
+        )
+        buckets = donations.annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc)).values(
+            'campaign_id', 'hour',
+        ).annotate(total=Sum('amount'), count=Count('id')).order_by()
+        CampaignHourlyStats.objects.bulk_create(
+            [
+                CampaignHourlyStats(
+                    campaign_id=row['campaign_id'], hour=row['hour'], total_amount=row['total'],
+                    donation_count=row['count'],
+                )
+                for row in buckets
+            ],
+            batch_size=batch_size,
+        )
+    return len(rows)
+
+
+def rebuild_user_stats(user_ids=None, batch_size=1000):
+    """Recomputes per-user transaction totals. Returns the number of rollup rows written."""
+    transactions = Transaction.objects.all()
+    stats = UserTransactionStats.objects.all()
+    if user_ids is not None:
+        transactions = transactions.filter(user_id__in=user_ids)
+        stats = stats.filter(user_id__in=user_ids)
+
+    with transaction.atomic():
+        stats.delete()
+        totals = transactions.values('user_id', 'transaction_type', 'status').annotate(
+            total=Sum('amount'), count=Count('id'),
+        ).order_by()
+        rows = UserTransactionStats.objects.bulk_create(
+            [
+                UserTransactionStats(
+                    user_id=row['user_id'], transaction_type=row['transaction_type'], status=row['status'],
+                    total_amount=row['total'], count=row['count'],
+                )
+                for row in totals
+            ],
+            batch_size=batch_size,
+        )
+    return len(rows)
@@ -0,0 +1,333 @@
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection, connections, router, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Campaign
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+def read_cursor():
+    """Cursor on the database the router picks for campaign reads (a replica when enabled)."""
+    return connections[router.db_for_read(Campaign)].cursor()
+
+
+# -------------------------
+# SQLite FTS5
+# -------------------------
+class SQLiteFTSBackend:
+    """Ranks with bm25() over an FTS5 table keyed by campaign id (see migration 0005)."""
+    table = 'core_campaign_fts'
+
+    def _match_expression(self, terms):
+        # Quote every term so user input can't inject FTS syntax; the last one is a prefix for typeahead.
+        quoted = ['"%s"' % term.replace('"', '""') for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def index(self, campaigns):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {self.table}(rowid, title, description) VALUES (%s, %s, %s)",
+                [(c.pk, c.title, c.description) for c in campaigns],
+            )
+
+    def remove(self, campaign_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(pk,) for pk in campaign_ids])
+
+    def rebuild(self, batch_size=2000):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {self.table}")
+                cursor.execute(f"INSERT INTO {self.table}(rowid, title, description) SELECT id, title, description FROM core_campaign")
+
+    def count(self, terms):
+        with read_cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {self.table} WHERE {self.table} MATCH %s", [self._match_expression(terms)])
+            return cursor.fetchone()[0]
+
+    def search(self, terms, limit, offset=0):
+        with read_cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY bm25({self.table}, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT}) LIMIT %s OFFSET %s",
+                [self._match_expression(terms), limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+# -------------------------
+# PostgreSQL tsvector
+# -------------------------
+class PostgresSearchBackend:
+    """
+    Queries the weighted tsvector expression covered by the GIN index from migration 0005.
+
+    Postgres maintains the index itself, so index/remove/rebuild have nothing to do.
+    """
+    vector = (
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+    )
+
+    def _tsquery(self, terms):
+        cleaned = [re.sub(r"[^\w]", '', term) for term in terms]
+        cleaned = [term for term in cleaned if term]
+        return ' & '.join(cleaned[:-1] + [cleaned[-1] + ':*']) if cleaned else ''
+
+    def index(self, campaigns):
+        pass
+
+    def remove(self, campaign_ids):
+        pass
+
+    def rebuild(self, batch_size=2000):
+        pass
+
+    def count(self, terms):
+        with read_cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM core_campaign WHERE ({self.vector}) @@ to_tsquery('english', %s)",
+                [self._tsquery(terms)],
+            )
+            return cursor.fetchone()[0]
+
+    def search(self, terms, limit, offset=0):
+        with read_cursor() as cursor:
+            cursor.execute(
+                f"SELECT id FROM core_campaign, to_tsquery('english', %s) query "
+                f"WHERE ({self.vector}) @@ query "
+                f"ORDER BY ts_rank({self.vector}, query) DESC, id DESC LIMIT %s OFFSET %s",
+                [self._tsquery(terms), limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+# -------------------------
+# Pure-Python fallback
+# -------------------------
+class PythonSearchBackend:
+    """
+    In-process inverted index for databases without native full-text search.
+
+    Built lazily from the campaign table on first query and kept current by the
+    Campaign signals. Each process holds its own copy and never sees writes made by
+    another worker or `run_tasks`, so settings only allow it with DEBUG.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = None  # token -> {campaign_id: weighted term frequency}
+        self._vocabulary = []  # sorted tokens, for prefix lookups
+        self._documents = {}   # campaign_id -> tokens it was indexed under
+
+    def _ensure_loaded(self):
+        if self._postings is None:
+            self.rebuild()
+
+    def _add(self, pk, title, description):
+        weights = defaultdict(float)
+        for token in tokenize(title):
+            weights[token] += TITLE_WEIGHT
+        for token in tokenize(description):
+            weights[token] += DESCRIPTION_WEIGHT
+
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._vocabulary, token)
+            postings[pk] = weight
+        self._documents[pk] = tuple(weights)
+
+    def _discard(self, pk):
+        for token in self._documents.pop(pk, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(pk, None)
+
+    def index(self, campaigns):
+        documents = [(c.pk, c.title, c.description) for c in campaigns]
+        transaction.on_commit(lambda: self._index_now(documents))
+
+    def remove(self, campaign_ids):
+        campaign_ids = list(campaign_ids)
+        transaction.on_commit(lambda: self._remove_now(campaign_ids))
+
+    def _index_now(self, documents):
+        with self._lock:
+            if self._postings is None:
+                return  # The lazy load will pick these up
+            for pk, title, description in documents:
+                self._discard(pk)
+                self._add(pk, title, description)
+
+    def _remove_now(self, campaign_ids):
+        with self._lock:
+            if self._postings is not None:
+                for pk in campaign_ids:
+                    self._discard(pk)
+
+    def rebuild(self, batch_size=2000):
+        with self._lock:
+            self._postings, self._vocabulary, self._documents = {}, [], {}
+            rows = Campaign.objects.values_list('pk', 'title', 'description').iterator(chunk_size=batch_size)
+            for pk, title, description in rows:
+                self._add(pk, title, description)
+
+    def _expand(self, term, prefix):
+        if not prefix:
+            return [term] if term in self._postings else []
+        start = bisect.bisect_left(self._vocabulary, term)
+        end = bisect.bisect_left(self._vocabulary, term + '\uffff')
+        return self._vocabulary[start:end]
+
+    def _ranked(self, terms):
+        with self._lock:
+            self._ensure_loaded()
+            total_documents = max(len(self._documents), 1)
+            scores = None
+            for position, term in enumerate(terms):
+                term_scores = defaultdict(float)
+                for token in self._expand(term, prefix=position == len(terms) - 1):
+                    postings = self._postings[token]
+                    idf = math.log(1 + total_documents / (1 + len(postings)))
+                    for pk, weight in postings.items():
+                        term_scores[pk] += weight * idf
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {pk: score + term_scores[pk] for pk, score in scores.items() if pk in term_scores}
+                if not scores:
+                    return []
+            return sorted(scores, key=lambda pk: (-scores[pk], -pk))
+
+    def count(self, terms):
+        return len(self._ranked(terms))
+
+    def search(self, terms, limit, offset=0):
+        return self._ranked(terms)[offset:offset + limit]
+
+
+# -------------------------
+# Legacy substring scan (kept for comparison/benchmarks)
+# -------------------------
+class IContainsSearchBackend:
+    def _queryset(self, terms):
+        query = ' '.join(terms)
+        return Campaign.objects.filter(Q(title__icontains=query) | Q(description__icontains=query))
+
+    def index(self, campaigns):
+        pass
+
+    def remove(self, campaign_ids):
+        pass
+
+    def rebuild(self, batch_size=2000):
+        pass
+
+    def count(self, terms):
+        return self._queryset(terms).count()
+
+    def search(self, terms, limit, offset=0):
+        return list(self._queryset(terms).order_by('-id').values_list('pk', flat=True)[offset:offset + limit])
+
+
+BACKENDS = {
+    'sqlite_fts': SQLiteFTSBackend,
+    'postgres': PostgresSearchBackend,
+    'python': PythonSearchBackend,
+    'icontains': IContainsSearchBackend,
+}
+
+_backends = {}
+
+
+def sqlite_fts_available():
+    """Whether migration 0005 created the FTS5 table; SQLite may be built without FTS5."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SQLiteFTSBackend.table])
+        return cursor.fetchone() is not None
+
+
+def native_backend_name():
+    if connection.vendor == 'sqlite':
+        return 'sqlite_fts' if sqlite_fts_available() else 'icontains'
+    return {'postgresql': 'postgres'}.get(connection.vendor, 'icontains')
+
+
+def get_search_backend(name=None):
+    """
+    Resolves CAMPAIGN_SEARCH_BACKEND; 'auto' picks the native index for the database
+    vendor, or the icontains scan without one. 'auto' is resolved once.
+    """
+    name = name or getattr(settings, 'CAMPAIGN_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        if 'auto' not in _backends:
+            _backends['auto'] = get_search_backend(native_backend_name())
+        return _backends['auto']
+    if name not in _backends:
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+
+def reset_search_backends():
+    """Drops the backend instances (used when settings or the schema change, e.g. in tests)."""
+    _backends.clear()
+
+
+class SearchResults:
+    """
+    Lazy, sliceable result set so DRF's paginator can page through ranked matches.
+
+    The paginator calls count() once and slices one page; only that page's ids are
+    fetched from the index and loaded from the campaign table.
+    """
+
+    def __init__(self, query, queryset, backend=None):
+        self.terms = tokenize(query)
+        self.queryset = queryset
+        self.backend = backend or get_search_backend()
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.terms) if self.terms else 0
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        if not self.terms:
+            return []
+        start = item.start or 0
+        ids = self.backend.search(self.terms, limit=item.stop - start, offset=start)
+        campaigns = self.queryset.in_bulk(ids)
+        return [campaigns[pk] for pk in ids if pk in campaigns]
+
+
+# SIGNAL: Keep the search index in step with campaign writes
+@receiver(post_save, sender=Campaign)
+def index_campaign(sender, instance, **kwargs):
+    get_search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Campaign)
+def unindex_campaign(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
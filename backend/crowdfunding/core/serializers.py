@@ -1,37 +1,282 @@
-from rest_framework import serializers
-from django.db import transaction
-from .models import Campaign, Donation, Comment, Transaction
+import decimal
+from operator import attrgetter
+from django.conf import settings
+from django.db.models.manager import BaseManager
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from .models import COMMENT_MAX_DEPTH, Campaign, Donation, Comment, Transaction
+from .media import thumbnail_urls
+from .metrics import timed
+
+
+class TimedModelSerializer(serializers.ModelSerializer):
+    """Reports validation and representation time to the request metrics as the 'serializer' span."""
+
+    def run_validation(self, data=serializers.empty):
+        with timed('serializer'):
+            return super().run_validation(data)
+
+    def to_representation(self, instance):
+        with timed('serializer'):
+            return super().to_representation(instance)
+
+
+class ThumbnailsField(serializers.ReadOnlyField):
+    """{label: URL} of an image's thumbnails, from its `<field>_thumbnails` column (see core/media.py)."""
+
+    def to_representation(self, value):
+        return thumbnail_urls(value)
+
+
+class CompiledListSerializer(serializers.ListSerializer):
+    """
+    `many=True` path for read-only list serializers.
+
+    The child's fields are resolved once per serializer class into (name, getter,
+    converter) entries, and rows are built from those directly instead of
+    dispatching through every field's get_attribute/to_representation. Output is
+    identical to the regular path; a child with a field type (or option) not
+    handled here simply uses the regular path.
+    """
+    _plans = {}
+
+    def to_representation(self, data):
+        plan = self.get_plan()
+        if plan is None:
+            return super().to_representation(data)
+        iterable = data.all() if isinstance(data, BaseManager) else data
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        fields = [(name, get, make_converter and make_converter(tz)) for name, get, make_converter in plan]
+
+        with timed('serializer'):
+            rows = []
+            for obj in iterable:
+                row = {}
+                for name, get, convert in fields:
+                    value = get(obj)
+                    row[name] = value if convert is None or value is None else convert(value)
+                rows.append(row)
+            return rows
+
+    def get_plan(self):
+        child_class = type(self.child)
+        if child_class not in self._plans:
+            self._plans[child_class] = compile_fields(self.child)
+        return self._plans[child_class]
+
+
+def _getter(source_attrs):
+    if len(source_attrs) == 1:
+        return attrgetter(source_attrs[0])
+
+    def get(obj):
+        for attr in source_attrs:
+            obj = getattr(obj, attr)
+            if obj is None:
+                return None  # As DRF does for a None along the source path
+        return obj
+    return get
+
+
+def _datetime_converter(tz):
+    def convert(value):
+        if tz is not None:
+            value = value.astimezone(tz)
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def _decimal_converter(field):
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    context.prec = field.max_digits
+
+    def make_converter(tz):
+        def convert(value):
+            if not isinstance(value, decimal.Decimal):
+                value = decimal.Decimal(str(value).strip())
+            return f'{value.quantize(exponent, rounding=field.rounding, context=context):f}'
+        return convert
+    return make_converter
+
+
+def _is_plain_datetime(field):
+    """ISO 8601 in the current timezone, the default."""
+    return getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601 and not hasattr(field, 'timezone')
+
+
+def _is_plain_decimal(field):
+    """Quantized and rendered as a string, the default."""
+    return (
+        field.decimal_places is not None and field.max_digits is not None
+        and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        and not field.localize and not field.normalize_output
+    )
+
+
+# Fields whose representation of a non-None model value is the value itself
+PASSTHROUGH_FIELDS = (
+    serializers.IntegerField, serializers.CharField, serializers.BooleanField, serializers.ChoiceField,
+)
+
+
+def compile_fields(serializer):
+    """(name, getter, converter factory) per field of a read-only serializer, or None if it can't be compiled."""
+    plan = []
+    for name, field in serializer.fields.items():
+        if not field.read_only or field.source == '*':
+            return None
+        field_type = type(field)
+        getter = _getter(field.source_attrs)
+        if field_type in PASSTHROUGH_FIELDS:
+            plan.append((name, getter, None))
+        elif field_type is serializers.BigIntegerField and not getattr(
+                field, 'coerce_to_string', api_settings.COERCE_BIGINT_TO_STRING):
+            plan.append((name, getter, None))
+        elif field_type is serializers.PrimaryKeyRelatedField and len(field.source_attrs) == 1 and field.pk_field is None:
+            plan.append((name, attrgetter(f'{field.source}_id'), None))
+        elif field_type is serializers.DateTimeField and _is_plain_datetime(field):
+            plan.append((name, getter, _datetime_converter))
+        elif field_type is serializers.DecimalField and _is_plain_decimal(field):
+            plan.append((name, getter, _decimal_converter(field)))
+        elif field_type is ThumbnailsField:
+            plan.append((name, getter, lambda tz: thumbnail_urls))
+        else:
+            return None
+    return plan
+
 
 # Serializer for Campaigns
-class CampaignSerializer(serializers.ModelSerializer):
+class CampaignSerializer(TimedModelSerializer):
+    # Maintained by the donation ledger, never written by clients
+    raised_amount = serializers.DecimalField(source='total_raised', max_digits=12, decimal_places=2, read_only=True)
+    cover_image_thumbnails = ThumbnailsField()
+
     class Meta:
         model = Campaign
         fields = '__all__'
 
 
+# Compact Campaign representation for list pages (no description)
+class CampaignListSerializer(TimedModelSerializer):
+    raised_amount = serializers.DecimalField(source='total_raised', max_digits=12, decimal_places=2, read_only=True)
+    creator_username = serializers.CharField(source='creator.username', read_only=True)
+    cover_image_thumbnails = ThumbnailsField()
+
+    class Meta:
+        model = Campaign
+        fields = [
+            'id', 'title', 'goal_amount', 'raised_amount', 'created_at', 'creator', 'creator_username',
+            'cover_image_thumbnails', 'comment_count',
+        ]
+        read_only_fields = fields
+        list_serializer_class = CompiledListSerializer
+
+
 # Serializer for Donations
-class DonationSerializer(serializers.ModelSerializer):
+class DonationSerializer(TimedModelSerializer):
     class Meta:
         model = Donation
         fields = '__all__'
-    
+        read_only_fields = ['settled']  # Set by the settle task once the Transaction and totals are written
+
+
+# Compact Donation representation for list pages
+class DonationListSerializer(TimedModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+    campaign_title = serializers.CharField(source='campaign.title', read_only=True)
+    avatar = ThumbnailsField(source='user.profile_picture_thumbnails')
+
+    class Meta:
+        model = Donation
+        fields = ['id', 'amount', 'created_at', 'user', 'username', 'avatar', 'campaign', 'campaign_title']
+        read_only_fields = fields
+        list_serializer_class = CompiledListSerializer
+
+
+class DonationBatchSerializer(serializers.ListSerializer):
+    """
+    `many=True` path for batched donations. An invalid item doesn't fail the batch:
+    it is kept in `validated_data` as `{'errors': ...}` so every item gets a result,
+    and `create` writes the valid ones together (see core.transfer.create_donations).
+    """
+
+    def run_child_validation(self, data):
+        try:
+            return super().run_child_validation(data)
+        except serializers.ValidationError as exc:
+            return {'errors': exc.detail}
+
     def create(self, validated_data):
-        with transaction.atomic():  # Ensure data integrity
-            donation = super().create(validated_data)
-            campaign = donation.campaign
-            campaign.raised_amount += donation.amount  # Correct field update
-            campaign.save()
-        return donation
+        from .transfer import create_donations
+
+        return create_donations(validated_data, default_user_id=self.context['request'].user.pk)
+
+
+# One item of a batched donation request; users and campaigns are checked for the whole batch at once
+class DonationBatchItemSerializer(serializers.Serializer):
+    user = serializers.IntegerField(min_value=1, required=False)  # Defaults to the requesting user; others need staff
+    campaign = serializers.IntegerField(min_value=1)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=decimal.Decimal('0.01'))
+
+    class Meta:
+        list_serializer_class = DonationBatchSerializer
+
+    def validate_user(self, value):
+        # Only staff record donations on behalf of other users (e.g. offline ones)
+        user = self.context['request'].user
+        if value != user.pk and not user.is_staff:
+            raise serializers.ValidationError("You can only donate as yourself.")
+        return value
+
 
 # Serializer for Comments
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedModelSerializer):
+    depth = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = Comment
         fields = '__all__'
 
+    def validate(self, attrs):
+        parent = attrs.get('parent', self.instance.parent if self.instance else None)
+        campaign = attrs.get('campaign', self.instance.campaign if self.instance else None)
+        if self.instance and (parent != self.instance.parent or campaign != self.instance.campaign):
+            raise serializers.ValidationError("A comment can't be moved to another thread or campaign.")
+        if parent is not None and parent.campaign_id != campaign.pk:
+            raise serializers.ValidationError({'parent': "The parent comment belongs to another campaign."})
+        if parent is not None and parent.depth >= COMMENT_MAX_DEPTH:
+            raise serializers.ValidationError({'parent': f"Replies nest at most {COMMENT_MAX_DEPTH} levels deep."})
+        return attrs
+
+
+# Compact Comment representation for list pages
+class CommentListSerializer(TimedModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+    depth = serializers.IntegerField(read_only=True)
+    avatar = ThumbnailsField(source='user.profile_picture_thumbnails')
+
+    class Meta:
+        model = Comment
+        fields = ['id', 'text', 'created_at', 'user', 'username', 'avatar', 'campaign', 'parent', 'depth', 'reply_count']
+        read_only_fields = fields
+        list_serializer_class = CompiledListSerializer
+
 
 # Serializer for Transactions
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(TimedModelSerializer):
     class Meta:
         model = Transaction
         fields = '__all__'
+        read_only_fields = ['reference']
+
+
+# Compact Transaction representation for list pages
+class TransactionListSerializer(TimedModelSerializer):
+    class Meta:
+        model = Transaction
+        fields = ['id', 'amount', 'transaction_type', 'status', 'created_at', 'donation']
+        read_only_fields = fields
+        list_serializer_class = CompiledListSerializer
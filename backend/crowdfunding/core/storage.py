@@ -0,0 +1,102 @@
+"""
+Content-addressed storage for uploaded images.
+
+Files are named after the SHA-256 of their content (`profile_pics/3f/3fa9...e1.jpg`),
+so a picture uploaded twice is stored once and a stored name never changes meaning,
+which lets CDNs and browsers cache media forever. The bytes themselves go to a
+pluggable backend: any Django Storage, 'local' being MEDIA_ROOT on disk.
+"""
+import hashlib
+import os
+import threading
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+
+
+def get_setting(name, default):
+    return getattr(settings, 'MEDIA_PIPELINE', {}).get(name, default)
+
+
+def local_backend():
+    # Identical names mean identical content, so overwriting is always safe
+    return FileSystemStorage(allow_overwrite=True)
+
+
+BACKENDS = {
+    'local': local_backend,
+}
+
+
+@deconstructible
+class ContentAddressedStorage(Storage):
+    """Stores uploads under their content hash, reading them chunk by chunk; other calls go to the backend."""
+
+    def __init__(self, backend=None):
+        self._backend = backend
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            name = get_setting('BACKEND', 'local')
+            self._backend = (BACKENDS.get(name) or import_string(name))()
+        return self._backend
+
+    def get_available_name(self, name, max_length=None):
+        return name  # _save picks the final name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():  # Temporary uploads are read from disk, never held whole
+            digest.update(chunk)
+        digest = digest.hexdigest()
+
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, digest[:2], f"{digest}{extension}")
+        if not self.backend.exists(name):
+            content.seek(0)
+            name = self.backend.save(name, content)
+        return name
+
+    def _open(self, name, mode='rb'):
+        return self.backend.open(name, mode)
+
+    def delete(self, name):
+        # Other rows may hold the same content; unreferenced files are left for a sweep
+        pass
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_image_storage():
+    """The process-wide image storage; model fields take this callable as their `storage`."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = ContentAddressedStorage()
+    return _storage
+
+
+def validate_image_size(file):
+    max_bytes = get_setting('MAX_UPLOAD_BYTES', 10 * 1024 * 1024)
+    if file.size > max_bytes:
+        raise ValidationError(f"Images may be at most {max_bytes // (1024 * 1024)} MB.")
@@ -0,0 +1,386 @@
+"""
+Live campaign progress over Server-Sent Events and WebSockets (ASGI only).
+
+Writers publish small "campaign N changed" messages to a broker once their
+transaction commits. Each ASGI worker runs one hub on its event loop that
+listens to the broker and fans events out to the clients watching a campaign.
+Messages are coalesced to at most MAX_UPDATES_PER_SECOND flushes per campaign,
+and a flush reads the campaign once however many clients watch it.
+
+The 'local' broker only reaches watchers in the process that wrote; with
+several workers use 'redis', so every worker's hub sees every write.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import re
+import threading
+from collections import defaultdict
+from contextlib import suppress
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from .models import Campaign, Comment
+from .serializers import CommentListSerializer
+
+logger = logging.getLogger(__name__)
+
+# Ends a watcher's stream (it fell too far behind and should reconnect)
+CLOSED = object()
+
+WEBSOCKET_PATH = re.compile(r'^/ws/campaigns/(?P<pk>\d+)/$')
+
+
+def get_setting(name, default):
+    return getattr(settings, 'CAMPAIGN_STREAMS', {}).get(name, default)
+
+
+# -------------------------
+# Brokers
+# -------------------------
+class LocalBroker:
+    """Delivers messages to subscribers in this process."""
+
+    def __init__(self, **kwargs):
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def publish(self, message):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            callback(message)
+
+    def subscribe(self, callback):
+        """Calls `callback(message)` for every published message; returns a function that unsubscribes."""
+        with self.lock:
+            self.subscribers.append(callback)
+
+        def unsubscribe():
+            with self.lock:
+                self.subscribers.remove(callback)
+        return unsubscribe
+
+
+class RedisBroker:
+    """Redis pub/sub, so every worker sees writes from any worker; works with any Redis-protocol server."""
+
+    def __init__(self, location='redis://localhost:6379/0', channel='cf-campaign-events', **kwargs):
+        import redis  # Optional dependency, only needed when this broker is configured
+
+        self.client = redis.Redis.from_url(location)
+        self.channel = channel
+
+    def publish(self, message):
+        self.client.publish(self.channel, json.dumps(message))
+
+    def subscribe(self, callback):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: lambda raw: callback(json.loads(raw['data']))})
+        return pubsub.run_in_thread(sleep_time=1, daemon=True).stop
+
+
+BROKERS = {
+    'local': LocalBroker,
+    'redis': RedisBroker,
+}
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = get_setting('BROKER', 'local')
+                broker_class = BROKERS.get(backend) or import_string(backend)
+                _broker = broker_class(location=get_setting('LOCATION', 'redis://localhost:6379/0'))
+    return _broker
+
+
+def reset_broker():
+    global _broker, _hub
+    _broker = None
+    _hub = None
+
+
+# -------------------------
+# Publishing
+# -------------------------
+def _publish(messages):
+    try:
+        broker = get_broker()
+        for message in messages:
+            broker.publish(message)
+    except Exception:
+        # The write has committed; a lost notification only delays watchers until the next one
+        logger.exception("Could not publish campaign stream messages")
+
+
+def publish_progress(campaign_ids):
+    """Announces changed totals of `campaign_ids` once the current transaction commits."""
+    messages = [{'type': 'progress', 'campaign': pk} for pk in campaign_ids]
+    if messages and get_setting('ENABLED', True):
+        transaction.on_commit(lambda: _publish(messages))
+
+
+# SIGNAL: Announce new comments to the campaign's watchers
+@receiver(post_save, sender=Comment)
+def publish_new_comment(sender, instance, created, **kwargs):
+    if created and get_setting('ENABLED', True):
+        message = {'type': 'comment', 'campaign': instance.campaign_id, 'comment': instance.pk}
+        transaction.on_commit(lambda: _publish([message]))
+
+
+# -------------------------
+# Events
+# -------------------------
+def load_progress(campaign_id):
+    """The campaign's progress event, or None if it doesn't exist."""
+    row = (
+        Campaign.objects.with_raised_totals().filter(pk=campaign_id)
+        .values('raised_amount', 'shard_total', 'goal_amount', 'stats__donor_count')
+        .first()
+    )
+    if row is None:
+        return None
+    return {
+        'type': 'progress',
+        'campaign': campaign_id,
+        'raised_amount': str(row['raised_amount'] + row['shard_total']),
+        'goal_amount': str(row['goal_amount']),
+        'donor_count': row['stats__donor_count'] or 0,
+    }
+
+
+def load_events(campaign_id, progress, comment_ids):
+    """Events for one flush: the new comments, then the current progress."""
+    events = []
+    if comment_ids:
+        comments = (
+            Comment.objects.select_related('user')
+            .filter(campaign_id=campaign_id, pk__in=comment_ids)
+            .order_by('created_at', 'id')
+        )
+        events += [{'type': 'comment', 'campaign': campaign_id, 'comment': data}
+                   for data in CommentListSerializer(comments, many=True).data]
+    if progress:
+        event = load_progress(campaign_id)
+        if event is not None:
+            events.append(event)
+    return events
+
+
+# -------------------------
+# Per-process hub
+# -------------------------
+class CampaignHub:
+    """Fans broker messages out to this process's watchers; lives on the ASGI event loop."""
+
+    def __init__(self, loop, broker, max_updates_per_second=2, queue_size=100):
+        self.loop = loop
+        self.interval = 1 / max_updates_per_second
+        self.queue_size = queue_size
+        self.watchers = defaultdict(set)  # Campaign id -> one queue per client
+        self.pending = {}  # Campaign id -> what changed since the last flush
+        self.last_flush = {}
+        self.snapshots = {}  # Latest progress event of watched campaigns, for new clients
+        self.loading = {}
+        self.unsubscribe = broker.subscribe(self.notify)
+
+    def close(self):
+        self.unsubscribe()
+
+    def notify(self, message):
+        """Broker callback; may run on any thread."""
+        with suppress(RuntimeError):  # Event loop already closed
+            # A fresh context: the publisher's (e.g. a sync_to_async thread's) must not leak into hub tasks
+            self.loop.call_soon_threadsafe(self._receive, message, context=contextvars.Context())
+
+    def _receive(self, message):
+        campaign_id = message['campaign']
+        if campaign_id not in self.watchers:
+            return  # Nobody here watches it, nothing to read
+        scheduled = campaign_id in self.pending
+        pending = self.pending.setdefault(campaign_id, {'progress': False, 'comments': []})
+        if message['type'] == 'comment':
+            pending['comments'].append(message['comment'])
+        else:
+            pending['progress'] = True
+        if not scheduled:
+            delay = self.last_flush.get(campaign_id, float('-inf')) + self.interval - self.loop.time()
+            self.loop.call_later(max(delay, 0), lambda: self.loop.create_task(self._flush(campaign_id)))
+
+    async def _flush(self, campaign_id):
+        pending = self.pending.pop(campaign_id)
+        self.last_flush[campaign_id] = self.loop.time()
+        if campaign_id not in self.watchers:
+            return
+        try:
+            events = await sync_to_async(load_events)(campaign_id, pending['progress'], pending['comments'])
+        except Exception:
+            logger.exception("Could not load stream events for campaign %s", campaign_id)
+            return
+        for event in events:
+            if event['type'] == 'progress' and campaign_id in self.watchers:
+                self.snapshots[campaign_id] = event
+            self._broadcast(campaign_id, event)
+
+    def _broadcast(self, campaign_id, event):
+        for queue in list(self.watchers.get(campaign_id, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # This client is far behind; it reconnects and starts from a fresh snapshot
+                self._unwatch(campaign_id, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(CLOSED)
+
+    def _unwatch(self, campaign_id, queue):
+        watchers = self.watchers.get(campaign_id)
+        if watchers is None:
+            return
+        watchers.discard(queue)
+        if not watchers:
+            del self.watchers[campaign_id]
+            self.snapshots.pop(campaign_id, None)
+            self.last_flush.pop(campaign_id, None)
+
+    async def _snapshot(self, campaign_id):
+        snapshot = self.snapshots.get(campaign_id)
+        if snapshot is not None:
+            return snapshot
+        # Clients connecting together share one read
+        task = self.loading.get(campaign_id)
+        if task is None:
+            task = self.loading[campaign_id] = self.loop.create_task(sync_to_async(load_progress)(campaign_id))
+            task.add_done_callback(lambda _: self.loading.pop(campaign_id, None))
+        snapshot = await asyncio.shield(task)
+        if snapshot is not None and campaign_id in self.watchers:
+            snapshot = self.snapshots.setdefault(campaign_id, snapshot)
+        return snapshot
+
+    async def watch(self, campaign_id, heartbeat=None):
+        """
+        Yields one client's events, starting with the current progress. Yields
+        None after `heartbeat` idle seconds so the caller can send a keep-alive.
+        """
+        queue = asyncio.Queue(self.queue_size)
+        self.watchers[campaign_id].add(queue)
+        try:
+            snapshot = await self._snapshot(campaign_id)
+            if snapshot is not None:
+                yield snapshot
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    event = None
+                if event is CLOSED:
+                    return
+                yield event
+        finally:
+            self._unwatch(campaign_id, queue)
+
+
+_hub = None
+
+
+def get_hub():
+    """The hub of the running event loop, created on first use."""
+    global _hub
+    loop = asyncio.get_running_loop()
+    if _hub is None or _hub.loop is not loop:
+        if _hub is not None:
+            _hub.close()
+        _hub = CampaignHub(
+            loop, get_broker(),
+            max_updates_per_second=get_setting('MAX_UPDATES_PER_SECOND', 2),
+            queue_size=get_setting('QUEUE_SIZE', 100),
+        )
+    return _hub
+
+
+# -------------------------
+# Endpoints
+# -------------------------
+def _encode(event):
+    return json.dumps(event, separators=(',', ':'))
+
+
+async def campaign_events(request, pk):
+    """Server-Sent Events stream of a campaign's progress and new comments."""
+    if not get_setting('ENABLED', True):
+        return JsonResponse({'detail': 'Campaign streams are disabled.'}, status=404)
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the response would hold a worker thread per client
+        return JsonResponse({'detail': 'Campaign streams need an ASGI server (crowdfunding.asgi).'}, status=501)
+    if not await Campaign.objects.filter(pk=pk).aexists():
+        return JsonResponse({'detail': 'No Campaign matches the given query.'}, status=404)
+
+    events = get_hub().watch(pk, heartbeat=get_setting('HEARTBEAT_SECONDS', 15))
+
+    async def stream():
+        yield 'retry: 5000\n\n'  # Client reconnect delay in ms
+        async for event in events:
+            if event is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield f"event: {event['type']}\ndata: {_encode(event)}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+
+async def websocket_application(scope, receive, send):
+    """
+    ASGI WebSocket endpoint at /ws/campaigns/<id>/, sending the same events as
+    `campaign_events` as JSON text frames. Mounted by crowdfunding.asgi.
+    """
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    match = WEBSOCKET_PATH.match(scope['path'])
+    pk = int(match['pk']) if match else None
+    if pk is None or not get_setting('ENABLED', True) or not await Campaign.objects.filter(pk=pk).aexists():
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    await send({'type': 'websocket.accept'})
+
+    async def wait_for_disconnect():
+        while (await receive())['type'] != 'websocket.disconnect':
+            pass  # Clients don't send anything we act on
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect())
+    events = get_hub().watch(pk, heartbeat=get_setting('HEARTBEAT_SECONDS', 15))
+    next_event = None
+    try:
+        while True:
+            next_event = asyncio.ensure_future(anext(events))
+            await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                return
+            try:
+                event = next_event.result()
+            except StopAsyncIteration:
+                await send({'type': 'websocket.close', 'code': 1013})  # Fell behind, try again
+                return
+            if event is not None:  # WebSocket pings are left to the server
+                await send({'type': 'websocket.send', 'text': _encode(event)})
+    finally:
+        disconnected.cancel()
+        if next_event is not None and not next_event.done():
+            next_event.cancel()  # The generator can only be closed once it's no longer running
+            with suppress(asyncio.CancelledError, StopAsyncIteration):
+                await next_event
+        await events.aclose()
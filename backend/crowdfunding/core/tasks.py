@@ -0,0 +1,37 @@
+from django.db import transaction
+from .background import task
+from .counters import settle_donations, touch_campaigns
+from .models import Donation
+from .rollups import rebuild_campaign_stats, rebuild_user_stats
+
+
+@task
+def settle_campaign_donations(campaign_id):
+    """
+    Settles every unsettled donation of a campaign: one Transaction per donation and
+    a single raised_amount increment. Only the new donations are read, through the
+    partial `donation_unsettled_idx` index, so the cost doesn't grow with the
+    campaign's history.
+    """
+    with transaction.atomic():
+        donations = list(
+            Donation.objects.select_for_update().filter(campaign_id=campaign_id, settled=False).order_by('id')
+        )
+        if not donations:
+            return
+        settle_donations(donations)
+        Donation.objects.filter(pk__in=[d.pk for d in donations]).update(settled=True)
+
+
+@task
+def refresh_campaign_stats(campaign_id):
+    """Recounts one campaign's donation rollups after a donation was edited or deleted."""
+    with transaction.atomic():
+        rebuild_campaign_stats([campaign_id])
+        touch_campaigns([campaign_id])
+
+
+@task
+def refresh_user_stats(user_id):
+    """Recounts one user's transaction rollups after a transaction was edited or deleted."""
+    rebuild_user_stats([user_id])
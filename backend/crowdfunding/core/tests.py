@@ -1,3 +1,1435 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import hmac
+import io
+import json
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction as db_transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers, viewsets
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+from . import (
+    background, benchmarks, counters, db_router, idempotency, leaderboards, metrics, rollups, search, streams, tasks,
+    throttling, transfer, webhooks,
+)
+from .authentication import reset_user_cache
+from .cache import cache_response, get_response_cache
+from .models import (
+    BackgroundTask, CustomUser, Campaign, CampaignCounterShard, CampaignDailyStats, CampaignHourlyStats, CampaignStats,
+    Donation, Comment, IdempotencyKey, PaymentEvent, Transaction, UserTransactionStats,
+)
+from .payments import CircuitBreaker, CircuitOpenError, PayChanguClient
+from .paychangu_stub import StubPayChanguServer
+from .serializers import (
+    CampaignListSerializer, CommentListSerializer, DonationListSerializer, TransactionListSerializer,
+)
+from .write_queue import WriteQueue
 
-# Create your tests here.
+
+class QueryCountAssertionsMixin:
+    """Assertions that catch N+1 queries on list endpoints."""
+
+    def assertQueryCountIndependentOfRows(self, client, url, add_rows, sizes=(1, 10), params=None):
+        """
+        Fails when the number of queries for `url` grows with the number of rows on the page.
+
+        `add_rows(n)` must create n more rows that show up on the first page; the
+        endpoint is requested once per entry in `sizes` and every run must issue the
+        same number of queries.
+        """
+        counts = []
+        created = 0
+        for size in sizes:
+            add_rows(size - created)
+            created = size
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url, params or {})
+            self.assertEqual(response.status_code, 200, response.content)
+            counts.append((size, len(queries), [q['sql'] for q in queries.captured_queries]))
+
+        baseline = counts[0][1]
+        for size, count, statements in counts[1:]:
+            if count != baseline:
+                self.fail(
+                    f"{url} issued {baseline} queries for {sizes[0]} row(s) but {count} for {size}:\n"
+                    + "\n".join(statements)
+                )
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class ListQueryCountTests(QueryCountAssertionsMixin, TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('donor', password='secret')
+        self.campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _add_campaigns(self, n):
+        for i in range(n):
+            creator = CustomUser.objects.create_user(f'creator-{Campaign.objects.count()}-{i}')
+            Campaign.objects.create(title='Clinic', description='Beds', goal_amount=100, creator=creator)
+
+    def _add_donations(self, n):
+        for i in range(n):
+            donor = CustomUser.objects.create_user(f'donor-{Donation.objects.count()}-{i}')
+            campaign = Campaign.objects.create(title='School', description='Books', goal_amount=50, creator=self.user)
+            Donation.objects.create(user=donor, campaign=campaign, amount=5)
+
+    def _add_transactions(self, n):
+        for _ in range(n):
+            Transaction.objects.create(user=self.user, amount=5, status='completed')
+
+    def _add_comments(self, n):
+        for i in range(n):
+            author = CustomUser.objects.create_user(f'author-{Comment.objects.count()}-{i}')
+            Comment.objects.create(user=author, campaign=self.campaign, text='Good luck')
+
+    def test_campaign_list(self):
+        self.assertQueryCountIndependentOfRows(self.client, '/api/v1/campaigns/', self._add_campaigns)
+
+    def test_campaign_search(self):
+        self.assertQueryCountIndependentOfRows(self.client, '/api/v1/campaigns/search/', self._add_campaigns, params={'q': 'clin'})
+
+    def test_donation_list(self):
+        self.assertQueryCountIndependentOfRows(self.client, '/api/v1/donations/', self._add_donations)
+
+    def test_transaction_list(self):
+        self.assertQueryCountIndependentOfRows(self.client, '/api/v1/transactions/', self._add_transactions)
+
+    def test_comment_list(self):
+        self.assertQueryCountIndependentOfRows(self.client, '/api/v1/comments/', self._add_comments)
+
+    def test_compact_list_fields(self):
+        self._add_donations(1)
+        donation = self.client.get('/api/v1/donations/').json()['results'][0]
+        self.assertEqual(donation['username'], Donation.objects.get().user.username)
+        self.assertEqual(donation['campaign_title'], 'School')
+        self.assertNotIn('description', self.client.get('/api/v1/campaigns/').json()['results'][0])
+
+
+class PayChanguClientTests(SimpleTestCase):
+    def setUp(self):
+        self.stub = StubPayChanguServer().__enter__()
+        self.addCleanup(self.stub.__exit__, None, None, None)
+        self.client = PayChanguClient(
+            base_url=self.stub.url, secret_key='test', max_retries=2, backoff_base=0.001,
+            breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60),
+        )
+        self.addCleanup(self.client.close)
+
+    def test_retries_transient_gateway_errors(self):
+        self.stub.fail_next = 2
+        response = self.client.initiate_payment(amount=100, currency='MWK')
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(self.stub.requests, 3)
+
+    def test_async_initiate_payment(self):
+        response = asyncio.run(self.client.ainitiate_payment(amount=100, currency='MWK'))
+        self.assertEqual(response['data']['amount'], 100)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        self.stub.failure_rate = 1.0
+        self.assertIn('error', self.client.initiate_payment(amount=1))
+        self.assertIn('error', self.client.initiate_payment(amount=1))
+        requests_before = self.stub.requests
+        with self.assertRaises(CircuitOpenError):
+            self.client.initiate_payment(amount=1)
+        self.assertEqual(self.stub.requests, requests_before)
+
+    def test_cancelled_half_open_trial_reopens_the_circuit(self):
+        breaker = self.client.breaker
+        breaker.opened_at = time.monotonic() - 61  # Half-open: the next call is the trial
+        self.stub.latency = 5
+
+        async def cancel_trial():
+            call = asyncio.ensure_future(self.client.ainitiate_payment(amount=1))
+            await asyncio.sleep(0.2)
+            call.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await call
+
+        asyncio.run(cancel_trial())
+        self.assertEqual((breaker.state, breaker.trial_in_flight), ('open', False))
+
+        breaker.opened_at = time.monotonic() - 61
+        self.stub.latency = 0
+        self.assertEqual(self.client.initiate_payment(amount=1)['status'], 'success')
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_async_clients_close_with_their_event_loop(self):
+        clients = []
+        for _ in range(2):
+            asyncio.run(self.client.ainitiate_payment(amount=100))
+            clients.append(self.client._async_state[1])
+        self.assertIsNot(clients[0], clients[1])
+        self.assertTrue(all(client.is_closed for client in clients))
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class BenchmarkSuiteTests(TestCase):
+    def test_suite_runs_every_scenario(self):
+        data = benchmarks.seed(benchmarks.SCALES['tiny'], donations_needed=10 + benchmarks.WARMUP)
+        report = benchmarks.run_suite(benchmarks.InProcessDriver(data), requests=10)
+        self.assertEqual(set(report['scenarios']), set(benchmarks.SCENARIOS))
+        for name, metrics in report['scenarios'].items():
+            self.assertEqual(metrics['errors'], 0, name)
+            self.assertLessEqual(metrics['p50_ms'], metrics['p99_ms'])
+        self.assertEqual(benchmarks.compare(report, report), [])
+
+    def test_command_measures_requests_beyond_the_rate_limits(self):
+        throttling.reset_bucket_store()
+        self.addCleanup(throttling.reset_bucket_store)
+        requests = 70  # More than RATE_LIMITS allows one client per minute for donation.create
+        with tempfile.NamedTemporaryFile(suffix='.json') as baseline:
+            call_command(
+                'benchmark_api', scale='tiny', requests=requests, scenarios=['donation_create'],
+                save_baseline=baseline.name, stdout=io.StringIO(),
+            )
+            report = benchmarks.load_baseline(baseline.name)
+        self.assertEqual(report['scenarios']['donation_create']['errors'], 0)
+
+    def test_compare_flags_regressions(self):
+        before = {'requests': 10, 'errors': 0, 'throughput': 100.0, 'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 30.0, 'queries': 3}
+        after = dict(before, p95_ms=40.0, throughput=50.0, queries=4)
+        regressions = benchmarks.compare({'scenarios': {'campaign_list': before}}, {'scenarios': {'campaign_list': after}})
+        self.assertEqual(len(regressions), 3)
+        noise = dict(before, p50_ms=10.5)  # Within min_delta_ms
+        self.assertEqual(benchmarks.compare({'scenarios': {'x': before}}, {'scenarios': {'x': noise}}), [])
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False}, METRICS={'TOKEN': 'scrape', 'SLOW_REQUEST_MS': 0})
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset_metrics()
+        self.addCleanup(metrics.reset_metrics)
+        user = CustomUser.objects.create_user('owner')
+        Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=user)
+
+    def test_requests_are_exposed_in_prometheus_format(self):
+        with self.assertLogs('core.metrics.slow', 'WARNING') as slow_log:
+            self.client.get('/api/v1/campaigns/')
+        self.assertIn('SELECT', slow_log.output[0])
+
+        body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').content.decode()
+        self.assertIn('http_requests_total{view="campaign-list",method="GET",status="200"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{view="campaign-list",method="GET"} 1', body)
+        self.assertIn('http_request_span_duration_seconds_count{view="campaign-list",span="serializer"} 1', body)
+        self.assertRegex(body, r'http_request_db_queries_sum\{view="campaign-list"\} [1-9]')
+
+    def test_scrape_requires_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        reset_user_cache()
+        self.addCleanup(reset_user_cache)
+        self.user = CustomUser.objects.create_user('donor', password='secret')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def test_user_lookup_is_cached(self):
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.client.get('/api/v1/transactions/').status_code, 200)
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.client.get('/api/v1/transactions/').status_code, 200)
+        self.assertEqual(len(second), len(first) - 1)
+        self.assertFalse(any('django_session' in q['sql'] for q in second.captured_queries))
+
+    def test_deactivation_invalidates_cache(self):
+        self.client.get('/api/v1/transactions/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/v1/transactions/').status_code, 401)
+
+
+class CampaignStreamTests(TestCase):
+    def setUp(self):
+        streams.reset_broker()
+        self.addCleanup(streams.reset_broker)
+        user = CustomUser.objects.create_user('owner')
+        self.campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=user)
+
+    async def test_sse_stream_starts_with_current_progress(self):
+        response = await self.async_client.get(f'/api/v1/campaigns/{self.campaign.pk}/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.streaming_content
+        self.assertEqual(await anext(content), b'retry: 5000\n\n')
+        event = await anext(content)
+        self.assertTrue(event.startswith(b'event: progress\n'))
+        self.assertIn(b'"raised_amount":"0.00"', event)
+
+    async def test_updates_are_coalesced_into_one_read(self):
+        hub = streams.get_hub()
+        watchers = [hub.watch(self.campaign.pk) for _ in range(3)]
+        for watcher in watchers:
+            await anext(watcher)  # Snapshot
+        with mock.patch.object(streams, 'load_events', wraps=streams.load_events) as load_events:
+            for _ in range(10):
+                hub.notify({'type': 'progress', 'campaign': self.campaign.pk})
+            events = [await asyncio.wait_for(anext(watcher), 1) for watcher in watchers]
+        load_events.assert_called_once()
+        self.assertEqual({event['type'] for event in events}, {'progress'})
+        for watcher in watchers:
+            await watcher.aclose()
+        self.assertEqual(hub.watchers, {})
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('owner')
+        self.campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=self.user)
+        self.url = f'/api/v1/campaigns/{self.campaign.pk}/'
+
+    def test_unchanged_campaign_answers_304_without_serializing(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(len(queries), 1)  # Just the validator
+
+    def test_comment_changes_the_feed_validator(self):
+        feed = f'/api/v1/comments/?campaign_id={self.campaign.pk}'
+        etag = self.client.get(feed)['ETag']
+        self.assertEqual(self.client.get(feed, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Comment.objects.create(user=self.user, campaign=self.campaign, text='Great cause')
+        response = self.client.get(feed, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unfiltered_feed_skips_the_validator(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/comments/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertFalse(any('MAX(' in q['sql'] for q in queries.captured_queries))
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        leaderboards.reset_store()
+        self.addCleanup(leaderboards.reset_store)
+        self.owner = CustomUser.objects.create_user('owner')
+        self.water = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=self.owner)
+        self.school = Campaign.objects.create(title='School', description='Roof', goal_amount=1000, creator=self.owner)
+
+    def donate(self, user, campaign, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            counters.record_donations([Donation(user=user, campaign=campaign, amount=amount)])
+
+    def test_boards_follow_settled_donations_without_a_rebuild(self):
+        self.assertEqual(self.client.get('/api/v1/campaigns/most-funded/').json(), {'results': []})  # Builds the boards
+        donor = CustomUser.objects.create_user('donor')
+        self.donate(donor, self.water, '60.00')
+        self.donate(self.owner, self.school, '200.00')
+        with mock.patch.object(leaderboards, 'rebuild') as rebuild:
+            funded = self.client.get('/api/v1/campaigns/most-funded/').json()['results']
+            closest = self.client.get('/api/v1/campaigns/closest-to-goal/').json()['results']
+            trending = self.client.get('/api/v1/campaigns/trending/?limit=1').json()['results']
+        rebuild.assert_not_called()
+        self.assertEqual([(c['id'], c['score']) for c in funded], [(self.school.pk, 200.0), (self.water.pk, 60.0)])
+        self.assertEqual([(c['id'], c['score']) for c in closest], [(self.water.pk, 0.6), (self.school.pk, 0.2)])
+        self.assertEqual([c['id'] for c in trending], [self.school.pk])
+        self.assertAlmostEqual(trending[0]['score'], 200.0, places=2)
+
+        self.donate(self.owner, self.water, '50.00')  # Past the goal
+        closest = self.client.get('/api/v1/campaigns/closest-to-goal/').json()['results']
+        self.assertEqual([c['id'] for c in closest], [self.school.pk])
+        donors = self.client.get(f'/api/v1/campaigns/{self.water.pk}/top-donors/').json()['results']
+        self.assertEqual(donors, [
+            {'user': donor.pk, 'username': 'donor', 'total_donated': '60.00'},
+            {'user': self.owner.pk, 'username': 'owner', 'total_donated': '50.00'},
+        ])
+
+
+class DonationBatchTests(TestCase):
+    def test_batch_reports_each_item_and_settles_in_bulk(self):
+        partner = CustomUser.objects.create_user('partner', is_staff=True)  # May donate on behalf of others
+        donor = CustomUser.objects.create_user('donor')
+        campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=partner)
+        existing = Donation.objects.create(user=partner, campaign=campaign, amount='5.00')
+        client = APIClient()
+        client.force_authenticate(partner)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post('/api/v1/donations/batch/', [
+                {'user': donor.pk, 'campaign': campaign.pk, 'amount': '10.00'},
+                {'campaign': campaign.pk, 'amount': '1.00'},
+                {'user': donor.pk, 'campaign': campaign.pk, 'amount': '2.00'},
+                {'user': donor.pk, 'campaign': campaign.pk + 1, 'amount': '2.00'},
+                {'user': donor.pk, 'campaign': campaign.pk, 'amount': '-1'},
+            ], format='json')
+        self.assertEqual(response.status_code, 207, response.content)
+        body = response.json()
+        self.assertEqual((body['created'], body['conflict'], body['invalid']), (1, 2, 2))
+        results = body['results']
+        self.assertEqual(results[0]['status'], 'created')
+        self.assertEqual(results[1]['donation'], existing.pk)
+        self.assertEqual(results[2]['duplicate_of'], 0)
+        self.assertIn('campaign', results[3]['errors'])
+        self.assertIn('amount', results[4]['errors'])
+        self.assertLess(len(queries), 25)
+
+        self.assertEqual(Transaction.objects.filter(donation_id=results[0]['id'], status='completed').count(), 1)
+        self.assertEqual(Campaign.objects.get(pk=campaign.pk).raised_amount, 10)  # The unsettled one is still queued
+
+    def test_non_staff_cannot_donate_as_someone_else(self):
+        user = CustomUser.objects.create_user('user')
+        victim = CustomUser.objects.create_user('victim')
+        campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=victim)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.post('/api/v1/donations/batch/', [
+            {'user': victim.pk, 'campaign': campaign.pk, 'amount': '10.00'},
+            {'user': user.pk, 'campaign': campaign.pk, 'amount': '1.00'},
+        ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([r['status'] for r in response.json()['results']], ['invalid', 'created'])
+        self.assertIn('user', response.json()['results'][0]['errors'])
+        self.assertEqual(list(Donation.objects.values_list('user', flat=True)), [user.pk])
+
+
+@override_settings(BACKGROUND_TASKS={'EXECUTOR': 'immediate'})
+class DonationSettlementTests(TestCase):
+    def test_clients_cannot_mark_a_donation_settled(self):
+        donor = CustomUser.objects.create_user('donor')
+        campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=donor)
+        client = APIClient()
+        client.force_authenticate(donor)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/v1/donations/', {
+                'user': donor.pk, 'campaign': campaign.pk, 'amount': '10.00', 'settled': True,
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertFalse(response.json()['settled'])
+
+        # The settle task still ran: one Transaction, the total moved, the flag set by the task
+        donation = Donation.objects.get()
+        campaign.refresh_from_db()
+        self.assertTrue(donation.settled)
+        self.assertEqual(campaign.raised_amount, Decimal('10.00'))
+        self.assertEqual(Transaction.objects.filter(donation=donation).count(), 1)
+
+        Donation.objects.filter(pk=donation.pk).update(settled=False)
+        response = client.patch(f'/api/v1/donations/{donation.pk}/', {'settled': True}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(Donation.objects.get().settled)
+
+
+@override_settings(BACKGROUND_TASKS={'EXECUTOR': 'immediate'}, RESPONSE_CACHE={'ENABLED': False})
+class MediaPipelineTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.owner = CustomUser.objects.create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, title, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/campaigns/', {
+                'title': title, 'description': 'Borehole', 'goal_amount': '100.00', 'creator': self.owner.pk,
+                'cover_image': SimpleUploadedFile('cover.JPG', image, content_type='image/jpeg'),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Campaign.objects.get(pk=response.json()['id'])
+
+    def test_covers_are_stored_once_and_listed_as_thumbnails(self):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 900), 'teal').save(buffer, 'JPEG')
+        first = self.upload('Water', buffer.getvalue())
+        second = self.upload('School', buffer.getvalue())
+        self.assertEqual(first.cover_image.name, second.cover_image.name)
+        self.assertTrue(first.cover_image.name.endswith('.jpg'))
+        self.assertEqual(set(first.cover_image_thumbnails), {'card', 'banner'})
+
+        with first.cover_image.storage.open(first.cover_image_thumbnails['card']) as f:
+            self.assertEqual(Image.open(f).size, (480, 270))
+        listed = self.client.get('/api/v1/campaigns/').json()['results'][0]
+        self.assertNotIn('cover_image', listed)
+        self.assertTrue(listed['cover_image_thumbnails']['card'].endswith('-480x270.webp'))
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class CampaignTimeseriesTests(TestCase):
+    def test_buckets_are_cumulative_and_downsampled(self):
+        from datetime import datetime, timezone as dt_timezone
+
+        owner = CustomUser.objects.create_user('owner')
+        campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=owner)
+        donations = [
+            Donation(user=CustomUser.objects.create_user(f'donor{i}'), campaign=campaign, amount='10.00',
+                     created_at=datetime(2026, 3, day, 12, 30, tzinfo=dt_timezone.utc))
+            for i, day in enumerate((1, 2, 2, 9))
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            counters.record_donations(donations)
+        url = f'/api/v1/campaigns/{campaign.pk}/timeseries/'
+
+        daily = self.client.get(url, {'start': '2026-03-02', 'end': '2026-03-09'}).json()
+        self.assertEqual((daily['step'], len(daily['points'])), (1, 8))
+        self.assertEqual(daily['points'][0], {
+            'start': '2026-03-02', 'amount': '20.00', 'donors': 2, 'cumulative_amount': '30.00', 'cumulative_donors': 3,
+        })
+        self.assertEqual(daily['points'][-1]['cumulative_amount'], '40.00')
+
+        weekly = self.client.get(url, {'interval': 'week', 'start': '2026-03-01', 'end': '2026-03-15', 'max_points': 2})
+        self.assertEqual([(p['start'], p['amount']) for p in weekly.json()['points']], [
+            ('2026-02-23', '30.00'), ('2026-03-09', '10.00'),  # Two weeks per point
+        ])
+        hourly = self.client.get(url, {'interval': 'hour', 'start': '2026-03-02T12:00:00Z', 'end': '2026-03-02T13:00Z'})
+        self.assertEqual([p['donors'] for p in hourly.json()['points']], [2, 0])
+        self.assertEqual(self.client.get(url, {'interval': 'minute'}).status_code, 400)
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        throttling.reset_bucket_store()
+        self.addCleanup(throttling.reset_bucket_store)
+        metrics.reset_metrics()
+
+    @override_settings(RATE_LIMITS={'RULES': {'token': {'ip': '3/min'}}})
+    def test_token_bucket_rejects_bursts_with_retry_after(self):
+        statuses = [self.client.post('/api/v1/api/token/', {'username': 'x', 'password': 'y'}).status_code for _ in range(4)]
+        self.assertEqual(statuses, [401, 401, 401, 429])
+        response = self.client.post('/api/v1/api/token/', {'username': 'x', 'password': 'y'})
+        self.assertIn(int(response['Retry-After']), range(15, 21))  # One token back every 20 seconds
+        self.assertIn('http_requests_rejected_total{scope="token",reason="ip"} 2', metrics.render())
+
+    @override_settings(ADMISSION_CONTROL={'MAX_CONCURRENT_REQUESTS': 1, 'QUEUE_SECONDS': 0, 'RETRY_AFTER_SECONDS': 2})
+    def test_admission_control_sheds_requests_beyond_the_limit(self):
+        middleware = throttling.AdmissionControlMiddleware(lambda request: HttpResponse('ok'))
+        request = RequestFactory().get('/api/v1/campaigns/')
+        self.assertEqual(middleware(request).status_code, 200)
+        middleware.slots.acquire()  # A request in flight
+        response = middleware(request)
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '2'))
+
+    def test_shed_responses_carry_cors_headers(self):
+        shed = HttpResponse(status=503)
+        with mock.patch.object(throttling.AdmissionControlMiddleware, '__call__', return_value=shed):
+            response = self.client.get('/api/v1/campaigns/', HTTP_ORIGIN='http://localhost:5173')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Access-Control-Allow-Origin', response)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('donor')
+        self.campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, key, amount='10.00'):
+        return self.client.post(
+            '/api/v1/donations/', {'user': self.user.pk, 'campaign': self.campaign.pk, 'amount': amount},
+            format='json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_is_replayed_without_creating_another_donation(self):
+        first = self.post('retry-1')
+        self.assertEqual(first.status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.post('retry-1')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Donation.objects.count(), 1)
+
+    def test_key_reused_with_another_body_or_in_flight_is_refused(self):
+        self.post('retry-2')
+        self.assertEqual(self.post('retry-2', amount='20.00').status_code, 422)
+        Donation.objects.all().delete()
+        with mock.patch('core.views.viewsets.ModelViewSet.create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.post('retry-3')
+        self.assertEqual(self.post('retry-3').status_code, 201)  # The failed attempt released its key
+
+        body = {'user': self.user.pk, 'campaign': self.campaign.pk, 'amount': '20.00'}
+        IdempotencyKey.objects.create(  # Another worker is still handling it
+            user=self.user, key='retry-4', fingerprint=idempotency.fingerprint('POST', '/api/v1/donations/', body),
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        response = self.post('retry-4', amount='20.00')
+        self.assertEqual((response.status_code, response['Retry-After']), (409, '1'))
+
+
+class ThreadedCommentTests(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = CustomUser.objects.create_user('reader')
+        self.campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def comment(self, text, parent=None):
+        response = self.client.post('/api/v1/comments/', {
+            'user': self.user.pk, 'campaign': self.campaign.pk, 'text': text, 'parent': parent,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def test_threads_load_in_order_and_counts_follow_writes(self):
+        first = self.comment('First')
+        reply = self.comment('Reply', parent=first)
+        self.comment('Nested', parent=reply)
+        self.comment('Second')
+
+        thread = self.client.get(f'/api/v1/comments/{first}/thread/').json()
+        self.assertEqual([(c['text'], c['depth']) for c in thread['results']], [('First', 0), ('Reply', 1), ('Nested', 2)])
+        self.assertEqual(thread['results'][0]['reply_count'], 1)
+        self.assertEqual(Campaign.objects.get().comment_count, 4)
+
+        Comment.objects.get(pk=first).delete()
+        self.assertEqual(Campaign.objects.get().comment_count, 1)
+
+    def test_first_feed_page_is_cached_until_a_new_comment(self):
+        self.comment('First')
+        self.comment('Reply', parent=Comment.objects.get().pk)
+        feed = f'/api/v1/comments/?campaign_id={self.campaign.pk}'
+        visitor = APIClient()
+        self.assertEqual([c['text'] for c in visitor.get(feed).json()['results']], ['First'])
+        with CaptureQueriesContext(connection) as queries:
+            response = visitor.get(feed)
+        self.assertEqual((response['X-Cache'], len(queries)), ('HIT', 1))  # Just the conditional GET validator
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.comment('Second')
+        response = visitor.get(feed)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([c['text'] for c in response.json()['results']], ['Second', 'First'])
+
+    def test_feed_pages_by_number_unless_a_cursor_is_asked_for(self):
+        self.comment('First')
+        feed = f'/api/v1/comments/?campaign_id={self.campaign.pk}'
+        self.assertEqual(self.client.get(feed).json()['count'], 1)
+        page = self.client.get(feed + '&pagination=cursor').json()
+        self.assertNotIn('count', page)
+        self.assertEqual([c['text'] for c in page['results']], ['First'])
+
+
+class CompiledListSerializerTests(TestCase):
+    def test_output_matches_per_field_serializers(self):
+        user = CustomUser.objects.create_user('donor')
+        campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=user)
+        donation = Donation.objects.create(user=user, campaign=campaign, amount='12.50')
+        Transaction.objects.create(user=user, donation=donation, amount='12.50')
+        Transaction.objects.create(user=user, amount='3', transaction_type='withdrawal')
+        Comment.objects.create(user=user, campaign=campaign, text='Great cause')
+
+        cases = [
+            (CampaignListSerializer, Campaign.objects.with_raised_totals().select_related('creator')),
+            (DonationListSerializer, Donation.objects.select_related('user', 'campaign')),
+            (CommentListSerializer, Comment.objects.select_related('user')),
+            (TransactionListSerializer, Transaction.objects.all()),
+        ]
+        for serializer_class, queryset in cases:
+            compiled = serializer_class(queryset, many=True)
+            self.assertIsNotNone(compiled.get_plan(), serializer_class.__name__)
+            expected = serializers.ListSerializer(queryset, child=serializer_class()).data
+            self.assertEqual(compiled.data, expected, serializer_class.__name__)
+
+
+@override_settings(PAYCHANGU_WEBHOOK_SECRET='webhook-secret')
+class PaymentWebhookTests(TestCase):
+    url = '/api/v1/webhooks/paychangu/'
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('payer')
+        self.campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=self.user)
+
+    def deliver(self, status, tx_ref='tx-1', signature=None, user=None):
+        body = json.dumps({'data': {
+            'tx_ref': tx_ref, 'status': status, 'amount': '25.00',
+            'meta': {'user_id': (user or self.user).pk, 'campaign_id': self.campaign.pk},
+        }}).encode()
+        signature = signature or hmac.new(b'webhook-secret', body, hashlib.sha256).hexdigest()
+        return self.client.post(self.url, body, content_type='application/json', HTTP_SIGNATURE=signature)
+
+    def settle(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return webhooks.process_payment_events()
+
+    def test_bad_signature_is_rejected(self):
+        self.assertEqual(self.deliver('success', signature='forged').status_code, 401)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_settlement_credits_the_campaign_once_despite_redeliveries(self):
+        self.assertEqual(self.deliver('success').status_code, 202)
+        self.settle()
+        self.assertEqual(self.deliver('success').status_code, 202)  # Redelivered after settling
+        self.settle()
+
+        self.assertEqual(PaymentEvent.objects.get().status, 'settled')
+        donation = Donation.objects.get()
+        self.assertEqual((donation.amount, donation.settled), (Decimal('25.00'), True))
+        self.assertEqual(Transaction.objects.get().reference, 'tx-1')
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.total_raised, Decimal('25.00'))
+
+    def test_success_after_pending_callback_is_settled(self):
+        self.deliver('pending')
+        self.settle()
+        self.assertEqual(PaymentEvent.objects.get().status, 'ignored')
+
+        self.assertEqual(self.deliver('success').status_code, 202)
+        self.settle()
+        self.assertEqual(PaymentEvent.objects.get().status, 'settled')
+        self.assertEqual(Donation.objects.count(), 1)
+
+        self.deliver('pending')  # A late, out of order callback doesn't reopen the payment
+        self.assertEqual(PaymentEvent.objects.get().status, 'settled')
+
+    def test_paid_second_donation_is_parked_for_refund(self):
+        self.deliver('success')
+        self.deliver('success', tx_ref='tx-2')
+        with self.assertLogs('core.webhooks', 'ERROR'):
+            self.settle()
+        self.assertEqual(
+            dict(PaymentEvent.objects.values_list('reference', 'status')), {'tx-1': 'settled', 'tx-2': 'refund'},
+        )
+        self.assertEqual(Donation.objects.count(), 1)
+
+    def test_event_that_breaks_its_batch_is_parked_alone(self):
+        donors = [CustomUser.objects.create_user(f'donor-{i}') for i in range(3)]
+        for i, donor in enumerate(donors):
+            self.deliver('success', tx_ref=f'tx-{i}', user=donor)
+        broken = PaymentEvent.objects.get(reference='tx-1')
+        parse = webhooks._parse
+
+        def parse_or_crash(event):
+            if event.reference == 'tx-1':
+                raise RuntimeError("unexpected payload")
+            return parse(event)
+
+        with mock.patch.object(webhooks, '_parse', side_effect=parse_or_crash):
+            with self.assertRaises(webhooks.SettlementError) as raised:
+                webhooks.settle_batch()
+            all_events = list(PaymentEvent.objects.order_by('id').values_list('pk', flat=True))
+            self.assertEqual(raised.exception.event_ids, all_events)
+            with self.assertLogs('core.webhooks', 'ERROR'):
+                self.assertEqual(self.settle(), 3)
+
+        self.assertEqual(
+            dict(PaymentEvent.objects.values_list('reference', 'status')),
+            {'tx-0': 'settled', 'tx-1': 'refund', 'tx-2': 'settled'},  # Paid, so it needs a refund
+        )
+        broken.refresh_from_db()
+        self.assertEqual((broken.error, broken.attempts), ("unexpected payload", 1))
+        self.assertEqual(Donation.objects.count(), 2)
+
+
+class CampaignCounterTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user('owner')
+        self.campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=self.owner)
+
+    def raised(self):
+        return Campaign.objects.with_raised_totals().get(pk=self.campaign.pk).total_raised
+
+    def test_increment_without_shards_updates_the_campaign_row(self):
+        counters.increment_raised_amount(self.campaign.pk, Decimal('5.00'))
+        counters.increment_raised_amount(self.campaign.pk, Decimal('2.50'))
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.raised_amount, Decimal('7.50'))
+        self.assertFalse(CampaignCounterShard.objects.exists())
+
+    @override_settings(CAMPAIGN_COUNTER_SHARDS=4)
+    def test_sharded_increments_add_up_and_fold_into_the_campaign(self):
+        for _ in range(20):
+            counters.increment_raised_amount(self.campaign.pk, Decimal('1.25'))
+        self.assertLessEqual(CampaignCounterShard.objects.count(), 4)
+        self.assertEqual(self.raised(), Decimal('25.00'))
+
+        counters.fold_shards([self.campaign.pk])
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.raised_amount, Decimal('25.00'))
+        self.assertFalse(CampaignCounterShard.objects.exists())
+
+    @override_settings(CAMPAIGN_COUNTER_SHARDS=4)
+    def test_sharded_increments_bump_the_version_once_per_batch(self):
+        with CaptureQueriesContext(connection) as queries:
+            counters.increment_raised_amount(self.campaign.pk, Decimal('1.00'))
+        self.assertFalse([q for q in queries if 'UPDATE "core_campaign" ' in q['sql']])  # The hot row is left alone
+
+        other = Campaign.objects.create(title='School', description='Roof', goal_amount=100, creator=self.owner)
+        with CaptureQueriesContext(connection) as queries:
+            counters.apply_raised_deltas({self.campaign.pk: Decimal('2.00'), other.pk: Decimal('3.00')})
+        self.assertEqual(len([q for q in queries if 'UPDATE "core_campaign" ' in q['sql']]), 1)
+        self.assertEqual(
+            dict(Campaign.objects.values_list('pk', 'version')), {self.campaign.pk: 1, other.pk: 1},
+        )
+
+    @override_settings(CAMPAIGN_COUNTER_SHARDS=4)
+    def test_reconcile_rebuilds_totals_from_settled_donations(self):
+        donors = [CustomUser.objects.create_user(f'donor-{i}') for i in range(3)]
+        Donation.objects.bulk_create([
+            Donation(user=donors[0], campaign=self.campaign, amount='10.00', settled=True),
+            Donation(user=donors[1], campaign=self.campaign, amount='5.00', settled=True),
+            Donation(user=donors[2], campaign=self.campaign, amount='99.00'),  # Not settled yet
+        ])
+        Campaign.objects.filter(pk=self.campaign.pk).update(raised_amount='1.00')
+        counters.increment_raised_amount(self.campaign.pk, Decimal('3.00'))  # Drifted shard
+
+        self.assertEqual(counters.reconcile_raised_amounts(), 1)
+        self.assertEqual(self.raised(), Decimal('15.00'))
+        self.assertFalse(CampaignCounterShard.objects.exists())
+        self.assertEqual(counters.reconcile_raised_amounts(), 0)  # Nothing left to correct
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user('owner')
+        self.campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=self.owner)
+        self.donors = [CustomUser.objects.create_user(f'donor-{i}') for i in range(3)]
+
+    def import_rows(self, *rows):
+        lines = ['user,campaign,amount,created_at\n'] + [f'{row}\n' for row in rows]
+        with self.captureOnCommitCallbacks(execute=True):
+            return transfer.import_donations(lines, 'csv')
+
+    def snapshot(self):
+        return (
+            list(CampaignStats.objects.values_list('campaign', 'total_amount', 'donor_count', 'min_amount', 'max_amount')),
+            list(CampaignDailyStats.objects.order_by('day').values_list('day', 'total_amount', 'donation_count')),
+            list(CampaignHourlyStats.objects.order_by('hour').values_list('hour', 'total_amount', 'donation_count')),
+            sorted(UserTransactionStats.objects.values_list('user', 'transaction_type', 'status', 'total_amount', 'count')),
+        )
+
+    def test_settled_donations_fill_the_rollups_like_a_rebuild(self):
+        report = self.import_rows(
+            f'{self.donors[0].pk},{self.campaign.pk},10.00,2025-01-01T10:15:00',  # No offset: read in TIME_ZONE
+            f'{self.donors[1].pk},{self.campaign.pk},30.00,2025-01-01T10:45:00+00:00',
+            f'{self.donors[2].pk},{self.campaign.pk},5.00,2025-01-02T08:00:00+02:00',
+        )
+        self.assertEqual(report.as_dict()['imported'], 3)
+
+        incremental = self.snapshot()
+        campaign_row, daily, hourly, users = incremental
+        self.assertEqual(campaign_row, [(self.campaign.pk, Decimal('45.00'), 3, Decimal('5.00'), Decimal('30.00'))])
+        self.assertEqual(daily, [
+            (date(2025, 1, 1), Decimal('40.00'), 2), (date(2025, 1, 2), Decimal('5.00'), 1),
+        ])
+        self.assertEqual([(hour.isoformat(), count) for hour, _, count in hourly], [
+            ('2025-01-01T10:00:00+00:00', 2), ('2025-01-02T06:00:00+00:00', 1),
+        ])
+        self.assertEqual(len(users), 3)
+
+        rollups.rebuild_campaign_stats()
+        rollups.rebuild_user_stats()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_summaries_read_the_rollups(self):
+        today = timezone.now().replace(microsecond=0).isoformat()
+        self.import_rows(
+            f'{self.donors[0].pk},{self.campaign.pk},10.00,{today}',
+            f'{self.donors[1].pk},{self.campaign.pk},20.00,{today}',
+        )
+        client = APIClient()
+        client.force_authenticate(self.donors[0])
+        summary = client.get(f'/api/v1/donations/summary/{self.campaign.pk}/').json()
+        self.assertEqual(
+            (summary['total_donated'], summary['donor_count'], summary['average_donation'], summary['min_donation']),
+            (30, 2, 15, 10),
+        )
+        self.assertEqual([row['donation_count'] for row in summary['daily']], [2])
+
+        summary = client.get('/api/v1/transactions/summary/').json()
+        self.assertEqual(Decimal(summary['total_transactions']), Decimal('10.00'))
+        self.assertEqual(summary['breakdown'][0]['count'], 1)
+
+
+class DonationTransferTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user('admin', is_staff=True)
+        self.campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=self.admin)
+        self.donors = [CustomUser.objects.create_user(f'donor-{i}') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def post_import(self, *rows):
+        body = 'user,campaign,amount,reference\n' + ''.join(f'{row}\n' for row in rows)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/donations/import/csv/', body, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_rerun_skips_imported_references(self):
+        rows = [f'{donor.pk},{self.campaign.pk},10.00,ref-{i}' for i, donor in enumerate(self.donors[:2])]
+        self.assertEqual(self.post_import(*rows), {'imported': 2, 'skipped': 0, 'failed': 0, 'errors': []})
+        self.assertEqual(self.post_import(*rows), {'imported': 0, 'skipped': 2, 'failed': 0, 'errors': []})
+
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.raised_amount, Decimal('20.00'))
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(CampaignStats.objects.get().donor_count, 2)
+
+    def test_totals_and_rollups_move_once_per_chunk(self):
+        lines = ['user,campaign,amount\n'] + [f'{donor.pk},{self.campaign.pk},{i + 1}.00\n' for i, donor in enumerate(self.donors)]
+        with mock.patch.object(counters, 'apply_raised_deltas', wraps=counters.apply_raised_deltas) as raised, \
+                mock.patch.object(counters, 'apply_donations', wraps=counters.apply_donations) as stats:
+            report = transfer.import_donations(lines, 'csv', chunk_size=2)
+
+        self.assertEqual(report.imported, 3)
+        self.assertEqual((raised.call_count, stats.call_count), (2, 2))
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.raised_amount, Decimal('6.00'))
+        stats_row = CampaignStats.objects.get()
+        self.assertEqual((stats_row.total_amount, stats_row.donor_count), (Decimal('6.00'), 3))
+
+    def test_errors_are_reported_per_line_in_order(self):
+        report = self.post_import(
+            f'999999,{self.campaign.pk},10.00,',      # line 2: unknown user, found while inserting
+            f'{self.donors[0].pk},{self.campaign.pk},abc,',  # line 3: fails validation
+            f'{self.donors[1].pk},{self.campaign.pk},5.00,',
+            f'{self.donors[1].pk},{self.campaign.pk},7.00,',  # line 5: same donor twice
+        )
+        self.assertEqual((report['imported'], report['failed']), (1, 3))
+        self.assertEqual(report['errors'], [
+            {'line': 2, 'error': "Unknown user or campaign"},
+            {'line': 3, 'error': "user, campaign and amount are required"},
+            {'line': 5, 'error': "User has already donated to this campaign"},
+        ])
+
+    def test_concurrent_insert_is_retried_not_a_server_error(self):
+        donor = self.donors[0]
+        lookup = transfer._lookup
+
+        def lookup_then_race(user_ids, campaign_ids):
+            if mocked.call_count > 1:  # The racing row was committed before the retry
+                Donation.objects.create(user=donor, campaign=self.campaign, amount=1)
+                return lookup(user_ids, campaign_ids)
+            result = lookup(user_ids, campaign_ids)
+            Donation.objects.create(user=donor, campaign=self.campaign, amount=1)  # Lands after our reads
+            return result
+
+        with mock.patch.object(transfer, '_lookup', side_effect=lookup_then_race) as mocked:
+            report = self.post_import(
+                f'{donor.pk},{self.campaign.pk},10.00,',
+                f'{self.donors[1].pk},{self.campaign.pk},5.00,',
+            )
+        self.assertEqual((report['imported'], mocked.call_count), (1, 2))
+        self.assertEqual(report['errors'], [{'line': 2, 'error': "User has already donated to this campaign"}])
+
+    def test_export_honours_the_date_range(self):
+        own = [
+            Transaction.objects.create(user=self.donors[0], amount=day, transaction_type='donation', status='completed')
+            for day in (1, 5, 10)
+        ]
+        for row in own:
+            Transaction.objects.filter(pk=row.pk).update(
+                created_at=timezone.make_aware(timezone.datetime(2025, 1, int(row.amount), 12)),
+            )
+        Transaction.objects.create(user=self.donors[1], amount=5, transaction_type='donation', status='completed')
+
+        client = APIClient()
+        client.force_authenticate(self.donors[0])
+        response = client.get('/api/v1/transactions/export/ndjson/', {'start_date': '2025-01-02', 'end_date': '2025-01-09'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [own[1].pk])
+
+        response = client.get('/api/v1/transactions/export/csv/', {'start_date': '2025-01-02'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(','), transfer.EXPORT_FIELDS)
+        self.assertEqual([int(line.split(',')[0]) for line in lines[1:]], [own[1].pk, own[2].pk])
+
+        response = client.get('/api/v1/transactions/export/csv/', {'end_date': '01/09/2025'})
+        self.assertEqual(response.status_code, 400)
+
+
+task_calls = []
+
+
+@background.task
+def record_task_call(label):
+    task_calls.append(label)
+    if label == 'fail':
+        raise RuntimeError("boom")
+
+
+@override_settings(BACKGROUND_TASKS={'EXECUTOR': 'database', 'MAX_ATTEMPTS': 3, 'RETRY_BACKOFF': 2, 'LEASE_SECONDS': 300})
+class DatabaseTaskQueueTests(TestCase):
+    def setUp(self):
+        task_calls.clear()
+
+    def enqueue(self, label, key=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_task_call.enqueue(key=key, label=label)
+
+    def make_due(self):
+        BackgroundTask.objects.update(run_at=timezone.now() - timedelta(seconds=1))
+
+    def test_pending_enqueues_with_a_key_coalesce(self):
+        for _ in range(3):
+            self.enqueue('a', key='same')
+        self.enqueue('b', key='other')
+        self.enqueue('c')
+        self.enqueue('c')
+        self.assertEqual(BackgroundTask.objects.filter(key='same').count(), 1)
+        self.assertEqual(BackgroundTask.objects.count(), 4)
+
+        # Once claimed, the key is free again: work enqueued meanwhile must run too
+        BackgroundTask.objects.filter(key='same').update(status='running')
+        self.enqueue('a', key='same')
+        self.assertEqual(BackgroundTask.objects.filter(key='same').count(), 2)
+
+    def test_failures_are_retried_with_backoff_then_kept(self):
+        self.enqueue('fail')
+        self.assertEqual(background.run_pending_tasks(), 1)
+        row = BackgroundTask.objects.get()
+        self.assertEqual((row.status, row.attempts), ('pending', 1))
+        self.assertIn("boom", row.last_error)
+        self.assertGreater(row.run_at, timezone.now() + timedelta(seconds=1))
+        self.assertEqual(background.run_pending_tasks(), 0)  # Not due yet
+
+        self.make_due()
+        background.run_pending_tasks()
+        row = BackgroundTask.objects.get()
+        self.assertGreater(row.run_at, timezone.now() + timedelta(seconds=3))
+
+        self.make_due()
+        background.run_pending_tasks()
+        row = BackgroundTask.objects.get()
+        self.assertEqual((row.status, row.attempts), ('failed', 3))
+        self.assertEqual(task_calls, ['fail'] * 3)
+        self.make_due()
+        self.assertEqual(background.run_pending_tasks(), 0)
+
+    def test_failed_run_yields_to_a_newer_pending_enqueue(self):
+        self.enqueue('fail', key='k')
+        reschedule = background._reschedule
+
+        def enqueue_then_reschedule(background_task, error):
+            self.enqueue('ok', key='k')  # Arrived while the failing run held the key
+            reschedule(background_task, error)
+
+        with mock.patch.object(background, '_reschedule', side_effect=enqueue_then_reschedule):
+            background.run_pending_tasks()
+        self.assertEqual(list(BackgroundTask.objects.values_list('status', 'kwargs')), [('pending', {'label': 'ok'})])
+
+    def test_expired_leases_are_reclaimed(self):
+        now = timezone.now()
+        BackgroundTask.objects.create(name=record_task_call.task_name, kwargs={'label': 'orphaned'}, status='running',
+                                      run_at=now - timedelta(seconds=1))
+        BackgroundTask.objects.create(name=record_task_call.task_name, kwargs={'label': 'leased'}, status='running',
+                                      run_at=now + timedelta(seconds=60))
+        self.assertEqual(background.run_pending_tasks(), 1)
+        self.assertEqual(task_calls, ['orphaned'])
+        self.assertEqual(list(BackgroundTask.objects.values_list('kwargs', flat=True)), [{'label': 'leased'}])
+
+    def test_settle_campaign_donations_settles_exactly_once(self):
+        owner = CustomUser.objects.create_user('owner')
+        campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, amount in enumerate((10, 15)):
+                Donation.objects.create(user=CustomUser.objects.create_user(f'donor-{i}'), campaign=campaign, amount=amount)
+        self.assertEqual(BackgroundTask.objects.get().name, tasks.settle_campaign_donations.task_name)
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.raised_amount, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(background.run_pending_tasks(), 1)
+            tasks.settle_campaign_donations(campaign_id=campaign.pk)  # A late duplicate run finds nothing to do
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.raised_amount, Decimal('25.00'))
+        self.assertEqual(Transaction.objects.filter(donation__campaign=campaign).count(), 2)
+        self.assertFalse(Donation.objects.filter(settled=False).exists())
+        self.assertFalse(BackgroundTask.objects.exists())
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.owner = CustomUser.objects.create_user('owner')
+        self.campaign = Campaign.objects.create(title='Water', description='Borehole', goal_amount=100, creator=self.owner)
+        self.visitor = APIClient()
+        self.member = APIClient()
+        self.member.force_authenticate(self.owner)
+
+    def test_anonymous_reads_miss_then_hit(self):
+        url = f'/api/v1/campaigns/{self.campaign.pk}/'
+        self.assertEqual(self.visitor.get(url)['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.visitor.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['title'], 'Water')
+        self.assertEqual(len(queries), 1)  # Just the conditional GET validator
+
+        # Query params are part of the key, in any order
+        self.assertEqual(self.visitor.get('/api/v1/campaigns/?page=1&page_size=5')['X-Cache'], 'MISS')
+        self.assertEqual(self.visitor.get('/api/v1/campaigns/?page_size=5&page=1')['X-Cache'], 'HIT')
+
+    def test_donation_and_campaign_writes_start_a_new_generation(self):
+        url = f'/api/v1/campaigns/{self.campaign.pk}/'
+        self.visitor.get(url)
+        self.assertEqual(self.visitor.get(url)['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Donation.objects.create(user=CustomUser.objects.create_user('donor'), campaign=self.campaign, amount=10)
+        self.assertEqual(self.visitor.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.visitor.get(url)['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.campaign.save()
+        self.assertEqual(self.visitor.get(url)['X-Cache'], 'MISS')
+
+    def test_cached_body_follows_the_validator(self):
+        url = f'/api/v1/campaigns/{self.campaign.pk}/'
+        self.visitor.get(url)
+        # A write whose invalidation never reached this process's cache
+        Campaign.objects.filter(pk=self.campaign.pk).update(title='Clean water', version=F('version') + 1)
+        response = self.visitor.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['title'], 'Clean water')
+        self.assertEqual(self.visitor.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_authenticated_and_unsafe_requests_bypass_the_cache(self):
+        class ProfileViewSet(viewsets.ViewSet):
+            @cache_response('profiles')
+            def list(self, request):
+                return Response({'username': request.user.username})
+
+        view = ProfileViewSet.as_view({'get': 'list'})
+        request = APIRequestFactory().get('/profile/')
+        force_authenticate(request, self.owner)
+        response = view(request)
+        self.assertEqual(response.data, {'username': 'owner'})
+        self.assertFalse(response.has_header('X-Cache'))
+
+        url = f'/api/v1/campaigns/{self.campaign.pk}/'
+        self.visitor.get(url)
+        hits = get_response_cache().stats()['hits']
+        response = self.member.patch(url, {'title': 'Clean water'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Cache'))
+        self.assertEqual(get_response_cache().stats()['hits'], hits)
+
+    def test_authenticated_campaign_list_is_served_from_the_cache(self):
+        self.assertEqual(self.visitor.get('/api/v1/campaigns/')['X-Cache'], 'MISS')
+        response = self.member.get('/api/v1/campaigns/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['results'][0]['title'], 'Water')
+
+    def test_shared_responses_are_cached_for_authenticated_requests(self):
+        url = f'/api/v1/donations/summary/{self.campaign.pk}/'
+        self.assertEqual(self.member.get(url)['X-Cache'], 'MISS')
+        other = APIClient()
+        other.force_authenticate(CustomUser.objects.create_user('other'))
+        self.assertEqual(other.get(url)['X-Cache'], 'HIT')
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False})
+class CampaignSearchTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user('owner')
+        self.client = APIClient()
+
+    def campaign(self, title, description=''):
+        return Campaign.objects.create(title=title, description=description, goal_amount=100, creator=self.owner)
+
+    def search(self, query):
+        response = self.client.get('/api/v1/campaigns/search/', {'q': query})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [c['title'] for c in response.json()['results']]
+
+    def test_last_term_is_a_prefix_and_title_matches_rank_first(self):
+        self.assertIsInstance(search.get_search_backend(), search.SQLiteFTSBackend)
+        self.campaign('School roof', 'Then water for the school garden')
+        self.campaign('Water well', 'A borehole for the village')
+        self.campaign('Waterfront clinic')
+        self.campaign('Library', 'Books and shelves')
+
+        results = self.search('wat')
+        self.assertCountEqual(results[:2], ['Water well', 'Waterfront clinic'])  # Title weight beats description
+        self.assertEqual(results[2:], ['School roof'])
+        self.assertEqual(self.search('school wat'), ['School roof'])
+        self.assertEqual(self.search('librar'), ['Library'])
+        self.assertEqual(self.search('ter'), [])  # Prefixes only, not substrings
+
+    def test_index_follows_saves_and_deletes(self):
+        campaign = self.campaign('Water well')
+        campaign.title = 'Solar panels'
+        campaign.save()
+        self.assertEqual(self.search('water'), [])
+        self.assertEqual(self.search('solar'), ['Solar panels'])
+
+        campaign.delete()
+        self.assertEqual(self.search('solar'), [])
+
+    def test_quotes_and_fts_operators_are_searched_as_words(self):
+        self.campaign('Near the river', 'Bridge OR ferry')
+        self.assertEqual(self.search('"near'), ['Near the river'])
+        self.assertEqual(self.search('river" OR "x'), [])  # Both words must match, OR is just a word
+        self.assertEqual(self.search('bridge OR'), ['Near the river'])
+        self.assertEqual(self.search('NEAR(river, 2) AND -*'), [])
+        self.assertEqual(search.SQLiteFTSBackend().search(['ri"ver'], limit=10), [])
+
+    def test_falls_back_to_icontains_without_fts5(self):
+        self.campaign('Water well', 'A borehole')
+        search.reset_search_backends()
+        self.addCleanup(search.reset_search_backends)
+        with mock.patch.object(search, 'sqlite_fts_available', return_value=False):
+            self.assertIsInstance(search.get_search_backend(), search.IContainsSearchBackend)
+        self.assertEqual(self.search('bore'), ['Water well'])
+
+    def test_rebuild_command_indexes_rows_written_without_signals(self):
+        Campaign.objects.bulk_create([Campaign(title='Water well', goal_amount=100, creator=self.owner)])
+        self.assertEqual(self.search('water'), [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.search('water'), ['Water well'])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('payer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        base = timezone.now().replace(microsecond=0)
+        self.transactions = []
+        for i, minutes in enumerate((0, 0, 0, 1, 2, 2, 3)):  # Ties on created_at span page boundaries
+            row = Transaction.objects.create(user=self.user, amount=i + 1, transaction_type='donation', status='completed')
+            Transaction.objects.filter(pk=row.pk).update(created_at=base - timedelta(minutes=minutes))
+            self.transactions.append(row.pk)
+        newest_first = sorted(zip((0, 0, 0, 1, 2, 2, 3), self.transactions), key=lambda r: (r[0], -r[1]))
+        self.expected = [pk for _, pk in newest_first]
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_cursors_walk_every_row_once_in_both_directions(self):
+        page = self.get('/api/v1/transactions/', pagination='cursor', page_size=2)
+        self.assertIsNone(page['previous'])
+        pages = [[row['id'] for row in page['results']]]
+        while page['next']:
+            page = self.get(page['next'])
+            pages.append([row['id'] for row in page['results']])
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual(len(pages), 4)
+
+        back = [pages[-1]]
+        while page['previous']:
+            page = self.get(page['previous'])
+            back.insert(0, [row['id'] for row in page['results']])
+        self.assertEqual(back, pages)
+
+    def test_invalid_cursor_is_not_found(self):
+        for cursor in ('not-base64!', base64.urlsafe_b64encode(b'yesterday|1|n').decode(),
+                       base64.urlsafe_b64encode(b'2025-01-01T00:00:00+00:00|1|x').decode()):
+            response = self.client.get('/api/v1/transactions/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+    def test_ordering_other_than_newest_first_is_rejected_with_a_cursor(self):
+        response = self.client.get('/api/v1/transactions/', {'pagination': 'cursor', 'ordering': 'amount'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.json())
+
+        page = self.get('/api/v1/transactions/', pagination='cursor', ordering='-created_at', page_size=3)
+        self.assertEqual([row['id'] for row in page['results']], self.expected[:3])
+        page = self.get('/api/v1/transactions/', ordering='amount')  # Page numbers honour it
+        self.assertEqual([row['id'] for row in page['results']], self.transactions)
+
+
+@override_settings(
+    DATABASES={**settings.DATABASES, 'replica': {**settings.DATABASES['default'], 'TEST': {'MIRROR': 'default'}}},
+    REPLICA_STICKY_SECONDS=60, REPLICA_RETRY_SECONDS=60, RESPONSE_CACHE={'ENABLED': False},
+)
+class ReplicaRouterTests(TransactionTestCase):
+    """Outside TestCase's wrapping transaction, which pins every read to the primary."""
+
+    def setUp(self):
+        # The replica shares the primary's connection, so it sees the same rows
+        connections['replica'] = connections['default']
+        self.addCleanup(delattr, connections._connections, 'replica')
+        db_router.reset_sticky_cache()
+        db_router._down_until.clear()
+        self.addCleanup(db_router._down_until.clear)
+
+        self.routed = []
+        db_for_read = db_router.ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            self.routed.append(alias)
+            return alias
+
+        patcher = mock.patch.object(db_router.ReplicaRouter, 'db_for_read', record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = CustomUser.objects.create_user('reader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def reads(self, method, url, data=None):
+        self.routed.clear()
+        response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300, response.content)
+        return set(self.routed)
+
+    def test_replica_actions_read_from_the_replica(self):
+        self.assertEqual(self.reads('get', '/api/v1/transactions/summary/'), {'replica'})
+        self.assertEqual(self.reads('get', '/api/v1/transactions/'), {'default'})  # Not a replica action
+
+    def test_a_write_pins_the_user_to_the_primary(self):
+        self.reads('post', '/api/v1/campaigns/', {
+            'title': 'Water', 'description': 'Borehole', 'goal_amount': '100.00', 'creator': self.user.pk,
+        })
+        self.assertEqual(self.reads('get', '/api/v1/transactions/summary/'), {'default'})
+
+        self.client.force_authenticate(CustomUser.objects.create_user('other'))
+        self.assertEqual(self.reads('get', '/api/v1/transactions/summary/'), {'replica'})
+
+        # Within a request, reads after a write go to the primary too
+        token = db_router._request.set(db_router.RoutingState(use_replica=True))
+        try:
+            router = db_router.ReplicaRouter()
+            self.assertEqual(router.db_for_read(Campaign), 'replica')
+            router.db_for_write(Campaign)
+            self.assertEqual(router.db_for_read(Campaign), 'default')
+        finally:
+            db_router._request.reset(token)
+
+    def test_reads_in_a_transaction_stay_on_the_primary(self):
+        token = db_router._request.set(db_router.RoutingState(use_replica=True))
+        try:
+            router = db_router.ReplicaRouter()
+            with db_transaction.atomic():
+                self.assertEqual(router.db_for_read(Campaign), 'default')
+            self.assertEqual(router.db_for_read(Campaign), 'replica')
+        finally:
+            db_router._request.reset(token)
+
+    def test_a_replica_failing_its_check_is_skipped(self):
+        broken = mock.Mock()
+        broken.ensure_connection.side_effect = OperationalError("connection refused")
+        connections['replica'] = broken
+        self.assertEqual(self.reads('get', '/api/v1/transactions/summary/'), {'default'})
+        self.assertEqual(self.reads('get', '/api/v1/transactions/summary/'), {'default'})
+        self.assertEqual(broken.ensure_connection.call_count, 1)  # Not retried within REPLICA_RETRY_SECONDS
+
+        db_router._down_until.clear()
+        connections['replica'] = connections['default']
+        self.assertEqual(self.reads('get', '/api/v1/transactions/summary/'), {'replica'})
+
+
+@override_settings(BACKGROUND_TASKS={'EXECUTOR': 'database'})
+class WriteQueueTests(TransactionTestCase):
+    """Real commits: queued writes only batch outside an enclosing transaction."""
+
+    def setUp(self):
+        owner = CustomUser.objects.create_user('owner')
+        self.campaigns = [
+            Campaign.objects.create(title=f'Campaign {i}', description='', goal_amount=100, creator=owner) for i in range(3)
+        ]
+        self.donors = [CustomUser.objects.create_user(f'donor-{i}') for i in range(3)]
+        self.queue = WriteQueue()
+        self.ran_on = {}
+
+    def wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail("Timed out waiting for the write queue")
+
+    def donate(self, index, fail=False):
+        def write():
+            self.ran_on[index] = threading.current_thread().name
+            donation = Donation.objects.create(user=self.donors[index], campaign=self.campaigns[index], amount=10)
+            if fail:
+                raise ValueError("rejected")
+            return donation
+        return write
+
+    def run_behind_a_leader(self, writes, states=None):
+        """
+        Submits `writes` from one thread each while the first leader holds its own
+        batch open, so they queue up and are committed by the next leader.
+        """
+        release = threading.Event()
+        outcomes = {}
+
+        def submit(index, func):
+            if states and index in states:
+                db_router._request.set(states[index])
+            try:
+                outcomes[index] = self.queue.submit(func)
+            except Exception as e:
+                outcomes[index] = e
+            finally:
+                connection.close()
+
+        def first():
+            release.wait(5)
+            return 'first'
+
+        threads = [threading.Thread(target=submit, args=('first', first), name='writer-first')]
+        threads[0].start()
+        self.wait_for(lambda: self.queue.leading and not self.queue.pending)
+        for index, func in enumerate(writes):
+            threads.append(threading.Thread(target=submit, args=(index, func), name=f'writer-{index}'))
+            threads[-1].start()
+            self.wait_for(lambda: len(self.queue.pending) == index + 1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual((self.queue.leading, self.queue.pending), (False, []))
+        return outcomes
+
+    def test_batched_writes_fail_alone_and_report_to_their_threads(self):
+        state = db_router.RoutingState(use_replica=True)
+        outcomes = self.run_behind_a_leader(
+            [self.donate(0), self.donate(1, fail=True), self.donate(2)], states={2: state},
+        )
+
+        self.assertEqual(outcomes['first'], 'first')
+        self.assertIsInstance(outcomes[0], Donation)
+        self.assertIsInstance(outcomes[1], ValueError)
+        self.assertIsInstance(outcomes[2], Donation)
+        # Leadership passed to the first waiter, which committed the whole batch
+        self.assertEqual(self.ran_on, {0: 'writer-0', 1: 'writer-0', 2: 'writer-0'})
+        self.assertTrue(state.wrote)  # Ran in its submitter's context: read-your-writes still applies
+
+        donated = set(Donation.objects.values_list('campaign_id', flat=True))
+        self.assertEqual(donated, {self.campaigns[0].pk, self.campaigns[2].pk})
+        # Only the surviving writes' on_commit hooks ran
+        self.assertEqual(
+            set(BackgroundTask.objects.values_list('key', flat=True)),
+            {f'settle-campaign:{self.campaigns[0].pk}', f'settle-campaign:{self.campaigns[2].pk}'},
+        )
+
+    def test_failing_on_commit_hook_does_not_fail_the_committed_writes(self):
+        def write():
+            db_transaction.on_commit(lambda: 1 / 0)
+            return self.donate(0)()
+
+        with self.assertLogs('core.write_queue', 'ERROR'):
+            donation = self.queue.submit(write)
+        self.assertTrue(Donation.objects.filter(pk=donation.pk).exists())
+        self.assertFalse(self.queue.leading)
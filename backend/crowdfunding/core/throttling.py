@@ -0,0 +1,237 @@
+"""
+Rate limits and admission control.
+
+Rate limits are token buckets keyed per user, client IP or campaign and configured
+per viewset action in settings.RATE_LIMITS['RULES']: '10/min' is a bucket of 10
+tokens refilled at 10 per minute, so short bursts pass and sustained floods get
+429 with Retry-After. Buckets live in a per-process store or in Redis, where a Lua
+script updates each one atomically for every worker.
+
+AdmissionControlMiddleware caps the requests a process works on at once
+(settings.ADMISSION_CONTROL); beyond that, requests wait briefly for a slot and are
+then shed with 503 and Retry-After instead of piling onto the database.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
+from rest_framework.throttling import BaseThrottle
+from .metrics import count
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def get_setting(name, default):
+    return getattr(settings, 'RATE_LIMITS', {}).get(name, default)
+
+
+def parse_rate(rate):
+    """'10/min' -> (capacity 10, refill 10/60 tokens per second)."""
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+# -------------------------
+# Bucket stores
+# -------------------------
+class LocMemBuckets:
+    """Per-process buckets; the least recently used ones are dropped beyond `max_entries`."""
+
+    def __init__(self, max_entries=100_000, **kwargs):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill, cost=1):
+        """Takes `cost` tokens if the bucket has them; returns 0, or the seconds until it will."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            wait = 0 if tokens >= cost else (cost - tokens) / refill
+            self._buckets[key] = (tokens - cost if not wait else tokens, now)
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+TAKE_SCRIPT = """
+local capacity, refill, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = math.min(capacity, (tonumber(state[1]) or capacity) + math.max(0, now - (tonumber(state[2]) or now)) * refill)
+local wait = 0
+if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / refill end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """Buckets shared by every process; each take is one atomic script run on the server's clock."""
+
+    def __init__(self, location='redis://localhost:6379/0', key_prefix='cf-rate', **kwargs):
+        import redis  # Optional dependency, only needed when this backend is configured
+
+        self.client = redis.Redis.from_url(location)
+        self.key_prefix = key_prefix
+        self._take = self.client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, capacity, refill, cost=1):
+        return float(self._take(keys=[f"{self.key_prefix}:{key}"], args=[capacity, refill, cost]))
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.key_prefix}:*"):
+            self.client.delete(key)
+
+
+BACKENDS = {
+    'locmem': LocMemBuckets,
+    'redis': RedisBuckets,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    """Returns the process-wide bucket store configured by settings.RATE_LIMITS."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = get_setting('BACKEND', 'locmem')
+                backend_class = BACKENDS.get(backend) or import_string(backend)
+                _store = backend_class(
+                    location=get_setting('LOCATION', 'redis://localhost:6379/0'),
+                    key_prefix=get_setting('KEY_PREFIX', 'cf-rate'),
+                )
+    return _store
+
+
+def reset_bucket_store():
+    """Drops the configured store (used when settings change, e.g. in tests)."""
+    global _store
+    _store = None
+
+
+# -------------------------
+# Rate limits
+# -------------------------
+def get_rules(scope):
+    """{'user'|'ip'|'campaign': rate} for `scope`, empty when it has none or limits are off."""
+    if not get_setting('ENABLED', True):
+        return {}
+    return get_setting('RULES', {}).get(scope) or {}
+
+
+def rate_limit_wait(scope, idents):
+    """
+    Takes a token from each bucket RATE_LIMITS['RULES'][scope] sets for `idents`
+    ({'user': id, 'ip': address, 'campaign': id}; None skips that limit). Returns 0
+    when the request may proceed, or the seconds until the exhausted bucket refills.
+    """
+    rules = get_rules(scope)
+    if not rules:
+        return 0
+    store = get_bucket_store()
+    for kind, rate in rules.items():
+        ident = idents.get(kind)
+        if ident is None:
+            continue
+        wait = store.take(f"{scope}:{kind}:{ident}", *parse_rate(rate))
+        if wait:
+            count('http_requests_rejected_total', (('scope', scope), ('reason', kind)))
+            return wait
+    return 0
+
+
+def client_ip(request):
+    """The client address, honouring REST_FRAMEWORK['NUM_PROXIES'] like DRF's throttles."""
+    return BaseThrottle().get_ident(request)
+
+
+def throttled_response(wait):
+    return JsonResponse(
+        {'detail': 'Request was throttled.'}, status=429, headers={'Retry-After': str(math.ceil(wait))},
+    )
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle applying the rules of the view's scope: its `throttle_scope`, or
+    '<basename>.<action>' for viewsets (e.g. 'donation.create'). Views without rules
+    pass untouched.
+    """
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope is None and getattr(view, 'basename', None):
+            scope = f"{view.basename}.{view.action}"
+        rules = get_rules(scope)
+        if not rules:
+            return True
+        self.wait_seconds = rate_limit_wait(scope, {
+            'user': request.user.pk if request.user and request.user.is_authenticated else None,
+            'ip': self.get_ident(request),
+            'campaign': self.get_campaign(request, view) if 'campaign' in rules else None,
+        })
+        return not self.wait_seconds
+
+    def get_campaign(self, request, view):
+        """The campaign of a campaign detail action, or the `campaign` field of a posted body."""
+        if getattr(view, 'basename', None) == 'campaign':
+            return view.kwargs.get('pk')
+        try:
+            data = request.data
+        except (ParseError, UnsupportedMediaType):
+            return None  # Reported by the view itself
+        return data.get('campaign') if hasattr(data, 'get') else None
+
+    def wait(self):
+        return self.wait_seconds
+
+
+# -------------------------
+# Admission control
+# -------------------------
+class AdmissionControlMiddleware:
+    """
+    Lets at most ADMISSION_CONTROL['MAX_CONCURRENT_REQUESTS'] requests into the
+    process at once (0 disables it). Others wait up to QUEUE_SECONDS for a slot and
+    are then answered 503 with Retry-After, without touching the database.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = getattr(settings, 'ADMISSION_CONTROL', {})
+        limit = config.get('MAX_CONCURRENT_REQUESTS', 0)
+        self.slots = threading.BoundedSemaphore(limit) if limit else None
+        self.queue_seconds = config.get('QUEUE_SECONDS', 0.1)
+        self.retry_after = config.get('RETRY_AFTER_SECONDS', 1)
+        self.exempt_paths = tuple(config.get('EXEMPT_PATHS', ()))
+
+    def __call__(self, request):
+        if self.slots is None or request.path.startswith(self.exempt_paths):
+            return self.get_response(request)
+        if not self.slots.acquire(timeout=self.queue_seconds):
+            count('http_requests_rejected_total', (('scope', 'admission'), ('reason', 'concurrency')))
+            return JsonResponse(
+                {'detail': 'Server is busy, retry shortly.'}, status=503,
+                headers={'Retry-After': str(self.retry_after)},
+            )
+        try:
+            return self.get_response(request)
+        finally:
+            self.slots.release()
@@ -0,0 +1,118 @@
+"""
+Donation history of a campaign in hourly, daily or weekly buckets.
+
+Points are read from the rollup tables kept by core/rollups.py (CampaignHourlyStats,
+and CampaignDailyStats for days and weeks), never from Donation rows, so a year of
+daily points costs one indexed range scan of 365 rows plus one SUM for the
+cumulative baseline, whatever the campaign's donation count. Every bucket of the
+range gets a point, empty ones included; a range with more than `max_points`
+buckets is downsampled by merging consecutive buckets.
+"""
+import math
+from datetime import date, datetime, time, timezone as dt_timezone
+from decimal import Decimal
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import CampaignDailyStats, CampaignHourlyStats
+
+DEFAULT_MAX_POINTS = 400
+MAX_POINTS = 2000
+
+
+class Interval:
+    """Maps bucket starts to consecutive integers, so ranges and downsampling are integer arithmetic."""
+
+    def __init__(self, name, model, field, default_buckets):
+        self.name = name
+        self.model = model
+        self.field = field
+        self.default_buckets = default_buckets
+
+    def index(self, value):
+        """Index of the bucket holding `value` (a datetime for hours, a date otherwise)."""
+        if self.name == 'hour':
+            return int(value.timestamp()) // 3600
+        ordinal = value.toordinal()
+        return (ordinal - 1) // 7 if self.name == 'week' else ordinal  # Day 1 was a Monday
+
+    def start(self, index):
+        """Start of bucket `index`, as stored in the rollup table's `field`."""
+        if self.name == 'hour':
+            return datetime.fromtimestamp(index * 3600, tz=dt_timezone.utc)
+        return date.fromordinal(index * 7 + 1 if self.name == 'week' else index)
+
+    def parse(self, value):
+        """A `start`/`end` query parameter (ISO date or datetime) as a value `index` accepts."""
+        moment = parse_datetime(value)
+        day = parse_date(value) if moment is None else None
+        if moment is None and day is None:
+            raise ValueError
+        if self.name != 'hour':
+            return day or (timezone.localdate(moment) if timezone.is_aware(moment) else moment.date())
+        moment = moment or datetime.combine(day, time.min)
+        return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+    def now(self):
+        return timezone.now() if self.name == 'hour' else timezone.localdate()
+
+
+INTERVALS = {
+    'hour': Interval('hour', CampaignHourlyStats, 'hour', default_buckets=48),
+    'day': Interval('day', CampaignDailyStats, 'day', default_buckets=30),
+    'week': Interval('week', CampaignDailyStats, 'day', default_buckets=26),
+}
+
+
+def campaign_timeseries(campaign_id, interval, start=None, end=None, max_points=DEFAULT_MAX_POINTS):
+    """
+    Points for `campaign_id` from the bucket holding `start` to the one holding `end`
+    (`end` defaults to now and `start` to the interval's default span); the returned
+    `start` and `end` are the bounds of those buckets, `end` excluded.
+    Each point has its start, amount and donors, and the cumulative amount and
+    donors at its end. `step` is the number of buckets merged into each point.
+    """
+    end_index = interval.index(end if end is not None else interval.now())
+    start_index = interval.index(start) if start is not None else end_index - interval.default_buckets + 1
+    if start_index > end_index:
+        raise ValueError("start must not be after end")
+    step = math.ceil((end_index - start_index + 1) / max_points)
+    point_count = math.ceil((end_index - start_index + 1) / step)
+
+    rollups = interval.model.objects.filter(campaign_id=campaign_id)
+    field = interval.field
+    baseline = rollups.filter(**{f'{field}__lt': interval.start(start_index)}).aggregate(
+        amount=Sum('total_amount'), donors=Sum('donation_count'),
+    )
+    rows = rollups.filter(**{
+        f'{field}__gte': interval.start(start_index), f'{field}__lt': interval.start(end_index + 1),
+    }).values_list(field, 'total_amount', 'donation_count')
+
+    amounts = [Decimal('0.00')] * point_count
+    donors = [0] * point_count
+    for bucket, amount, count in rows:
+        point = (interval.index(bucket) - start_index) // step
+        amounts[point] += amount
+        donors[point] += count
+
+    cumulative_amount = baseline['amount'] or Decimal('0.00')
+    cumulative_donors = baseline['donors'] or 0
+    points = []
+    for point in range(point_count):
+        cumulative_amount += amounts[point]
+        cumulative_donors += donors[point]
+        points.append({
+            'start': interval.start(start_index + point * step),
+            'amount': f"{amounts[point]:.2f}",
+            'donors': donors[point],
+            'cumulative_amount': f"{cumulative_amount:.2f}",
+            'cumulative_donors': cumulative_donors,
+        })
+    return {
+        'campaign_id': campaign_id,
+        'interval': interval.name,
+        'step': step,
+        'start': interval.start(start_index),
+        'end': interval.start(end_index + 1),  # Exclusive
+        'points': points,
+    }
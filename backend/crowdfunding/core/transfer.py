@@ -0,0 +1,252 @@
+import codecs
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .counters import record_donations
+from .models import Campaign, CustomUser, Donation, Transaction
+
+EXPORT_FIELDS = ['id', 'user_id', 'donation_id', 'amount', 'transaction_type', 'status', 'reference', 'created_at']
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+MAX_REPORTED_ERRORS = 100
+
+
+# -------------------------
+# Streaming export
+# -------------------------
+class _Echo:
+    """File-like object whose write() returns the data, so csv.writer yields strings."""
+
+    def write(self, value):
+        return value
+
+
+def _export_rows(queryset, chunk_size):
+    # Plain tuples from a server-side cursor: no model instances, constant memory
+    return queryset.order_by('id').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def iter_csv(queryset, chunk_size=2000):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in _export_rows(queryset, chunk_size):
+        yield writer.writerow(row[:-1] + (row[-1].isoformat(),))
+
+
+def iter_ndjson(queryset, chunk_size=2000):
+    for row in _export_rows(queryset, chunk_size):
+        record = dict(zip(EXPORT_FIELDS, row))
+        record['amount'] = str(record['amount'])
+        record['created_at'] = record['created_at'].isoformat()
+        yield json.dumps(record) + '\n'
+
+
+EXPORTERS = {
+    'csv': iter_csv,
+    'ndjson': iter_ndjson,
+}
+
+
+# -------------------------
+# Chunked donation import
+# -------------------------
+def parse_rows(lines, fmt):
+    """Yields (line_number, row dict) from an iterable of text lines in CSV (with header) or NDJSON."""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(lines, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+
+
+def _validate(row):
+    if not isinstance(row, dict):
+        raise ValueError("Malformed row")
+    try:
+        user_id, campaign_id = int(row['user']), int(row['campaign'])
+        amount = Decimal(str(row['amount']))
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        raise ValueError("user, campaign and amount are required")
+    if amount <= 0 or amount.as_tuple().exponent < -2:
+        raise ValueError("amount must be positive with at most 2 decimal places")
+
+    created_at = row.get('created_at') or None
+    if created_at is not None:
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            raise ValueError("created_at must be an ISO 8601 datetime")
+        if timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at)  # No offset: TIME_ZONE, like Django's own naive datetimes
+    return user_id, campaign_id, amount, created_at, (row.get('reference') or None)
+
+
+def _lookup(user_ids, campaign_ids):
+    """Existing user ids, campaign ids and {(user_id, campaign_id): donation_id} for a batch, in three queries."""
+    known_users = set(CustomUser.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    known_campaigns = set(Campaign.objects.filter(pk__in=campaign_ids).values_list('pk', flat=True))
+    donations = Donation.objects.filter(user_id__in=user_ids, campaign_id__in=campaign_ids)
+    taken = {(user_id, campaign_id): pk for user_id, campaign_id, pk in donations.values_list('user_id', 'campaign_id', 'pk')}
+    return known_users, known_campaigns, taken
+
+
+def _insert_chunk(parsed):
+    """Inserts the valid rows of a chunk; returns (skipped, [(line, error)], donations). Runs in a transaction."""
+    user_ids = {p[1] for p in parsed}
+    campaign_ids = {p[2] for p in parsed}
+    references = {p[5] for p in parsed if p[5]}
+    known_users, known_campaigns, taken = _lookup(user_ids, campaign_ids)
+    seen_references = set(Transaction.objects.filter(reference__in=references).values_list('reference', flat=True))
+
+    skipped, errors = 0, []
+    donations, donation_references = [], []
+    for line_number, user_id, campaign_id, amount, created_at, reference in parsed:
+        if reference and reference in seen_references:
+            skipped += 1  # Already imported
+        elif user_id not in known_users or campaign_id not in known_campaigns:
+            errors.append((line_number, "Unknown user or campaign"))
+        elif (user_id, campaign_id) in taken:
+            errors.append((line_number, "User has already donated to this campaign"))
+        else:
+            taken[user_id, campaign_id] = None
+            if reference:
+                seen_references.add(reference)
+            donations.append(Donation(user_id=user_id, campaign_id=campaign_id, amount=amount, created_at=created_at))
+            donation_references.append(reference)
+
+    return skipped, errors, record_donations(donations, donation_references)
+
+
+def _import_chunk(chunk, report, attempts=2):
+    """Validates and inserts one chunk in its own transaction; campaign totals move once per campaign."""
+    parsed, errors = [], []
+    for line_number, row in chunk:
+        try:
+            parsed.append((line_number,) + _validate(row))
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+
+    skipped, donations = 0, []
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                skipped, insert_errors, donations = _insert_chunk(parsed)
+            break
+        except IntegrityError:
+            # A concurrent import or donation took one of these references or
+            # (user, campaign) pairs after our reads; the retry sees it and skips it
+            if attempt == attempts - 1:
+                insert_errors = [(p[0], "Conflicts with a concurrent write; re-run the file") for p in parsed]
+
+    report.skipped += skipped
+    report.imported += len(donations)
+    for line_number, message in sorted(errors + insert_errors):
+        report.error(line_number, message)
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def as_dict(self):
+        return {'imported': self.imported, 'skipped': self.skipped, 'failed': self.failed, 'errors': self.errors}
+
+
+def import_donations(lines, fmt='csv', chunk_size=1000):
+    """
+    Imports donations from CSV/NDJSON lines, `chunk_size` rows per transaction.
+
+    Columns: user, campaign, amount, and optionally created_at (ISO 8601, read in
+    TIME_ZONE when it has no UTC offset) and reference. Rows
+    whose reference was already imported are skipped, so a file can be re-run after
+    a partial failure.
+    """
+    report = ImportReport()
+    chunk = []
+    for item in parse_rows(lines, fmt):
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            _import_chunk(chunk, report)
+            chunk = []
+    if chunk:
+        _import_chunk(chunk, report)
+    return report
+
+
+# -------------------------
+# Batched donation create
+# -------------------------
+def create_donations(items, default_user_id=None):
+    """
+    Creates a batch of donations in one transaction and returns one result per item, in order.
+
+    `items` are validated `{user, campaign, amount}` dicts (`user` defaults to
+    `default_user_id`), or `{'errors': ...}` for items that failed validation. The
+    new donations are settled at once with counters.record_donations. An item
+    conflicts when its user already donated to the campaign, or when an earlier
+    item of the batch is for the same user and campaign.
+    """
+    results = [None] * len(items)
+    pending = []
+    for index, item in enumerate(items):
+        if 'errors' in item:
+            results[index] = {'index': index, 'status': 'invalid', 'errors': item['errors']}
+        else:
+            pending.append((index, item.get('user', default_user_id), item['campaign'], item['amount']))
+
+    with transaction.atomic():
+        known_users, known_campaigns, taken = _lookup({p[1] for p in pending}, {p[2] for p in pending})
+        batch = {}  # (user_id, campaign_id) -> index of the item creating it
+        donations, indexes = [], []
+        for index, user_id, campaign_id, amount in pending:
+            errors = {}
+            if user_id not in known_users:
+                errors['user'] = ["Unknown user."]
+            if campaign_id not in known_campaigns:
+                errors['campaign'] = ["Unknown campaign."]
+            if errors:
+                results[index] = {'index': index, 'status': 'invalid', 'errors': errors}
+            elif (user_id, campaign_id) in taken:
+                results[index] = {
+                    'index': index, 'status': 'conflict', 'error': "User has already donated to this campaign",
+                    'donation': taken[user_id, campaign_id],
+                }
+            elif (user_id, campaign_id) in batch:
+                results[index] = {
+                    'index': index, 'status': 'conflict', 'error': "Same user and campaign as an earlier item",
+                    'duplicate_of': batch[user_id, campaign_id],
+                }
+            else:
+                batch[user_id, campaign_id] = index
+                donations.append(Donation(user_id=user_id, campaign_id=campaign_id, amount=amount))
+                indexes.append(index)
+
+        for index, donation in zip(indexes, record_donations(donations)):
+            results[index] = {
+                'index': index, 'status': 'created', 'id': donation.pk,
+                'user': donation.user_id, 'campaign': donation.campaign_id, 'amount': donation.amount,
+            }
+    return results
+
+
+def text_lines(stream, encoding='utf-8'):
+    """Decodes a binary stream (upload, request body, file) line by line without reading it whole."""
+    return codecs.iterdecode(iter(stream), encoding)
@@ -1,8 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CampaignViewSet, DonationViewSet, CommentViewSet, TransactionViewSet
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .views import CampaignViewSet, DonationViewSet, CommentViewSet, TransactionViewSet, TokenObtainView, cache_stats
+from rest_framework_simplejwt.views import TokenRefreshView
 from django.conf import settings
+from . import async_views, streams, webhooks
 
 # Initialize the router
 router = DefaultRouter()
@@ -13,8 +14,12 @@ router.register(r'transactions', TransactionViewSet, basename='transaction')
 
 # URL patterns
 urlpatterns = [
-    path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
+    path("api/token/", TokenObtainView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("cache/stats/", cache_stats, name="cache_stats"),
+    path("webhooks/paychangu/", webhooks.paychangu_webhook, name="paychangu_webhook"),
+    path("campaigns/<int:pk>/initiate-payment/async/", async_views.initiate_payment, name="campaign-initiate-payment-async"),
+    path("campaigns/<int:pk>/events/", streams.campaign_events, name="campaign-events"),
     *router.urls,  # Include all registered viewsets
 ]
 
@@ -1,42 +1,182 @@
+import uuid
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.db import transaction as db_transaction
-from django.db.models import Q, Sum
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, Sum
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.response import Response
-from rest_framework.decorators import action
-from .models import Campaign, Donation, Comment, Transaction
-from .serializers import CampaignSerializer, DonationSerializer, CommentSerializer, TransactionSerializer
-from .payments import PayChanguService
+from rest_framework.decorators import action, api_view, permission_classes
+from .models import (
+    Campaign, CampaignDailyStats, CampaignStats, CustomUser, Donation, Comment, Transaction, UserTransactionStats,
+)
+from .serializers import (
+    CampaignSerializer, CampaignListSerializer, DonationSerializer, DonationListSerializer,
+    CommentSerializer, CommentListSerializer, TransactionSerializer, TransactionListSerializer,
+    DonationBatchItemSerializer,
+)
+from .payments import REQUIRED_PAYMENT_FIELDS, CircuitOpenError, PayChanguService
+from .cache import cache_response, comment_feed_namespace, get_response_cache
+from .idempotency import idempotent
+from .conditional import (
+    campaign_list_validator, campaign_validator, comment_feed_validator, comment_thread_validator, comment_validator,
+    conditional, donation_summary_validator, timeseries_validator,
+)
+from . import leaderboards
+from .search import SearchResults
+from .timeseries import DEFAULT_MAX_POINTS, INTERVALS, MAX_POINTS, campaign_timeseries
+from .pagination import SelectablePaginationMixin
+from .db_router import ReplicaReadMixin
+from .write_queue import get_write_queue, write_queue_enabled
+from .transfer import EXPORT_CONTENT_TYPES, EXPORTERS, import_donations, text_lines
 from django.shortcuts import get_object_or_404
-from datetime import datetime
+from datetime import datetime, timedelta
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.views import TokenObtainPairView
+
+class CompactListMixin:
+    """Serializes collection actions with `compact_serializer_class`, everything else with `serializer_class`."""
+    compact_serializer_class = None
+    compact_actions = ('list',)
+
+    @property
+    def is_compact(self):
+        return self.compact_serializer_class is not None and self.action in self.compact_actions
+
+    def get_serializer_class(self):
+        if self.is_compact:
+            return self.compact_serializer_class
+        return super().get_serializer_class()
+
 
 # -------------------------
 # Campaign ViewSet
 # -------------------------
-class CampaignViewSet(viewsets.ModelViewSet):
-    queryset = Campaign.objects.all()
+class CampaignViewSet(ReplicaReadMixin, CompactListMixin, viewsets.ModelViewSet):
+    queryset = Campaign.objects.order_by('-created_at', '-id')
     serializer_class = CampaignSerializer
+    compact_serializer_class = CampaignListSerializer
+    compact_actions = ('list', 'user_campaigns', 'search_campaigns', 'trending', 'most_funded', 'closest_to_goal')
+    replica_actions = (
+        'list', 'user_campaigns', 'search_campaigns', 'trending', 'most_funded', 'closest_to_goal', 'top_donors',
+        'timeseries',
+    )
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
-    @action(detail=False, methods=['get'], url_path=r'user/(?P<user_id>\\d+)')
+    def get_queryset(self):
+        """Annotates pending counter-shard increments so raised_amount is read in the same query."""
+        queryset = super().get_queryset().with_raised_totals()
+        if self.is_compact:
+            queryset = queryset.select_related('creator').defer('description')
+        return queryset
+
+    @conditional(campaign_list_validator)
+    @cache_response('campaigns', shared=True)  # Campaign responses don't depend on who asks
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(campaign_validator)
+    @cache_response('campaigns', shared=True)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=False, methods=['get'], url_path=r'user/(?P<user_id>\d+)')
     def user_campaigns(self, request, user_id=None):
         """Returns all campaigns created by a specific user."""
-        campaigns = self.queryset.filter(creator_id=user_id)
+        campaigns = self.get_queryset().filter(creator_id=user_id)
         serializer = self.get_serializer(campaigns, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'], url_path='search')
     def search_campaigns(self, request):
-        """Allows users to search for campaigns by title or description."""
-        query = request.query_params.get('q', '')
-        campaigns = self.queryset.filter(Q(title__icontains=query) | Q(description__icontains=query))
-        serializer = self.get_serializer(campaigns, many=True)
+        """Ranked, paginated full-text search over title and description (last word matches as a prefix)."""
+        query = request.query_params.get('q', '').strip()
+        if query:
+            campaigns = SearchResults(query, self.get_queryset())
+        else:
+            campaigns = self.get_queryset().order_by('-created_at')
+
+        page = self.paginate_queryset(campaigns)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(campaigns[0:campaigns.count()], many=True)
         return Response(serializer.data)
 
+    def leaderboard_limit(self, request):
+        try:
+            return min(max(int(request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            raise ValidationError("limit must be an integer.")
+
+    def leaderboard(self, request, board):
+        """The top `limit` campaigns of a board (default 10, at most 100), each with its `score`."""
+        ranked = leaderboards.top(board, self.leaderboard_limit(request))
+        campaigns = self.get_queryset().in_bulk([pk for pk, _ in ranked])
+        ranked = [(campaigns[pk], score) for pk, score in ranked if pk in campaigns]
+        data = self.get_serializer([campaign for campaign, _ in ranked], many=True).data
+        for item, (_, score) in zip(data, ranked):
+            item['score'] = score
+        return Response({'results': data})
+
+    @action(detail=False, methods=['get'], url_path='trending')
+    def trending(self, request):
+        """Campaigns ranked by recent donations, each halving in weight every TRENDING_HALF_LIFE_HOURS."""
+        return self.leaderboard(request, leaderboards.TRENDING)
+
+    @action(detail=False, methods=['get'], url_path='most-funded')
+    def most_funded(self, request):
+        """Campaigns ranked by total raised."""
+        return self.leaderboard(request, leaderboards.MOST_FUNDED)
+
+    @action(detail=False, methods=['get'], url_path='closest-to-goal')
+    def closest_to_goal(self, request):
+        """Campaigns still under their goal, ranked by the fraction raised."""
+        return self.leaderboard(request, leaderboards.CLOSEST_TO_GOAL)
+
+    @action(detail=True, methods=['get'], url_path='top-donors')
+    def top_donors(self, request, pk=None):
+        """The campaign's largest donors by total donated."""
+        campaign = get_object_or_404(Campaign, pk=pk)
+        ranked = leaderboards.top_donors(campaign.pk, self.leaderboard_limit(request))
+        usernames = dict(CustomUser.objects.filter(pk__in=[user_id for user_id, _ in ranked]).values_list('pk', 'username'))
+        return Response({'results': [
+            {'user': user_id, 'username': usernames[user_id], 'total_donated': f"{total:.2f}"}
+            for user_id, total in ranked if user_id in usernames
+        ]})
+
+    @action(detail=True, methods=['get'], url_path='timeseries')
+    @conditional(timeseries_validator)
+    @cache_response('campaigns', shared=True)
+    def timeseries(self, request, pk=None):
+        """
+        Donations over time from the rollup tables: `interval` hour, day (default) or
+        week, optional ISO `start`/`end` dates or datetimes, and `max_points` (default
+        400, at most 2000) above which consecutive buckets are merged.
+        """
+        campaign = get_object_or_404(Campaign.objects.only('pk'), pk=pk)
+        interval = INTERVALS.get(request.query_params.get('interval', 'day'))
+        if interval is None:
+            raise ValidationError(f"interval must be one of: {', '.join(INTERVALS)}.")
+        try:
+            max_points = min(max(int(request.query_params.get('max_points', DEFAULT_MAX_POINTS)), 1), MAX_POINTS)
+        except ValueError:
+            raise ValidationError("max_points must be an integer.")
+        try:
+            start, end = (
+                interval.parse(request.query_params[name]) if request.query_params.get(name) else None
+                for name in ('start', 'end')
+            )
+        except ValueError:
+            raise ValidationError("start and end must be ISO 8601 dates or datetimes.")
+        try:
+            return Response(campaign_timeseries(campaign.pk, interval, start, end, max_points))
+        except ValueError as e:
+            raise ValidationError(str(e))
+
     @action(detail=True, methods=['post'], url_path='initiate-payment')
+    @idempotent
     def initiate_payment(self, request, pk=None):
         """
         Initiate a mobile money payment using PayChangu.
@@ -46,8 +186,7 @@ class CampaignViewSet(viewsets.ModelViewSet):
         data = request.data
 
         # Validate the necessary fields
-        required_fields = ['amount', 'currency', 'phone_number', 'email', 'callback_url']
-        for field in required_fields:
+        for field in REQUIRED_PAYMENT_FIELDS:
             if field not in data:
                 return Response({f'error': f'Missing field: {field}'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -57,11 +196,19 @@ class CampaignViewSet(viewsets.ModelViewSet):
                 currency=data['currency'],
                 phone_number=data['phone_number'],
                 email=data['email'],
-                callback_url=data['callback_url']
+                callback_url=data['callback_url'],
+                tx_ref=uuid.uuid4().hex,
+                meta={'campaign_id': campaign.pk, 'user_id': request.user.pk},
             )
 
             return Response(response, status=status.HTTP_200_OK)
 
+        except CircuitOpenError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(e.retry_after)},
+            )
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -69,33 +216,57 @@ class CampaignViewSet(viewsets.ModelViewSet):
 # -------------------------
 # Donation ViewSet
 # -------------------------
-class DonationViewSet(viewsets.ModelViewSet):
-    queryset = Donation.objects.all()
+class DonationViewSet(ReplicaReadMixin, SelectablePaginationMixin, CompactListMixin, viewsets.ModelViewSet):
+    queryset = Donation.objects.select_related('user', 'campaign').defer('campaign__description').order_by('-created_at', '-id')
     serializer_class = DonationSerializer
+    compact_serializer_class = DonationListSerializer
+    compact_actions = ('list', 'recent_donations')
+    replica_actions = ('donation_summary',)
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
-        """Handles donation creation and updates campaign funds."""
+        """Handles donation creation; a background task then updates campaign funds and records the transaction."""
+        if write_queue_enabled():
+            get_write_queue().submit(serializer.save)  # Batched with concurrent donations
+            return
         with db_transaction.atomic():
-            donation = serializer.save()
-            campaign = donation.campaign
-
-            if not campaign.is_active:
-                raise ValueError("This campaign is no longer active.")
-
-            # Update campaign raised amount
-            campaign.raised_amount += donation.amount
-            campaign.save()
-
-            # Create a transaction record
-            Transaction.objects.create(
-                user=donation.user,
-                donation=donation,
-                amount=donation.amount,
-                transaction_type="donation",
-                status="completed"
+            serializer.save()
+
+    @action(detail=False, methods=['post'], url_path='batch')
+    @idempotent
+    def batch_create(self, request):
+        """
+        Creates up to DONATION_BATCH_MAX_ITEMS donations from a JSON list of
+        {"user", "campaign", "amount"} in one transaction (`user` defaults to the
+        requesting user; only staff may name another). Returns one result per
+        item: created (with its id), invalid (with field errors) or conflict
+        (the user already donated to that campaign).
+        """
+        serializer = DonationBatchItemSerializer(
+            data=request.data, many=True, max_length=settings.DONATION_BATCH_MAX_ITEMS,
+            context=self.get_serializer_context(),
+        )
+        serializer.is_valid(raise_exception=True)
+        try:
+            self.perform_create(serializer)
+        except IntegrityError:
+            # A concurrent donation took one of the pairs after our check; nothing was written
+            return Response(
+                {'error': 'A donation in this batch was created concurrently, retry the batch.'},
+                status=status.HTTP_409_CONFLICT,
             )
 
+        results = serializer.instance
+        counts = {key: sum(1 for r in results if r['status'] == key) for key in ('created', 'invalid', 'conflict')}
+        return Response(
+            {**counts, 'results': results},
+            status=status.HTTP_201_CREATED if counts['created'] == len(results) else status.HTTP_207_MULTI_STATUS,
+        )
+
     @action(detail=False, methods=['get'], url_path='recent')
     def recent_donations(self, request):
         """Returns the 5 most recent donations by the authenticated user."""
@@ -103,56 +274,154 @@ class DonationViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(donations, many=True)
         return Response(serializer.data)
 
-    @action(detail=False, methods=['get'], url_path=r'summary/(?P<campaign_id>\\d+)')
+    @action(detail=False, methods=['post'], url_path=r'import/(?P<import_format>csv|ndjson)',
+            permission_classes=[permissions.IsAdminUser])
+    def bulk_import(self, request, import_format=None):
+        """
+        Imports offline donations from a CSV/NDJSON upload (`file` field) or raw request body.
+
+        Columns: user, campaign, amount, optional created_at and reference. Rows are
+        validated and inserted in chunks; see core.transfer.import_donations.
+        """
+        if request.content_type.startswith('multipart/'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'error': 'Missing file'}, status=status.HTTP_400_BAD_REQUEST)
+            stream = upload.file
+        else:
+            stream = request._request  # Unparsed body, read line by line
+
+        report = import_donations(text_lines(stream), import_format)
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path=r'summary/(?P<campaign_id>\d+)')
+    @conditional(donation_summary_validator, private=True)
+    @cache_response('campaigns', shared=True)  # Campaign-wide totals, the same for every donor
     def donation_summary(self, request, campaign_id=None):
-        """Returns total donation amount for a given campaign."""
-        total_donations = self.queryset.filter(campaign_id=campaign_id).aggregate(Sum('amount'))
-        total_amount = total_donations.get('amount__sum', 0) or 0
-        return Response({'campaign_id': campaign_id, 'total_donated': total_amount})
+        """
+        Returns donation totals for a campaign from its rollup rows, plus daily
+        totals for the last `days` days (default 30, at most 366).
+        """
+        try:
+            days = min(max(int(request.query_params.get('days', 30)), 1), 366)
+        except ValueError:
+            raise ValidationError("days must be an integer.")
+
+        stats = CampaignStats.objects.filter(campaign_id=campaign_id).first() or CampaignStats(campaign_id=campaign_id)
+        daily = CampaignDailyStats.objects.filter(
+            campaign_id=campaign_id, day__gt=timezone.localdate() - timedelta(days=days)
+        ).order_by('day').values('day', 'total_amount', 'donation_count')
+        return Response({
+            'campaign_id': campaign_id,
+            'total_donated': stats.total_amount,
+            'donor_count': stats.donor_count,
+            'average_donation': stats.average_amount,
+            'min_donation': stats.min_amount,
+            'max_donation': stats.max_amount,
+            'daily': list(daily),
+        })
 
 
 # -------------------------
 # Comment ViewSet
 # -------------------------
-class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+class CommentViewSet(ReplicaReadMixin, SelectablePaginationMixin, CompactListMixin, viewsets.ModelViewSet):
+    queryset = Comment.objects.select_related('user').order_by('-created_at', '-id')
     serializer_class = CommentSerializer
+    compact_serializer_class = CommentListSerializer
+    compact_actions = ('list', 'thread')
+    replica_actions = ('list', 'thread')
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    thread_limit = 500
 
     def get_queryset(self):
-        """Filters comments by campaign if campaign_id is provided."""
+        """
+        With campaign_id, the campaign's top-level comments; with parent, the replies
+        to that comment. Each comes with its reply_count, threads load via `thread`.
+        """
         queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
         campaign_id = self.request.query_params.get('campaign_id')
-        return queryset.filter(campaign_id=campaign_id) if campaign_id else queryset
+        parent_id = self.request.query_params.get('parent')
+        if campaign_id:
+            queryset = queryset.filter(campaign_id=campaign_id, parent__isnull=True)
+        if parent_id:
+            queryset = queryset.filter(parent_id=parent_id)
+        return queryset
+
+    def perform_create(self, serializer):
+        with db_transaction.atomic():  # The comment and its counters commit together
+            serializer.save()
+
+    def feed_cache_namespace(self, request, **kwargs):
+        """Caches the first page of campaign feeds, the one every visitor loads."""
+        params = request.query_params
+        campaign_id = params.get('campaign_id', '')
+        if campaign_id.isdigit() and set(params) <= {'campaign_id', 'page_size', 'pagination'}:
+            return comment_feed_namespace(campaign_id)
+        return None
+
+    @conditional(comment_feed_validator)
+    @cache_response(feed_cache_namespace, shared=True)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(comment_validator)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=True, methods=['get'])
+    @conditional(comment_thread_validator)
+    def thread(self, request, pk=None):
+        """
+        The comment and all its replies at any depth in thread order (each reply right
+        after its parent, siblings oldest first), read as one range of the path index.
+        At most `thread_limit` comments are returned; `truncated` tells if there were more.
+        """
+        lowest, highest = self.get_object().subtree_range()
+        comments = list(
+            Comment.objects.select_related('user')
+            .filter(path__gte=lowest, path__lt=highest)
+            .order_by('path')[:self.thread_limit + 1]
+        )
+        serializer = self.get_serializer(comments[:self.thread_limit], many=True)
+        return Response({'truncated': len(comments) > self.thread_limit, 'results': serializer.data})
 
 
 # -------------------------
 # Transaction ViewSet
 # -------------------------
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(ReplicaReadMixin, SelectablePaginationMixin, CompactListMixin, viewsets.ModelViewSet):
     serializer_class = TransactionSerializer
+    compact_serializer_class = TransactionListSerializer
+    compact_actions = ('list', 'recent_transactions')
+    replica_actions = ('transaction_summary',)
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = (filters.OrderingFilter,)
     ordering_fields = ['created_at', 'amount']
 
     def get_queryset(self):
         """Limits transactions to the authenticated user."""
-        queryset = Transaction.objects.filter(user=self.request.user)
+        queryset = Transaction.objects.filter(user=self.request.user).order_by('-created_at', '-id')
+        return self.filter_by_date(queryset)
 
+    def filter_by_date(self, queryset):
+        """Applies the optional start_date/end_date (YYYY-MM-DD) query params."""
         # Optional filters by date
         start_date = self.request.query_params.get('start_date')
         end_date = self.request.query_params.get('end_date')
 
         if start_date:
             try:
-                start_date = datetime.strptime(start_date, '%Y-%m-%d')
+                start_date = timezone.make_aware(datetime.strptime(start_date, '%Y-%m-%d'))
                 queryset = queryset.filter(created_at__gte=start_date)
             except ValueError:
                 raise ValidationError("Invalid start_date format. Expected format: YYYY-MM-DD.")
         
         if end_date:
             try:
-                end_date = datetime.strptime(end_date, '%Y-%m-%d')
+                end_date = timezone.make_aware(datetime.strptime(end_date, '%Y-%m-%d'))
                 queryset = queryset.filter(created_at__lte=end_date)
             except ValueError:
                 raise ValidationError("Invalid end_date format. Expected format: YYYY-MM-DD.")
@@ -166,9 +435,54 @@ class TransactionViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(transactions, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<export_format>csv|ndjson)')
+    def export(self, request, export_format=None):
+        """
+        Streams transactions as CSV or NDJSON, honouring start_date/end_date.
+
+        Staff export every user's transactions, others only their own. Rows are read
+        in chunks from a server-side cursor, so memory stays flat whatever the row count.
+        """
+        queryset = Transaction.objects.all() if request.user.is_staff else Transaction.objects.filter(user=request.user)
+        rows = EXPORTERS[export_format](self.filter_by_date(queryset))
+        response = StreamingHttpResponse(rows, content_type=EXPORT_CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = f'attachment; filename="transactions.{export_format}"'
+        return response
+
     @action(detail=False, methods=['get'], url_path='summary')
     def transaction_summary(self, request):
-        """Returns a summary of the authenticated user's transactions."""
-        total_transactions = self.get_queryset().aggregate(Sum('amount'))
-        total_amount = total_transactions.get('amount__sum', 0) or 0
-        return Response({'total_transactions': total_amount})
+        """
+        Returns the authenticated user's transaction totals, overall and per type/status.
+
+        Lifetime totals come from the user's rollup rows; only a start_date/end_date
+        range falls back to aggregating the transactions themselves.
+        """
+        if request.query_params.get('start_date') or request.query_params.get('end_date'):
+            rows = self.get_queryset().values('transaction_type', 'status').annotate(
+                total_amount=Sum('amount'), count=Count('id'),
+            ).order_by()
+        else:
+            rows = UserTransactionStats.objects.filter(user=request.user).values(
+                'transaction_type', 'status', 'total_amount', 'count',
+            )
+        breakdown = sorted(rows, key=lambda row: (row['transaction_type'], row['status']))
+        total_amount = sum((row['total_amount'] for row in breakdown), 0)
+        return Response({'total_transactions': total_amount, 'breakdown': breakdown})
+
+
+# -------------------------
+# JWT token
+# -------------------------
+class TokenObtainView(TokenObtainPairView):
+    """simplejwt's token endpoint, rate limited by RATE_LIMITS['RULES']['token']."""
+    throttle_scope = 'token'
+
+
+# -------------------------
+# Response cache stats
+# -------------------------
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def cache_stats(request):
+    """Hit/miss counters of this worker's response cache."""
+    return Response(get_response_cache().stats())
@@ -0,0 +1,232 @@
+import hashlib
+import hmac
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .counters import record_donations
+from .models import Campaign, CustomUser, Donation, PaymentEvent, Transaction
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'HTTP_SIGNATURE'
+SUCCESS_STATUSES = {'success', 'successful', 'completed'}
+REQUEUE_STATUSES = ('pending', 'ignored')  # Not final: a later paid callback for the reference replaces them
+
+
+def verify_signature(body, signature):
+    """PayChangu signs the raw body with HMAC-SHA256 using the webhook secret."""
+    secret = settings.PAYCHANGU_WEBHOOK_SECRET
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def event_data(payload):
+    return payload.get('data') if isinstance(payload.get('data'), dict) else payload
+
+
+def event_reference(payload):
+    data = event_data(payload)
+    return str(data.get('tx_ref') or data.get('reference') or '')
+
+
+def is_paid(payload):
+    return str(event_data(payload).get('status', '')).lower() in SUCCESS_STATUSES
+
+
+# -------------------------
+# Webhook receiver
+# -------------------------
+@csrf_exempt
+@require_POST
+def paychangu_webhook(request):
+    """
+    Verifies and enqueues a PayChangu callback, then acknowledges it.
+
+    The only database work is one write to the PaymentEvent queue, keyed by the
+    reference. A paid callback replaces a stored one that is not final yet (still
+    pending, or ignored because it reported an unpaid status) and re-queues it;
+    any other redelivery is dropped by the unique constraint, so a settled payment
+    is never settled twice. Settlement happens in `process_payment_events`.
+    """
+    if not verify_signature(request.body, request.META.get(SIGNATURE_HEADER)):
+        return JsonResponse({'error': 'Invalid signature'}, status=401)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+
+    reference = event_reference(payload) if isinstance(payload, dict) else ''
+    if not reference:
+        return JsonResponse({'error': 'Missing tx_ref'}, status=400)
+
+    if is_paid(payload):
+        requeued = PaymentEvent.objects.filter(reference=reference, status__in=REQUEUE_STATUSES).update(
+            payload=payload, status='pending', error='', processed_at=None,
+        )
+        if requeued:
+            return JsonResponse({'status': 'accepted'}, status=202)
+    PaymentEvent.objects.bulk_create([PaymentEvent(reference=reference, payload=payload)], ignore_conflicts=True)
+    return JsonResponse({'status': 'accepted'}, status=202)
+
+
+# -------------------------
+# Batched settlement
+# -------------------------
+def _parse(event):
+    """Returns (user_id, campaign_id, amount) for a successful payment, or raises ValueError."""
+    payload = event_data(event.payload)
+    meta = payload.get('meta') or {}
+    if isinstance(meta, str):
+        meta = json.loads(meta)
+
+    try:
+        amount = Decimal(str(payload['amount']))
+        user_id, campaign_id = int(meta['user_id']), int(meta['campaign_id'])
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        raise ValueError("Payload is missing amount or meta.user_id/meta.campaign_id")
+    if amount <= 0:
+        raise ValueError("Amount must be positive")
+    return user_id, campaign_id, amount
+
+
+def _mark(event, status, error=''):
+    event.status = status
+    event.error = error
+    event.processed_at = timezone.now()
+
+
+def _mark_refund(event, reason):
+    _mark(event, 'refund', reason)
+    logger.error("Paid event %s needs a refund: %s", event.reference, reason)
+
+
+class SettlementError(Exception):
+    """A batch failed to settle and was rolled back; `event_ids` are the events it had claimed."""
+
+    def __init__(self, event_ids):
+        super().__init__(f"Settling payment events {event_ids} failed")
+        self.event_ids = event_ids
+
+
+def settle_batch(batch_size=500):
+    """
+    Settles up to `batch_size` pending events in one transaction.
+
+    Donations and transactions are inserted with bulk_create and each campaign's
+    total is incremented once per batch. Paid events that can't be credited (unknown
+    user or campaign, or a second donation to the same campaign) end up in 'refund'.
+    Returns the number of events processed, or raises SettlementError naming the
+    events of a batch that failed.
+    """
+    with transaction.atomic():
+        events = list(
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='pending')
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+        try:
+            _settle_events(events)
+        except Exception as e:
+            raise SettlementError([event.pk for event in events]) from e
+    return len(events)
+
+
+def _settle_events(events):
+    """Credits the claimed `events` and records their outcome; runs in settle_batch's transaction."""
+    settled_references = set(
+        Transaction.objects.filter(reference__in=[e.reference for e in events]).values_list('reference', flat=True)
+    )
+
+    parsed = {}
+    for event in events:
+        event.attempts += 1
+        if not is_paid(event.payload):
+            _mark(event, 'ignored', f"Payment status {event_data(event.payload).get('status')!r}")
+        elif event.reference in settled_references:
+            _mark(event, 'ignored', "Already settled")
+        else:
+            try:
+                parsed[event.pk] = _parse(event)
+            except ValueError as e:
+                _mark(event, 'failed', str(e))
+
+    user_ids = {user_id for user_id, _, _ in parsed.values()}
+    campaign_ids = {campaign_id for _, campaign_id, _ in parsed.values()}
+    known_users = set(CustomUser.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    known_campaigns = set(Campaign.objects.filter(pk__in=campaign_ids).values_list('pk', flat=True))
+    taken = set(
+        Donation.objects.filter(user_id__in=user_ids, campaign_id__in=campaign_ids).values_list('user_id', 'campaign_id')
+    )
+
+    donations, references = [], []
+    for event in events:
+        if event.pk not in parsed:
+            continue
+        user_id, campaign_id, amount = parsed[event.pk]
+        # The payer was charged but the payment can't become a donation: park it for a refund
+        if user_id not in known_users or campaign_id not in known_campaigns:
+            _mark_refund(event, "Unknown user or campaign")
+        elif (user_id, campaign_id) in taken:
+            _mark_refund(event, "User has already donated to this campaign")
+        else:
+            taken.add((user_id, campaign_id))
+            donations.append(Donation(user_id=user_id, campaign_id=campaign_id, amount=amount))
+            references.append(event.reference)
+            _mark(event, 'settled')
+
+    record_donations(donations, references)
+    PaymentEvent.objects.bulk_update(events, ['status', 'error', 'attempts', 'processed_at'])
+
+
+def _settle_individually(limit):
+    """
+    Fallback after a failed batch: settle events one by one and park the one that
+    still fails, for a refund if it was paid.
+    """
+    processed = 0
+    for _ in range(limit):
+        try:
+            count = settle_batch(1)
+        except SettlementError as e:
+            logger.exception("Payment event failed to settle")
+            event = PaymentEvent.objects.filter(pk__in=e.event_ids, status='pending').first()
+            if event is not None:
+                event.attempts += 1
+                error = str(e.__cause__)
+                if is_paid(event.payload):
+                    _mark_refund(event, error)
+                else:
+                    _mark(event, 'failed', error)
+                event.save(update_fields=['status', 'error', 'attempts', 'processed_at'])
+            count = 1
+        if not count:
+            break
+        processed += count
+    return processed
+
+
+def process_payment_events(batch_size=500, max_batches=None):
+    """Drains the queue batch by batch; returns the number of events processed."""
+    processed = batches = 0
+    while max_batches is None or batches < max_batches:
+        try:
+            count = settle_batch(batch_size)
+        except Exception:
+            logger.exception("Payment event batch failed, settling its events individually")
+            count = _settle_individually(batch_size)
+        processed += count
+        batches += 1
+        if count < batch_size:
+            break  # Queue drained
+    return processed
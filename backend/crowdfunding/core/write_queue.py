@@ -0,0 +1,118 @@
+"""
+Group commit for single-writer databases (SQLite).
+
+Concurrent writes of a worker process are queued; one of the waiting request
+threads (the leader) runs everything queued so far inside a single transaction,
+each write in its own savepoint, then hands leadership to the next waiter. Under
+concurrency N small write transactions (and N fsyncs and lock handoffs) become
+one, and the threads of a worker never compete for SQLite's write lock. Without
+concurrency a write simply runs in its own thread, as before.
+
+A queued write runs in the context of the request that submitted it (its
+contextvars, e.g. replica routing), and the on_commit hooks it registers run once
+the batch commits.
+"""
+import contextvars
+import logging
+import threading
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+class QueuedWrite:
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.context = contextvars.copy_context()  # Run by the leader, on behalf of the submitting request
+        self.done = threading.Event()
+        self.promoted = False  # Woken up to lead the next batch rather than with a result
+        self.result = None
+        self.error = None
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class WriteQueue:
+    def __init__(self, max_batch=200):
+        self.max_batch = max_batch
+        self.pending = []
+        self.leading = False
+        self.lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Runs `func` in the next batch transaction and returns its result or raises its exception."""
+        if transaction.get_connection().in_atomic_block:
+            return func(*args, **kwargs)  # The caller's transaction must include this write
+
+        write = QueuedWrite(func, args, kwargs)
+        with self.lock:
+            self.pending.append(write)
+            lead = not self.leading
+            self.leading = True
+        if not lead:
+            write.done.wait()
+            if not write.promoted:
+                return write.outcome()
+
+        # Leading: the queue starts with our own write
+        with self.lock:
+            batch = self.pending[:self.max_batch]
+            del self.pending[:self.max_batch]
+        try:
+            self._commit(batch)
+        finally:
+            with self.lock:
+                if self.pending:
+                    successor = self.pending[0]
+                    successor.promoted = True
+                    successor.done.set()
+                else:
+                    self.leading = False
+        return write.outcome()
+
+    def _commit(self, batch):
+        committed = []
+        try:
+            with transaction.atomic():
+                transaction.on_commit(lambda: committed.append(True))  # Runs before the writes' own hooks
+                for write in batch:
+                    try:
+                        with transaction.atomic():  # A failing write only rolls back its savepoint
+                            write.result = write.context.run(write.func, *write.args, **write.kwargs)
+                    except Exception as e:
+                        write.error = e
+        except Exception as e:
+            if committed:
+                # An on_commit hook failed after the batch was written; the writes stand
+                logger.exception("on_commit hook of a queued write failed")
+            else:
+                # The commit itself failed, nothing in the batch was written
+                for write in batch:
+                    write.error = e
+        finally:
+            for write in batch:
+                write.promoted = False
+                write.done.set()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_write_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WriteQueue()
+    return _queue
+
+
+def write_queue_enabled():
+    return getattr(settings, 'DATABASE_WRITE_QUEUE', False)
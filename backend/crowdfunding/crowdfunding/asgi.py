@@ -3,6 +3,11 @@ ASGI config for crowdfunding project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. `uvicorn crowdfunding.asgi:application`) so
+async views such as core.async_views.initiate_payment wait on the payment
+gateway without holding a worker, and so campaign progress can be streamed
+(SSE at /api/v1/campaigns/<id>/events/, WebSocket at /ws/campaigns/<id>/).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -13,4 +18,12 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crowdfunding.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from core.streams import websocket_application  # noqa: E402  Needs the app registry set up above
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
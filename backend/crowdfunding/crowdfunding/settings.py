@@ -1,6 +1,9 @@
 from pathlib import Path
 from datetime import timedelta
+import importlib.util
 import os
+from corsheaders.defaults import default_headers
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv  # Import dotenv to load environment variables
 
 # Load environment variables from .env file
@@ -34,17 +37,31 @@ INSTALLED_APPS = [
 
 AUTH_USER_MODEL = 'core.CustomUser'
 
+# orjson-backed JSON rendering and parsing (core.fastjson); needs `pip install orjson`
+FAST_JSON = os.getenv("FAST_JSON", "True") == "True" and importlib.util.find_spec("orjson") is not None
+
 REST_FRAMEWORK = {
+    # JWT first, so token-authenticated requests never load a session
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',  # Enables token-based auth
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,  # Limits the number of items per page for better performance
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.fastjson.ORJSONRenderer' if FAST_JSON else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.fastjson.ORJSONParser' if FAST_JSON else 'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    'DEFAULT_THROTTLE_CLASSES': ('core.throttling.TokenBucketThrottle',),  # Rules in RATE_LIMITS
+    'NUM_PROXIES': int(os.getenv("NUM_PROXIES")) if os.getenv("NUM_PROXIES") else None,  # For client IPs
 }
 
 SIMPLE_JWT = {
@@ -56,7 +73,9 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
-    'corsheaders.middleware.CorsMiddleware',
+    'corsheaders.middleware.CorsMiddleware',  # First, so shed (503) responses still carry CORS headers
+    'core.metrics.MetricsMiddleware',
+    'core.throttling.AdmissionControlMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +93,10 @@ CORS_ALLOWED_ORIGINS = [
     "https://yourfrontend.com"
 ]
 
+# Browser clients may send Idempotency-Key and read whether a response was replayed
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
+CORS_EXPOSE_HEADERS = ["Idempotent-Replayed", "Retry-After"]
+
 ROOT_URLCONF = 'crowdfunding.urls'
 
 TEMPLATES = [
@@ -95,17 +118,205 @@ TEMPLATES = [
 WSGI_APPLICATION = 'crowdfunding.wsgi.application'
 
 # Database configuration using the DATABASE_URL environment variable
+# (falls back to DATABASE_ENGINE/DATABASE_NAME, SQLite by default)
 import dj_database_url
 
 
 DATABASE_ENGINE = os.getenv("DATABASE_ENGINE", "django.db.backends.sqlite3")
 DATABASE_NAME = os.getenv("DATABASE_NAME", BASE_DIR / "db.sqlite3")
 
+# Persistent connections: seconds to keep a connection open (0 closes it after each
+# request, None keeps it forever), checked before reuse. DATABASE_POOL uses the
+# psycopg connection pool instead (PostgreSQL only, replaces CONN_MAX_AGE).
+DATABASE_CONN_MAX_AGE = int(os.getenv("DATABASE_CONN_MAX_AGE", "60"))
+DATABASE_POOL = os.getenv("DATABASE_POOL", "False") == "True"
+DATABASE_POOL_MIN_SIZE = int(os.getenv("DATABASE_POOL_MIN_SIZE", "2"))
+DATABASE_POOL_MAX_SIZE = int(os.getenv("DATABASE_POOL_MAX_SIZE", "10"))
+
+# SQLite production mode: WAL journal, synchronous=NORMAL, memory-mapped reads, a busy
+# timeout (seconds) and BEGIN IMMEDIATE transactions, so writers queue for the lock
+# instead of failing with "database is locked" on lock upgrade.
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "False") == "True"
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "20"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Commit concurrent donation writes of one worker process together in a single
+# transaction (core/write_queue.py); on by default with SQLITE_TUNING
+DATABASE_WRITE_QUEUE = os.getenv("DATABASE_WRITE_QUEUE", str(SQLITE_TUNING)) == "True"
+
+
+def database_config(url=None):
+    if url:
+        config = dj_database_url.parse(url, conn_max_age=DATABASE_CONN_MAX_AGE, conn_health_checks=True)
+    else:
+        config = {
+            'ENGINE': DATABASE_ENGINE,
+            'NAME': DATABASE_NAME,
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    if SQLITE_TUNING and config['ENGINE'] == 'django.db.backends.sqlite3':
+        config.setdefault('OPTIONS', {}).update({
+            'init_command': (
+                "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; "
+                f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}; PRAGMA cache_size=-20000;"
+            ),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_BUSY_TIMEOUT,
+        })
+    if DATABASE_POOL and config['ENGINE'] == 'django.db.backends.postgresql':
+        config['CONN_MAX_AGE'] = 0
+        config.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DATABASE_POOL_MIN_SIZE,
+            'max_size': DATABASE_POOL_MAX_SIZE,
+        }
+    return config
+
+
 DATABASES = {
-    'default': {
-        'ENGINE': DATABASE_ENGINE,
-        'NAME': DATABASE_NAME,
-    }
+    'default': database_config(DATABASE_URL),
+}
+
+# Read replicas (comma-separated URLs) serve read-only actions, see core/db_router.py.
+# After a write a user reads from the primary for REPLICA_STICKY_SECONDS; a replica
+# that can't be reached is skipped for REPLICA_RETRY_SECONDS.
+for index, url in enumerate(filter(None, os.getenv("DATABASE_REPLICA_URLS", "").split(','))):
+    DATABASES[f'replica_{index}'] = {**database_config(url.strip()), 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_RETRY_SECONDS = int(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+
+# Donation ledger: spread raised_amount increments over N rows per campaign (1 = no sharding)
+CAMPAIGN_COUNTER_SHARDS = int(os.getenv("CAMPAIGN_COUNTER_SHARDS", "1"))
+
+# Largest list accepted by POST /api/v1/donations/batch/ (one transaction per batch)
+DONATION_BATCH_MAX_ITEMS = int(os.getenv("DONATION_BATCH_MAX_ITEMS", "1000"))
+
+# Response cache for campaign reads ('locmem' per worker, or 'redis' shared across workers). A 'locmem'
+# cache only sees invalidations from its own process; CONDITIONAL_GET keys its entries on database
+# validators, so without it 'locmem' needs an in-process BACKGROUND_TASKS executor (checked below).
+RESPONSE_CACHE = {
+    'ENABLED': os.getenv("RESPONSE_CACHE_ENABLED", "True") == "True",
+    'BACKEND': os.getenv("RESPONSE_CACHE_BACKEND", "locmem"),
+    'LOCATION': os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0"),
+    'TTL': int(os.getenv("RESPONSE_CACHE_TTL", "60")),
+    'MAX_ENTRIES': int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+}
+
+# Users resolved from JWTs are cached for TTL seconds ('locmem' per worker, or 'redis' shared)
+USER_CACHE = {
+    'ENABLED': os.getenv("USER_CACHE_ENABLED", "True") == "True",
+    'BACKEND': os.getenv("USER_CACHE_BACKEND", "locmem"),
+    'LOCATION': os.getenv("USER_CACHE_URL", "redis://localhost:6379/0"),
+    'TTL': int(os.getenv("USER_CACHE_TTL", "30")),
+    'MAX_ENTRIES': int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000")),
+}
+
+# Campaign search index: 'auto' (FTS5 on SQLite, tsvector on Postgres, icontains otherwise),
+# 'icontains' or 'python' (an in-process index per worker, for development only).
+# `manage.py rebuild_search_index` rebuilds it after bulk writes.
+CAMPAIGN_SEARCH_BACKEND = os.getenv("CAMPAIGN_SEARCH_BACKEND", "auto")
+if CAMPAIGN_SEARCH_BACKEND == 'python' and not DEBUG:
+    # Each process would keep its own index and miss writes made by the others
+    raise ImproperlyConfigured("CAMPAIGN_SEARCH_BACKEND=python is for single-process development (DEBUG=True)")
+
+# Conditional GET (ETag/Last-Modified, 304) on campaign, comment and summary reads. Shared caches
+# (CDN, reverse proxy) may serve public responses for SHARED_MAX_AGE seconds, then revalidate.
+CONDITIONAL_GET = {
+    'ENABLED': os.getenv("CONDITIONAL_GET_ENABLED", "True") == "True",
+    'MAX_AGE': int(os.getenv("CONDITIONAL_GET_MAX_AGE", "0")),
+    'SHARED_MAX_AGE': int(os.getenv("CONDITIONAL_GET_SHARED_MAX_AGE", "5")),
+    'STALE_WHILE_REVALIDATE': int(os.getenv("CONDITIONAL_GET_STALE_WHILE_REVALIDATE", "30")),
+}
+
+# Background tasks for deferred side effects: 'database' (needs `manage.py run_tasks`),
+# 'thread' (in-process pool, for development) or 'immediate' (inline after commit)
+BACKGROUND_TASKS = {
+    'EXECUTOR': os.getenv("BACKGROUND_TASKS_EXECUTOR", "thread" if DEBUG else "database"),
+    'MAX_ATTEMPTS': int(os.getenv("BACKGROUND_TASKS_MAX_ATTEMPTS", "5")),
+    'RETRY_BACKOFF': 2,
+    'LEASE_SECONDS': 300,
+}
+
+if (RESPONSE_CACHE['ENABLED'] and RESPONSE_CACHE['BACKEND'] == 'locmem' and not CONDITIONAL_GET['ENABLED']
+        and BACKGROUND_TASKS['EXECUTOR'] not in ('immediate', 'thread')):
+    # Writes made by `run_tasks` would never reach the web workers' caches
+    raise ImproperlyConfigured(
+        "RESPONSE_CACHE_BACKEND=locmem without CONDITIONAL_GET needs BACKGROUND_TASKS_EXECUTOR=immediate "
+        "or thread; use the redis backend with the database executor"
+    )
+
+# Live campaign progress (SSE at /api/v1/campaigns/<id>/events/, WebSocket at /ws/campaigns/<id>/,
+# served by crowdfunding.asgi), at most MAX_UPDATES_PER_SECOND per campaign. The 'local' broker only
+# reaches watchers in the writing process; use 'redis' with several workers or with `run_tasks`.
+CAMPAIGN_STREAMS = {
+    'ENABLED': os.getenv("CAMPAIGN_STREAMS_ENABLED", "True") == "True",
+    'BROKER': os.getenv("CAMPAIGN_STREAMS_BROKER", "local"),
+    'LOCATION': os.getenv("CAMPAIGN_STREAMS_URL", "redis://localhost:6379/0"),
+    'MAX_UPDATES_PER_SECOND': float(os.getenv("CAMPAIGN_STREAMS_MAX_UPDATES_PER_SECOND", "2")),
+    'HEARTBEAT_SECONDS': 15,
+    'QUEUE_SIZE': 100,
+}
+
+# Campaign leaderboards (/api/v1/campaigns/trending/, most-funded/, closest-to-goal/ and
+# <id>/top-donors/), updated as donations settle. 'locmem' boards are per process and rebuilt from
+# the database every REBUILD_SECONDS to pick up other processes' writes; 'redis' shares one set.
+LEADERBOARDS = {
+    'ENABLED': os.getenv("LEADERBOARDS_ENABLED", "True") == "True",
+    'BACKEND': os.getenv("LEADERBOARDS_BACKEND", "locmem"),
+    'LOCATION': os.getenv("LEADERBOARDS_URL", "redis://localhost:6379/0"),
+    'KEY_PREFIX': 'cf-board',
+    'REBUILD_SECONDS': int(os.getenv("LEADERBOARDS_REBUILD_SECONDS", "300")),
+    'TRENDING_HALF_LIFE_HOURS': float(os.getenv("LEADERBOARDS_TRENDING_HALF_LIFE_HOURS", "24")),
+}
+
+# Token-bucket rate limits (core/throttling.py). RULES maps a viewset action ('<basename>.<action>')
+# or a view's throttle_scope to limits per 'user', 'ip' and 'campaign': '10/min' allows bursts of 10
+# refilled at 10 a minute. 'locmem' buckets are per process; 'redis' shares them between workers.
+RATE_LIMITS = {
+    'ENABLED': os.getenv("RATE_LIMITS_ENABLED", "True") == "True",
+    'BACKEND': os.getenv("RATE_LIMITS_BACKEND", "locmem"),
+    'LOCATION': os.getenv("RATE_LIMITS_URL", "redis://localhost:6379/0"),
+    'KEY_PREFIX': 'cf-rate',
+    'RULES': {
+        'campaign.initiate_payment': {'user': '5/min', 'ip': '20/min', 'campaign': '120/min'},
+        'donation.create': {'user': '10/min', 'ip': '60/min', 'campaign': '600/min'},
+        'donation.batch_create': {'user': '20/hour', 'ip': '60/hour'},
+        'comment.create': {'user': '10/min', 'ip': '60/min'},
+        'token': {'ip': '10/min'},
+    },
+}
+
+# Idempotency-Key support for donation and payment POSTs (core/idempotency.py): outcomes are kept
+# TTL_SECONDS for replay; an in-flight claim older than IN_FLIGHT_SECONDS is considered abandoned.
+IDEMPOTENCY = {
+    'ENABLED': os.getenv("IDEMPOTENCY_ENABLED", "True") == "True",
+    'TTL_SECONDS': int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")),
+    'IN_FLIGHT_SECONDS': 60,
+    'PURGE_PROBABILITY': 0.01,  # Share of new keys that also sweep expired ones
+}
+
+# Requests one process works on at once (0 = unlimited); the rest wait QUEUE_SECONDS for a
+# slot, then get 503 with Retry-After (core.throttling.AdmissionControlMiddleware)
+ADMISSION_CONTROL = {
+    'MAX_CONCURRENT_REQUESTS': int(os.getenv("MAX_CONCURRENT_REQUESTS", "64")),
+    'QUEUE_SECONDS': float(os.getenv("ADMISSION_QUEUE_SECONDS", "0.1")),
+    'RETRY_AFTER_SECONDS': 1,
+    'EXEMPT_PATHS': ['/metrics'],
+}
+
+# Request metrics served at /metrics; scrapers send METRICS_TOKEN as a bearer token
+# (without one only INTERNAL_IPS may scrape). Requests slower than SLOW_REQUEST_MS
+# are logged with their slowest SQL, for a SLOW_REQUEST_SAMPLE_RATE fraction of requests.
+# Multi-process servers: point METRICS_MULTIPROCESS_DIR at a directory shared by the workers.
+METRICS = {
+    'ENABLED': os.getenv("METRICS_ENABLED", "True") == "True",
+    'TOKEN': os.getenv("METRICS_TOKEN"),
+    'SLOW_REQUEST_MS': int(os.getenv("METRICS_SLOW_REQUEST_MS", "500")),
+    'SLOW_REQUEST_SAMPLE_RATE': float(os.getenv("METRICS_SLOW_REQUEST_SAMPLE_RATE", "0.1")),
+    'MULTIPROCESS_DIR': os.getenv("METRICS_MULTIPROCESS_DIR"),
+    'FLUSH_INTERVAL': 10,
 }
 
 # Password validation
@@ -142,6 +353,24 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded images, stored once per content hash (core/storage.py) with thumbnails rendered
+# after upload in THUMBNAIL_PROCESSES worker processes (core/media.py; 0 renders inline).
+# BACKEND is 'local' (MEDIA_ROOT) or the dotted path of a callable returning a Django Storage.
+MEDIA_URL = os.getenv("MEDIA_URL", "media/")
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", BASE_DIR / "media")
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024  # Larger uploads are streamed to a temporary file
+MEDIA_PIPELINE = {
+    'BACKEND': os.getenv("MEDIA_BACKEND", "local"),
+    'MAX_UPLOAD_BYTES': int(os.getenv("MEDIA_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024))),
+    'THUMBNAIL_FORMAT': os.getenv("MEDIA_THUMBNAIL_FORMAT", "WEBP"),  # Or 'JPEG'
+    'THUMBNAIL_QUALITY': 80,
+    'THUMBNAIL_PROCESSES': int(os.getenv("MEDIA_THUMBNAIL_PROCESSES", "2")),
+    'THUMBNAILS': {
+        'profile_picture': {'small': (48, 48), 'medium': (160, 160)},
+        'cover_image': {'card': (480, 270), 'banner': (1200, 675)},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -156,15 +385,25 @@ PAYCHANGU_SECRET_KEY = os.getenv("PAYCHANGU_SECRET_KEY")
 PAYCHANGU_WEBHOOK_SECRET = os.getenv("PAYCHANGU_WEBHOOK_SECRET")
 PAYCHANGU_BASE_URL = os.getenv("PAYCHANGU_BASE_URL")
 
+# PayChangu client: pooled connections, timeouts (seconds), retries and circuit breaker
+PAYCHANGU_TIMEOUT = float(os.getenv("PAYCHANGU_TIMEOUT", "10"))
+PAYCHANGU_CONNECT_TIMEOUT = float(os.getenv("PAYCHANGU_CONNECT_TIMEOUT", "3"))
+PAYCHANGU_MAX_CONNECTIONS = int(os.getenv("PAYCHANGU_MAX_CONNECTIONS", "20"))
+PAYCHANGU_MAX_CONCURRENCY = int(os.getenv("PAYCHANGU_MAX_CONCURRENCY", "20"))
+PAYCHANGU_MAX_RETRIES = int(os.getenv("PAYCHANGU_MAX_RETRIES", "2"))
+PAYCHANGU_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("PAYCHANGU_CIRCUIT_FAILURE_THRESHOLD", "5"))
+PAYCHANGU_CIRCUIT_RESET_TIMEOUT = float(os.getenv("PAYCHANGU_CIRCUIT_RESET_TIMEOUT", "30"))
+
 # Stripe Credentials
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
 
-# Debug toolbar configuration for local dev
-INSTALLED_APPS += ["debug_toolbar"]
-
-MIDDLEWARE.insert(0, "debug_toolbar.middleware.DebugToolbarMiddleware")
-
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
+
+# Debug toolbar configuration for local dev only
+if DEBUG:
+    INSTALLED_APPS += ["debug_toolbar"]
+
+    MIDDLEWARE.insert(0, "debug_toolbar.middleware.DebugToolbarMiddleware")
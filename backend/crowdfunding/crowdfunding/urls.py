@@ -14,10 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from core.metrics import metrics_view
 
 # API Home View
 @api_view(["GET"])
@@ -34,4 +37,8 @@ urlpatterns = [
     path("", api_home, name="api-home"),  # API Home
     path("admin/", admin.site.urls),
     path("api/v1/", include("core.urls")),  # Include core app URLs under api/v1
+    path("metrics", metrics_view, name="metrics"),  # Prometheus scrape endpoint
 ]
+
+# Uploaded media in development; in production the web server or CDN serves MEDIA_ROOT
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)